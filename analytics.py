@@ -0,0 +1,191 @@
+"""Analitik penjualan per tenant di atas kolom array NumPy.
+
+Setiap tenant punya satu `SalesColumns`: satu array per kolom (hari, detik, item, jumlah, harga, modal),
+satu elemen per baris penjualan. Laporan dihitung dengan group-by tervektorisasi (`np.bincount` atas
+kode item / jam / hari dalam minggu) pada rentang tanggal yang dipilih, jadi tetap cepat walau tenant
+punya jutaan baris. Kolom dibangun sekali dari storage saat laporan pertama diminta, lalu penjualan baru
+ditambahkan lewat listener storage seperti RollupIndex; perubahan/penghapusan penjualan (termasuk pesanan
+yang dibatalkan) membuat kolom tenant itu dibangun ulang.
+"""
+import re
+import html
+from datetime import date, timedelta
+
+import numpy as np
+
+from orders import order_lines, sales_rows
+
+HARI = ("Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min")
+# Nilai kolom jika penjualan lama tidak punya jam (`waktu`) atau modal.
+UNKNOWN = -1
+FIELDS = (("hari", np.int32), ("detik", np.int32), ("item", np.int32), ("jumlah", np.int32), ("harga", np.int64), ("modal", np.int64))
+
+
+class SalesColumns:
+    """Penjualan satu tenant dalam bentuk kolom; `hari` = date.toordinal(), `item` = kode nama menu."""
+
+    def __init__(self, capacity=1024):
+        self.size, self.names, self._codes = 0, [], {}
+        self._cols = {name: np.empty(capacity, dtype) for name, dtype in FIELDS}
+        self._days, self._times = {}, {}
+
+    def __getattr__(self, name):
+        cols = self.__dict__.get('_cols')
+        if cols is None or name not in cols: raise AttributeError(name)
+        return cols[name][:self.size]
+
+    def _day(self, tanggal):
+        day = self._days.get(tanggal)
+        if day is None: day = self._days[tanggal] = date.fromisoformat(tanggal[:10]).toordinal()
+        return day
+
+    def _seconds(self, waktu):
+        if not waktu: return UNKNOWN
+        seconds = self._times.get(waktu)
+        if seconds is None:
+            parts = [int(p) for p in waktu.split(":")[:3]]; seconds = self._times[waktu] = parts[0] * 3600 + (parts[1] if len(parts) > 1 else 0) * 60 + (parts[2] if len(parts) > 2 else 0)
+        return seconds
+
+    def _code(self, nama):
+        code = self._codes.get(nama)
+        if code is None: code = self._codes[nama] = len(self.names); self.names.append(nama)
+        return code
+
+    def append(self, rows):
+        rows = [r for r in rows if r.get('tanggal')]
+        if not rows: return
+        end = self.size + len(rows); capacity = len(self._cols["hari"])
+        if end > capacity:
+            capacity = max(end, capacity * 2)
+            for name, col in self._cols.items(): grown = np.empty(capacity, col.dtype); grown[:self.size] = col[:self.size]; self._cols[name] = grown
+        values = {
+            "hari": [self._day(r['tanggal']) for r in rows], "detik": [self._seconds(r.get('waktu')) for r in rows],
+            "item": [self._code(r.get('nama') or '-') for r in rows], "jumlah": [r.get('jumlah') or 0 for r in rows],
+            "harga": [r.get('harga') or 0 for r in rows], "modal": [UNKNOWN if r.get('modal') is None else r['modal'] for r in rows],
+        }
+        for name, column in values.items(): self._cols[name][self.size:end] = column
+        self.size = end
+
+    # --- LAPORAN (semua menerima rentang tanggal inklusif) ---
+    def _mask(self, start, end):
+        hari = self.hari; return (hari >= start.toordinal()) & (hari <= end.toordinal())
+
+    def summary(self, start, end):
+        mask = self._mask(start, end); jumlah = self.jumlah[mask]
+        return {'baris': int(mask.sum()), 'porsi': int(jumlah.sum()), 'omzet': int((self.harga[mask] * jumlah).sum())}
+
+    def top_items(self, start, end, n=10):
+        """(nama, porsi, omzet) untuk `n` menu dengan omzet terbesar."""
+        mask = self._mask(start, end); item, jumlah = self.item[mask], self.jumlah[mask]
+        porsi = np.bincount(item, weights=jumlah, minlength=len(self.names)); omzet = np.bincount(item, weights=self.harga[mask] * jumlah, minlength=len(self.names))
+        order = np.argsort(-omzet, kind="stable")[:n]
+        return [(self.names[i], int(porsi[i]), int(omzet[i])) for i in order if porsi[i] > 0]
+
+    def hourly_heatmap(self, start, end):
+        """Matriks 7x24 (Senin..Minggu x jam) omzet, plus jumlah baris tanpa jam yang tidak ikut dihitung."""
+        mask = self._mask(start, end); timed = mask & (self.detik >= 0)
+        cell = (self.hari[timed] - 1) % 7 * 24 + self.detik[timed] // 3600
+        matrix = np.bincount(cell, weights=self.harga[timed] * self.jumlah[timed], minlength=168).reshape(7, 24)
+        return matrix, int(mask.sum() - timed.sum())
+
+    def weekday_trend(self, start, end):
+        """Per hari dalam minggu: (omzet total, jumlah hari itu dalam rentang, rata-rata omzet per hari)."""
+        mask = self._mask(start, end)
+        omzet = np.bincount((self.hari[mask] - 1) % 7, weights=self.harga[mask] * self.jumlah[mask], minlength=7)
+        days = np.bincount((np.arange(start.toordinal(), end.toordinal() + 1) - 1) % 7, minlength=7)
+        return [(int(omzet[d]), int(days[d]), int(omzet[d] // days[d]) if days[d] else 0) for d in range(7)]
+
+    def margin(self, start, end):
+        """(nama, porsi, omzet, laba, persen) per menu untuk penjualan yang modalnya tercatat, urut laba terbesar,
+        plus omzet penjualan tanpa modal (tidak bisa dihitung labanya)."""
+        mask = self._mask(start, end); known = mask & (self.modal >= 0)
+        item, jumlah = self.item[known], self.jumlah[known]
+        porsi = np.bincount(item, weights=jumlah, minlength=len(self.names))
+        omzet = np.bincount(item, weights=self.harga[known] * jumlah, minlength=len(self.names))
+        laba = omzet - np.bincount(item, weights=self.modal[known] * jumlah, minlength=len(self.names))
+        rows = [(self.names[i], int(porsi[i]), int(omzet[i]), int(laba[i]), laba[i] / omzet[i] * 100 if omzet[i] else 0.0) for i in np.argsort(-laba, kind="stable") if porsi[i] > 0]
+        unknown = mask & (self.modal < 0)
+        return rows, int((self.harga[unknown] * self.jumlah[unknown]).sum())
+
+
+class SalesAnalytics:
+    """Kolom penjualan per tenant, dibangun saat pertama diminta dan diperbarui lewat listener storage."""
+
+    def __init__(self, db):
+        self.db, self._tenants = db, {}
+        db.add_listener(self.on_write)
+
+    def get(self, tenant):
+        columns = self._tenants.get(tenant)
+        if columns is None:
+            rows = sales_rows(self.db, tenant); columns = SalesColumns(max(1024, len(rows))); columns.append(rows); self._tenants[tenant] = columns
+        return columns
+
+    def on_write(self, tenant, collection, op, payload):
+        if op == 'evict': self._tenants.pop(tenant, None); return
+        if collection not in ('penjualan', 'pesanan') or tenant not in self._tenants: return
+        if op == 'insert': self._tenants[tenant].append(payload if collection == 'penjualan' else [l for o in payload if not o.get('batal') for l in order_lines(o)])
+        else: self._tenants.pop(tenant, None)
+
+
+# --- PERIODE ---
+def parse_period(text, today=None):
+    """'30' (N hari terakhir), 'YYYY-MM' (satu bulan) atau 'YYYY-MM-DD YYYY-MM-DD' -> (awal, akhir); None jika tidak valid."""
+    today, text = today or date.today(), text.strip()
+    try:
+        if re.fullmatch(r"\d{1,4}", text) and int(text) > 0: return today - timedelta(days=int(text) - 1), today
+        if re.fullmatch(r"\d{4}-\d{2}", text):
+            start = date.fromisoformat(text + "-01"); return start, (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        match = re.fullmatch(r"(\d{4}-\d{2}-\d{2})\s*(?:s/d|-|sampai|\s)\s*(\d{4}-\d{2}-\d{2})", text)
+        if match:
+            start, end = date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))
+            return (start, end) if start <= end else None
+    except ValueError: return None
+    return None
+
+
+# --- FORMAT PESAN (HTML: nama menu bisa mengandung karakter Markdown) ---
+def _header(title, start, end, summary):
+    return f"<b>{title}</b>\n{start.isoformat()} s/d {end.isoformat()} · {summary['porsi']:,} porsi · Rp {summary['omzet']:,}\n"
+
+
+def format_top_items(columns, start, end, n=10):
+    lines = [_header("🏆 Menu Terlaris", start, end, columns.summary(start, end))]
+    rows = columns.top_items(start, end, n)
+    if not rows: return lines[0] + "\nBelum ada penjualan pada periode ini."
+    lines += [f"{rank}. {html.escape(nama)} — {porsi:,} porsi, Rp {omzet:,}" for rank, (nama, porsi, omzet) in enumerate(rows, 1)]
+    return "\n".join(lines)
+
+
+def format_heatmap(columns, start, end):
+    header = _header("🕐 Jam Ramai (omzet)", start, end, columns.summary(start, end))
+    matrix, untimed = columns.hourly_heatmap(start, end)
+    active = np.nonzero(matrix.sum(axis=0))[0]
+    if not len(active): return header + "\nBelum ada penjualan berjam pada periode ini." + (f"\n{untimed:,} baris lama tanpa jam tidak dihitung." if untimed else "")
+    hours, peak, shades = range(active[0], active[-1] + 1), matrix.max(), " ░▒▓█"
+    grid = ["    " + "".join(f"{h:02d}" if h % 3 == 0 else "  " for h in hours).rstrip()]
+    grid += [f"{HARI[d]} " + "".join(shades[min(4, int(np.ceil(matrix[d, h] / peak * 4)))] * 2 for h in hours) for d in range(7)]
+    busiest = sorted(((matrix[d, h], d, h) for d in range(7) for h in hours if matrix[d, h] > 0), reverse=True)[:3]
+    lines = [header, "<pre>" + "\n".join(grid) + "</pre>", "Tersibuk: " + ", ".join(f"{HARI[d]} {h:02d}:00 (Rp {int(v):,})" for v, d, h in busiest)]
+    if untimed: lines.append(f"{untimed:,} baris lama tanpa jam tidak dihitung.")
+    return "\n".join(lines)
+
+
+def format_weekday_trend(columns, start, end):
+    rows = columns.weekday_trend(start, end); best = max(r[2] for r in rows) or 1
+    lines = [_header("📅 Tren Hari", start, end, columns.summary(start, end)), "<pre>"]
+    lines += [f"{HARI[d]} {'█' * round(avg / best * 12):<12} Rp {avg:>10,}/hari ({days}x)" for d, (total, days, avg) in enumerate(rows)]
+    return "\n".join(lines) + "</pre>"
+
+
+def format_margin(columns, start, end, n=15):
+    rows, unknown = columns.margin(start, end)
+    lines = [_header("💹 Margin per Menu", start, end, columns.summary(start, end))]
+    if rows:
+        omzet, laba = sum(r[2] for r in rows), sum(r[3] for r in rows)
+        lines += [f"{html.escape(nama)} — laba Rp {l:,} ({p:.0f}%) dari Rp {o:,}, {porsi:,} porsi" for nama, porsi, o, l, p in rows[:n]]
+        if len(rows) > n: lines.append(f"... {len(rows) - n} menu lainnya")
+        lines.append(f"\nTotal laba kotor: Rp {laba:,} ({laba / omzet * 100 if omzet else 0:.0f}% dari Rp {omzet:,})")
+    else: lines.append("Belum ada penjualan dengan modal tercatat pada periode ini.")
+    if unknown: lines.append(f"Omzet Rp {unknown:,} tanpa data modal tidak dihitung (isi modal lewat Kelola Menu > Edit Menu).")
+    return "\n".join(lines)
@@ -0,0 +1,34 @@
+"""Arsipkan bulan yang sudah tutup dari data_*.json ke segmen gzip (backend JSON).
+
+Bot juga menjalankan ini otomatis (lihat ARCHIVE_KEEP_MONTHS); skrip ini untuk menjalankannya manual
+saat bot mati, misalnya pertama kali pada data lama yang sudah besar.
+
+Pemakaian:
+    python archive_sales.py [--data-dir .] [--keep-months 3] [--tenant NAMA]
+"""
+import argparse
+
+from storage import ArchiveError, JsonBackend, collection_totals
+
+
+def archive(data_dir=".", keep_months=3, tenants=None):
+    db = JsonBackend(data_dir, flush_interval=0)
+    try:
+        for tenant in tenants or sorted(db.get_users()):
+            try: moved = db.archive_closed_months(tenant, keep_months)
+            except ArchiveError as e: print(f"- {tenant}: GAGAL, data tidak diubah ({e})"); continue
+            if not moved: print(f"- {tenant}: tidak ada bulan yang perlu diarsip"); continue
+            for collection, months in moved.items():
+                total = collection_totals(db.list_rows(tenant, collection), collection)
+                print(f"- {tenant}/{collection}: {len(months)} bulan diarsip ({months[0]} s/d {months[-1]}), total {sum(t[0] for t in total.values()):,} baris terverifikasi")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arsipkan penjualan & pengeluaran bulan lama ke segmen per bulan.")
+    parser.add_argument("--data-dir", default=".", help="Folder berisi users.json dan data_*.json")
+    parser.add_argument("--keep-months", type=int, default=3, help="Jumlah bulan terakhir (termasuk bulan ini) yang tetap di file tenant")
+    parser.add_argument("--tenant", action="append", help="Hanya tenant ini (boleh diulang); default semua pengguna")
+    args = parser.parse_args()
+    archive(args.data_dir, args.keep_months, args.tenant)
@@ -0,0 +1,457 @@
+"""Benchmark handler bot kasir dengan tenant sintetis, tanpa jaringan.
+
+Handler asli di main.py dipanggil lewat Update/Context palsu dan bot tiruan. Untuk setiap
+operasi dicatat persentil latensi, byte yang dibaca/ditulis proses, dan puncak memori; hasilnya
+disimpan sebagai JSON di folder `bench_results/` supaya bisa dibandingkan antar-run.
+
+Dengan `--webhook-workers`, bench menjalankan main.py dalam mode webhook (proses terpisah) melawan
+server Bot API tiruan, memutar ulang rekaman update (sintetis atau `--replay`) dan mengukur
+throughput untuk tiap jumlah worker.
+
+Contoh:
+    python bench.py --sales 10000,100000 --menu 100 --iterations 50 --backend sqlite
+    python bench.py --webhook-workers 1,2,4 --tenants 16 --orders-per-cashier 10
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import socket
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from collections import deque
+
+from orders import build_order, sales_rows
+
+try: import psutil
+except ImportError: psutil = None
+
+OPERATIONS = ["show_dashboard", "order_update_item", "order_finish", "report_generate", "view_expenses_today", "pay_kasbon_start", "analytics_report"]
+
+
+# --- OBJEK TELEGRAM PALSU ---
+class FakeBot:
+    def __init__(self): self.calls = 0
+
+    async def send_message(self, chat_id=None, text=None, **kwargs): self.calls += 1
+
+    async def send_document(self, chat_id=None, document=None, **kwargs):
+        self.calls += 1
+        if isinstance(document, io.IOBase): document.read()
+
+
+class FakeMessage:
+    def __init__(self, bot, text=None): self.bot, self.text = bot, text
+
+    async def reply_text(self, text, **kwargs): self.bot.calls += 1
+
+    async def reply_document(self, document=None, **kwargs): await self.bot.send_document(document=document)
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot, data): self.bot, self.data, self.message = bot, data, FakeMessage(bot)
+
+    async def answer(self, *args, **kwargs): self.bot.calls += 1
+
+    async def edit_message_text(self, text=None, **kwargs): self.bot.calls += 1
+
+
+class FakeUpdate:
+    def __init__(self, bot, chat_id, text=None, data=None):
+        self.effective_chat = SimpleNamespace(id=chat_id); self.effective_user = SimpleNamespace(id=chat_id, full_name=f"Kasir {chat_id}", username=None)
+        self.callback_query = FakeCallbackQuery(bot, data) if data is not None else None
+        self.message = FakeMessage(bot, text) if text is not None else None
+
+    @property
+    def effective_message(self): return self.message or self.callback_query.message
+
+
+def make_context(bot, username):
+    return SimpleNamespace(bot=bot, user_data={'username': username})
+
+
+# --- DATA SINTETIS ---
+def seed_tenant(db, tenant, menu_size, sales, expenses, kasbon, days, rng):
+    today, shop = date.today(), {'tax': 10, 'service': 5}
+    menu = db.insert_rows(tenant, 'menu', [{'nama': f"Menu {n:04d}", 'harga': (harga := rng.randrange(5, 50) * 1000), 'stok': 10 ** 9, 'kategori': f"Kategori {n % 5}", 'modal': harga * rng.randrange(30, 80) // 100} for n in range(menu_size)])
+    day = lambda: (today - timedelta(days=rng.randrange(days))).isoformat()
+    # `sales` = jumlah baris item, dibagi ke nota berisi 1-4 item.
+    batch, lines = 20000, 0
+    while lines < sales:
+        rows = []
+        while lines < sales and len(rows) < batch:
+            items = [rng.choice(menu) for _ in range(min(rng.randrange(1, 5), sales - lines))]; lines += len(items)
+            cart = {item['id']: rng.randrange(1, 4) for item in items}; menu_map = {item['id']: item for item in items}
+            rows.append(build_order(cart, menu_map, f"Pelanggan {rng.randrange(500)}", "Kasir", shop, datetime.fromisoformat(f"{day()}T{rng.choice((7, 8, 11, 12, 12, 13, 17, 18, 19, 19, 20)):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}")))
+        db.insert_rows(tenant, 'pesanan', rows)
+    db.insert_rows(tenant, 'pengeluaran', [{'deskripsi': f"Belanja {n}", 'nominal': rng.randrange(10, 500) * 1000, 'tanggal': day()} for n in range(expenses)])
+    db.insert_rows(tenant, 'kasbon', [{'nama': f"Penghutang {n % 40}", 'nominal': rng.randrange(5, 100) * 1000, 'tanggal_ambil': day(), 'lunas': rng.random() < 0.5, 'terbayar': 0} for n in range(kasbon)])
+    db.flush(); return menu
+
+
+# --- PENGUKURAN ---
+def io_counters():
+    if psutil is None: return None
+    counters = psutil.Process().io_counters()
+    # read_chars/write_chars (Linux) ikut menghitung I/O yang terlayani page cache.
+    return getattr(counters, 'read_chars', counters.read_bytes), getattr(counters, 'write_chars', counters.write_bytes)
+
+
+def percentile(values, pct):
+    ordered = sorted(values); index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def measure(main, name, make_call, iterations):
+    latencies = []; start_io = io_counters(); first = None
+    for n in range(iterations):
+        call = make_call(n); started = time.perf_counter(); await call; elapsed = (time.perf_counter() - started) * 1000
+        if first is None: first = elapsed
+        latencies.append(elapsed)
+    main.db.flush(); end_io = io_counters()
+    tracemalloc.start(); await make_call(iterations); _, peak = tracemalloc.get_traced_memory(); tracemalloc.stop()
+    result = {'iterations': iterations, 'first_call_ms': round(first, 3), 'p50_ms': round(percentile(latencies, 50), 3), 'p90_ms': round(percentile(latencies, 90), 3), 'p99_ms': round(percentile(latencies, 99), 3), 'max_ms': round(max(latencies), 3), 'mean_ms': round(sum(latencies) / len(latencies), 3), 'peak_memory_bytes': peak}
+    if start_io and end_io: result.update({'bytes_read_per_op': (end_io[0] - start_io[0]) // iterations, 'bytes_written_per_op': (end_io[1] - start_io[1]) // iterations})
+    print(f"  {name:<22} p50={result['p50_ms']:>9.3f}ms p99={result['p99_ms']:>9.3f}ms peak_mem={peak / 1024:,.0f}KiB")
+    return result
+
+
+async def run_operations(main, tenant, menu, operations, iterations, rng):
+    bot, results, chat_id = FakeBot(), {}, 1000
+    month = date.today().strftime("%Y-%m")
+
+    def order_context():
+        context = make_context(bot, tenant); context.user_data.update({'customer_name': 'Bench', 'cart': {}, 'cart_page': 0, 'cart_kategori': None}); return context
+
+    if "show_dashboard" in operations:
+        results["show_dashboard"] = await measure(main, "show_dashboard", lambda n: main.show_dashboard(FakeUpdate(bot, chat_id, data="refresh_dashboard"), make_context(bot, tenant)), iterations)
+    if "order_update_item" in operations:
+        context = order_context()
+        results["order_update_item"] = await measure(main, "order_update_item", lambda n: main.order_update_item(FakeUpdate(bot, chat_id, data=f"order_add_{rng.choice(menu)['id']}"), context), iterations)
+    if "order_finish" in operations:
+        def finish(n):
+            context = order_context(); context.user_data['cart'] = {rng.choice(menu)['id']: rng.randrange(1, 3) for _ in range(3)}
+            return main.order_finish(FakeUpdate(bot, chat_id, data="order_finish"), context)
+        results["order_finish"] = await measure(main, "order_finish", finish, iterations)
+    if "report_generate" in operations:
+        def report(n):
+            main.report_cache.invalidate(tenant, month)  # ukur render dingin, bukan cache
+            return main.report_generate(FakeUpdate(bot, chat_id, text=month), make_context(bot, tenant))
+        results["report_generate"] = await measure(main, "report_generate", report, iterations)
+        results["report_generate_cached"] = await measure(main, "report_generate_cached", lambda n: main.report_generate(FakeUpdate(bot, chat_id, text=month), make_context(bot, tenant)), iterations)
+    if "view_expenses_today" in operations:
+        results["view_expenses_today"] = await measure(main, "view_expenses_today", lambda n: main.view_expenses_today(FakeUpdate(bot, chat_id, data="view_expenses_today"), make_context(bot, tenant)), iterations)
+    if "pay_kasbon_start" in operations:
+        results["pay_kasbon_start"] = await measure(main, "pay_kasbon_start", lambda n: main.pay_kasbon_start(FakeUpdate(bot, chat_id, data="pay_kasbon_start"), make_context(bot, tenant)), iterations)
+    if "analytics_report" in operations:
+        reports = ("top", "jam", "hari", "margin"); context = make_context(bot, tenant); context.user_data['analitik_periode'] = "365"
+        results["analytics_report"] = await measure(main, "analytics_report", lambda n: main.analytics_report(FakeUpdate(bot, chat_id, data=f"analitik_{reports[n % len(reports)]}"), context), iterations)
+    return results
+
+
+async def check_concurrent_orders(main, tenant, menu, cashiers, orders_per_cashier):
+    """Jalankan order_finish paralel dari beberapa kasir dan pastikan tidak ada penjualan/stok yang hilang."""
+    bot, item = FakeBot(), menu[0]
+    sales_before = sum(r['jumlah'] for r in sales_rows(main.db, tenant) if r['menu_id'] == item['id']); stock_before = main.db.get_row(tenant, 'menu', item['id'])['stok']
+
+    async def cashier(n):
+        for _ in range(orders_per_cashier):
+            context = make_context(bot, tenant); context.user_data.update({'customer_name': f"Kasir {n}", 'cart': {item['id']: 1}})
+            await main.order_finish(FakeUpdate(bot, 2000 + n, data="order_finish"), context)
+
+    started = time.perf_counter(); await asyncio.gather(*(cashier(n) for n in range(cashiers))); elapsed = time.perf_counter() - started
+    expected = cashiers * orders_per_cashier
+    sold = sum(r['jumlah'] for r in sales_rows(main.db, tenant) if r['menu_id'] == item['id']) - sales_before
+    stock_drop = stock_before - main.db.get_row(tenant, 'menu', item['id'])['stok']
+    result = {'cashiers': cashiers, 'orders': expected, 'recorded_sales': sold, 'stock_decrement': stock_drop, 'lost_writes': expected - min(sold, stock_drop), 'orders_per_second': round(expected / elapsed, 1)}
+    print(f"  concurrent_orders      {expected} pesanan, tercatat={sold}, stok turun={stock_drop}, hilang={result['lost_writes']}")
+    return result
+
+
+async def check_last_portion(main, tenant, menu, cashiers, portions=3):
+    """Beberapa kasir berebut `portions` porsi terakhir satu menu lewat tombol keranjang; stok tidak boleh minus."""
+    bot, item = FakeBot(), menu[-1]
+    main.db.update_row(tenant, 'menu', item['id'], stok=portions); sales_before = sum(r['jumlah'] for r in sales_rows(main.db, tenant) if r['menu_id'] == item['id'])
+
+    async def cashier(n):
+        context = make_context(bot, tenant); context.user_data.update({'customer_name': f"Kasir {n}", 'cart': {}, 'cart_page': 0, 'cart_kategori': None})
+        for _ in range(portions): await main.order_update_item(FakeUpdate(bot, 3000 + n, data=f"order_add_{item['id']}"), context)
+        if context.user_data['cart']: await main.order_finish(FakeUpdate(bot, 3000 + n, data="order_finish"), context)
+
+    await asyncio.gather(*(cashier(n) for n in range(cashiers)))
+    sold = sum(r['jumlah'] for r in sales_rows(main.db, tenant) if r['menu_id'] == item['id']) - sales_before
+    result = {'cashiers': cashiers, 'portions': portions, 'sold': sold, 'stock_after': main.db.get_row(tenant, 'menu', item['id'])['stok']}
+    print(f"  last_portion           {cashiers} kasir, {portions} porsi: terjual={sold}, stok akhir={result['stock_after']}")
+    return result
+
+
+async def run(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="bench_kasir_"); os.chdir(workdir)
+    os.environ.update({'STORAGE_BACKEND': args.backend, 'SQLITE_PATH': os.path.join(workdir, 'bench.db'), 'REPORT_CACHE_DIR': os.path.join(workdir, 'report_cache')})
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench')
+    import main
+    main.setup_services()
+    rng, operations = random.Random(args.seed), [op.strip() for op in args.ops.split(",") if op.strip()]
+    report = {'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(), 'platform': platform.platform(), 'backend': args.backend, 'config': vars(args), 'runs': []}
+    for sales in [int(s) for s in str(args.sales).split(",")]:
+        tenant = f"bench{sales}"; print(f"Tenant {tenant}: menu={args.menu} penjualan={sales:,} pengeluaran={args.expenses:,} kasbon={args.kasbon}")
+        started = time.perf_counter(); menu = seed_tenant(main.db, tenant, args.menu, sales, args.expenses, args.kasbon, args.days, rng)
+        run_result = {'tenant': {'menu': args.menu, 'penjualan': sales, 'pengeluaran': args.expenses, 'kasbon': args.kasbon, 'days': args.days}, 'seed_seconds': round(time.perf_counter() - started, 2)}
+        if args.archive_keep_months > 0:
+            started = time.perf_counter(); moved = main.db.archive_closed_months(tenant, args.archive_keep_months); main.db.flush()
+            run_result['archive'] = {'keep_months': args.archive_keep_months, 'months': {c: len(m) for c, m in moved.items()}, 'seconds': round(time.perf_counter() - started, 2)}
+        run_result['operations'] = await run_operations(main, tenant, menu, operations, args.iterations, rng)
+        if args.concurrency > 0: run_result['concurrent_orders'] = await check_concurrent_orders(main, tenant, menu, args.concurrency, args.orders_per_cashier); run_result['last_portion'] = await check_last_portion(main, tenant, menu, args.concurrency)
+        report['runs'].append(run_result)
+    main.close_services()
+    os.makedirs(args.out, exist_ok=True); out_path = os.path.join(args.out, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out_path, 'w') as f: json.dump(report, f, indent=2)
+    print(f"Hasil disimpan ke {out_path}")
+    return report
+
+
+# --- MODE WEBHOOK: REPLAY KE BEBERAPA WORKER ---
+class FakeTelegramApi:
+    """Pengganti server Bot API: setiap method dibalas hasil minimal yang valid setelah jeda `latency` detik.
+
+    Jika `flood_per_chat`/`flood_global` > 0, kiriman yang melebihi sekian per detik (per chat / total) dibalas
+    HTTP 429 dengan `retry_after` seperti flood control Telegram; jumlahnya dicatat di `floods`.
+    """
+
+    def __init__(self, latency=0.0, flood_per_chat=0, flood_global=0, retry_after=1):
+        self.latency, self.calls, self._runner = latency, 0, None
+        self.flood_per_chat, self.flood_global, self.retry_after, self.floods, self.methods = flood_per_chat, flood_global, retry_after, 0, {}
+        self._sent = {}  # chat_id (None = global) -> waktu kiriman dalam 1 detik terakhir
+
+    def _flooded(self, chat_id):
+        now, flooded = time.monotonic(), False
+        for key, limit in ((chat_id, self.flood_per_chat), (None, self.flood_global)):
+            if not limit: continue
+            window = self._sent.setdefault(key, deque())
+            while window and now - window[0] > 1.0: window.popleft()
+            flooded = flooded or len(window) >= limit
+        if not flooded:
+            for key, limit in ((chat_id, self.flood_per_chat), (None, self.flood_global)):
+                if limit: self._sent[key].append(now)
+        return flooded
+
+    async def handle(self, request):
+        from aiohttp import web
+        method, form = request.match_info['method'], await request.post(); self.calls += 1; self.methods[method] = self.methods.get(method, 0) + 1
+        if self.latency: await asyncio.sleep(self.latency)
+        if form.get('chat_id') and self._flooded(form.get('chat_id')):
+            self.floods += 1
+            return web.json_response({'ok': False, 'error_code': 429, 'description': f"Too Many Requests: retry after {self.retry_after}", 'parameters': {'retry_after': self.retry_after}}, status=429)
+        if method == 'getMe': result = {'id': 1, 'is_bot': True, 'first_name': 'Kasir', 'username': 'kasir_bench_bot'}
+        elif method in ('sendMessage', 'sendDocument', 'editMessageText', 'editMessageReplyMarkup'): result = {'message_id': self.calls, 'date': int(time.time()), 'chat': {'id': int(form.get('chat_id') or 1), 'type': 'private'}, 'text': '-'}
+        else: result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application(client_max_size=64 * 1024 * 1024); app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app); await self._runner.setup(); await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+        return f"http://127.0.0.1:{self._runner.addresses[0][1]}/bot"
+
+    async def stop(self): await self._runner.cleanup()
+
+
+def synthesize_updates(tenants, cashiers, orders, items_per_order, menu_size, password, rng):
+    """Rekaman update sintetis: tiap kasir login ke tenant-nya, membuat beberapa pesanan, lalu membuka dashboard."""
+    streams, update_id, now = [], 0, int(time.time())
+    for t in range(tenants):
+        for c in range(cashiers):
+            uid, stream = 100000 + t * 100 + c, []; user, chat = {'id': uid, 'is_bot': False, 'first_name': f"Kasir {uid}"}, {'id': uid, 'type': 'private'}
+
+            def add(kind, payload):
+                nonlocal update_id; update_id += 1
+                if kind == 'text':
+                    message = {'message_id': update_id, 'date': now, 'chat': chat, 'from': user, 'text': payload}
+                    if payload.startswith('/'): message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(payload)}]
+                    stream.append({'update_id': update_id, 'message': message})
+                else: stream.append({'update_id': update_id, 'callback_query': {'id': str(update_id), 'from': user, 'chat_instance': str(uid), 'data': payload, 'message': {'message_id': 1, 'date': now, 'chat': chat, 'text': '-'}}})
+            add('text', '/start'); add('callback', 'login'); add('text', f"toko{t}"); add('text', password)
+            for n in range(orders):
+                add('callback', 'order_start'); add('text', f"Pelanggan {n}")
+                for menu_id in rng.sample(range(1, menu_size + 1), items_per_order): add('callback', f"order_add_{menu_id}")
+                add('callback', 'order_finish')
+            add('callback', 'refresh_dashboard'); streams.append(stream)
+    # Gabungkan bergiliran supaya urutan rekaman menyerupai banyak kasir yang aktif bersamaan.
+    return [u for batch in zip(*streams) for u in batch] + [u for s in streams for u in s[min(map(len, streams)):]]
+
+
+async def replay(session, front_url, updates):
+    """Kirim rekaman ke proses depan; update satu pengguna berurutan, pengguna berbeda bersamaan."""
+    from webhook import route_key
+    streams = {}
+    for data in updates: streams.setdefault(route_key(data), []).append(data)
+
+    async def post_stream(stream):
+        for data in stream:
+            async with session.post(front_url, json=data) as response: response.raise_for_status()
+    await asyncio.gather(*(post_stream(s) for s in streams.values()))
+
+
+async def run_webhook_case(args, session, api, api_url, updates, workers, expected_sales):
+    from storage import SqliteBackend
+    workdir = tempfile.mkdtemp(prefix="bench_webhook_"); db_path = os.path.join(workdir, 'kasir.db')
+    if args.replay_db: shutil.copy(args.replay_db, db_path)
+    else:
+        db, rng = SqliteBackend(db_path), random.Random(args.seed)
+        for t in range(args.tenants):
+            db.set_user(f"toko{t}", hashlib.sha256(args.password.encode()).hexdigest()); seed_tenant(db, f"toko{t}", args.menu, int(str(args.sales).split(",")[0]), args.expenses, args.kasbon, args.days, rng)
+        db.close()
+    sales_today = lambda: sum(len(sales_rows(db, f"toko{t}", date.today().isoformat())) for t in range(args.tenants))
+    db = SqliteBackend(db_path); before = sales_today(); db.close()
+    with socket.socket() as sock: sock.bind(('127.0.0.1', 0)); port = sock.getsockname()[1]
+    env = dict(os.environ, OUTBOUND_QUEUE='1' if args.outbound_queue else '0', STORAGE_BACKEND='sqlite', SQLITE_PATH=db_path, REPORT_CACHE_DIR=os.path.join(workdir, 'report_cache'), TELEGRAM_BOT_TOKEN='123456:bench', TELEGRAM_API_URL=api_url, WEBHOOK_URL=f"http://127.0.0.1:{port}/telegram", WEBHOOK_LISTEN='127.0.0.1', WEBHOOK_PORT=str(port), WEBHOOK_WORKERS=str(workers), WEBHOOK_RECORD_FILE='', ARCHIVE_KEEP_MONTHS='0', METRICS_FILE='', METRICS_PORT='0')
+    log_path = os.path.join(workdir, 'bot.log')
+    with open(log_path, 'wb') as log: process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')], cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    status_url, deadline = f"http://127.0.0.1:{port}/status", time.monotonic() + 120
+    try:
+        while True:
+            if process.poll() is not None or time.monotonic() > deadline: raise RuntimeError(f"Bot webhook gagal start, lihat {log_path}")
+            try:
+                async with session.get(status_url) as response:
+                    if response.status == 200: break
+            except OSError: pass
+            await asyncio.sleep(0.2)
+        calls_before, started = api.calls, time.perf_counter()
+        await replay(session, f"http://127.0.0.1:{port}/telegram", updates)
+        while True:
+            async with session.get(status_url) as response: status = await response.json()
+            if status['selesai'] >= len(updates): break
+            if process.poll() is not None or time.monotonic() > deadline + 600: raise RuntimeError(f"Replay tidak selesai ({status}), lihat {log_path}")
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try: process.wait(timeout=60)
+        except subprocess.TimeoutExpired: process.kill()
+    db = SqliteBackend(db_path); recorded = sales_today() - before; db.close()
+    return {'workers': workers, 'updates': len(updates), 'seconds': round(elapsed, 3), 'updates_per_second': round(len(updates) / elapsed, 1), 'api_calls': api.calls - calls_before, 'per_worker': status['per_worker'], 'expected_sales': expected_sales, 'recorded_sales': recorded, 'workdir': workdir}
+
+
+async def run_webhook(args):
+    from aiohttp import ClientSession
+    rng = random.Random(args.seed)
+    if args.replay:
+        with open(args.replay) as f: updates = [json.loads(line) for line in f if line.strip()]
+        expected_sales = None
+    else:
+        updates = synthesize_updates(args.tenants, args.cashiers, args.orders_per_cashier, args.items_per_order, args.menu, args.password, rng)
+        expected_sales = args.tenants * args.cashiers * args.orders_per_cashier * args.items_per_order
+    api = FakeTelegramApi(args.api_latency_ms / 1000); api_url = await api.start()
+    report = {'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'mode': 'webhook', 'config': vars(args), 'runs': []}
+    try:
+        async with ClientSession() as session:
+            for workers in [int(w) for w in str(args.webhook_workers).split(",")]:
+                print(f"Webhook {workers} worker: memutar ulang {len(updates):,} update...")
+                result = await run_webhook_case(args, session, api, api_url, updates, workers, expected_sales); report['runs'].append(result)
+                check = f", penjualan tercatat {result['recorded_sales']}/{expected_sales}" if expected_sales is not None else ""
+                print(f"  {result['updates_per_second']:>8.1f} update/detik ({result['seconds']}s), per worker={result['per_worker']}{check}")
+    finally:
+        await api.stop()
+    base = report['runs'][0]['updates_per_second'] if report['runs'] else 0
+    for result in report['runs']: result['speedup'] = round(result['updates_per_second'] / base, 2) if base else None
+    os.makedirs(args.out, exist_ok=True); out_path = os.path.join(args.out, f"bench-webhook-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out_path, 'w') as f: json.dump(report, f, indent=2)
+    if not args.replay:
+        with open(os.path.join(args.out, os.path.basename(out_path)[:-5] + "-updates.jsonl"), 'w') as f: f.writelines(json.dumps(u) + "\n" for u in updates)
+    print(f"Hasil disimpan ke {out_path}")
+    return report
+
+
+# --- ANTREAN KIRIM (outbox.py) MELAWAN FLOOD CONTROL TIRUAN ---
+async def outbound_case(api_url, limiter, chats, orders, edit_burst):
+    """Tiap chat: beberapa alur seperti order_finish (kirim, edit, edit dashboard) berurutan, ditambah
+    `edit_burst` edit bersamaan ke satu pesan (mis. notifikasi dari tugas latar) yang boleh digabung."""
+    from telegram.error import TelegramError
+    from telegram.ext import ExtBot
+    bot = ExtBot("123456:bench", base_url=api_url, rate_limiter=limiter); errors = 0
+    await bot.initialize()
+
+    async def chat(chat_id):
+        nonlocal errors
+        try:
+            for n in range(orders):
+                message = await bot.send_message(chat_id, f"Nota {n}")
+                await bot.edit_message_text(f"✅ Pesanan {n}", chat_id=chat_id, message_id=message.message_id)
+                await bot.edit_message_text(f"Dashboard {n}", chat_id=chat_id, message_id=message.message_id)
+            results = await asyncio.gather(*(bot.edit_message_text(f"Status {k}", chat_id=chat_id, message_id=1) for k in range(edit_burst)), return_exceptions=True)
+            errors += sum(isinstance(r, TelegramError) for r in results)
+        except TelegramError: errors += 1
+
+    started = time.perf_counter(); await asyncio.gather(*(chat(5000 + c) for c in range(chats))); elapsed = time.perf_counter() - started
+    await bot.shutdown(); return elapsed, errors
+
+
+async def run_outbound(args):
+    """Bandingkan kiriman langsung vs lewat OutboundQueue terhadap server Bot API tiruan yang memberlakukan flood control."""
+    from outbox import OutboundQueue
+    from metrics import metrics
+    report = {'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(), 'mode': 'outbound', 'config': vars(args), 'runs': []}
+    for name in ("langsung", "antrean"):
+        api = FakeTelegramApi(args.api_latency_ms / 1000, flood_per_chat=args.flood_per_chat, flood_global=args.flood_global); api_url = await api.start()
+        # Bucket berkapasitas 1 masih bisa meloloskan laju+1 kiriman dalam satu detik, jadi laju diset 1 di bawah batas server.
+        limiter = OutboundQueue(max(args.flood_per_chat - 1, 0.5), 1, max(args.flood_per_chat - 1, 0.5), max(args.flood_global - 1, 1)) if name == "antrean" else None
+        merged_before = sum(v for _, _, v in metrics.counters("kasir_outbound_merged_total"))
+        try: elapsed, errors = await outbound_case(api_url, limiter, args.outbound_chats, args.orders_per_cashier, args.edit_burst)
+        finally: await api.stop()
+        result = {'mode': name, 'seconds': round(elapsed, 2), 'api_calls': api.calls, 'methods': api.methods, 'http_429': api.floods, 'caller_errors': errors, 'merged_edits': sum(v for _, _, v in metrics.counters("kasir_outbound_merged_total")) - merged_before}
+        queued = [h for _, _, h in metrics.histograms("kasir_outbound_queue_seconds")]
+        if limiter and queued: result['queue_p50_s'], result['queue_p95_s'] = max(h.quantile(0.5) for h in queued), max(h.quantile(0.95) for h in queued)
+        report['runs'].append(result)
+        print(f"  {name:<9} {result['seconds']:>6}s, {api.calls} panggilan API, 429={api.floods}, error ke pemanggil={errors}, edit digabung={result['merged_edits']}" + (f", antre p50≤{result['queue_p50_s']}s p95≤{result['queue_p95_s']}s" if 'queue_p50_s' in result else ""))
+    os.makedirs(args.out, exist_ok=True); out_path = os.path.join(args.out, f"bench-outbound-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out_path, 'w') as f: json.dump(report, f, indent=2)
+    print(f"Hasil disimpan ke {out_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark handler bot kasir dengan tenant sintetis.")
+    parser.add_argument("--menu", type=int, default=100, help="Jumlah menu per tenant")
+    parser.add_argument("--sales", default="10000", help="Jumlah baris penjualan; pisahkan dengan koma untuk beberapa ukuran (mis. 10000,1000000)")
+    parser.add_argument("--expenses", type=int, default=1000, help="Jumlah baris pengeluaran")
+    parser.add_argument("--kasbon", type=int, default=100, help="Jumlah catatan kasbon")
+    parser.add_argument("--days", type=int, default=365, help="Rentang hari data historis")
+    parser.add_argument("--iterations", type=int, default=50, help="Jumlah pemanggilan per operasi")
+    parser.add_argument("--ops", default=",".join(OPERATIONS), help="Operasi yang diukur, dipisah koma")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--archive-keep-months", type=int, default=0, help="Jika > 0, arsipkan bulan lama sebelum mengukur (hanya backend json)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Jumlah kasir paralel untuk cek lost write (0 = lewati)")
+    parser.add_argument("--orders-per-cashier", type=int, default=20)
+    parser.add_argument("--webhook-workers", default="", help="Mode webhook: jumlah worker yang dibandingkan, dipisah koma (mis. 1,2,4)")
+    parser.add_argument("--tenants", type=int, default=8, help="Mode webhook: jumlah tenant")
+    parser.add_argument("--cashiers", type=int, default=2, help="Mode webhook: jumlah kasir per tenant")
+    parser.add_argument("--items-per-order", type=int, default=3, help="Mode webhook: jumlah menu berbeda per pesanan")
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="Mode webhook: jeda balasan server Bot API tiruan")
+    parser.add_argument("--password", default="rahasia", help="Mode webhook: password semua tenant sintetis")
+    parser.add_argument("--replay", help="Mode webhook: file JSONL rekaman update (WEBHOOK_RECORD_FILE) untuk diputar ulang")
+    parser.add_argument("--replay-db", help="Mode webhook: salinan database SQLite yang cocok dengan rekaman --replay")
+    parser.add_argument("--outbound-queue", action="store_true", help="Mode webhook: aktifkan antrean kirim (OUTBOUND_QUEUE) di worker; default mati agar yang diukur throughput worker")
+    parser.add_argument("--outbound", action="store_true", help="Uji antrean kirim (outbox.py) melawan flood control tiruan, bandingkan dengan kiriman langsung")
+    parser.add_argument("--outbound-chats", type=int, default=20, help="Mode outbound: jumlah chat yang aktif bersamaan")
+    parser.add_argument("--edit-burst", type=int, default=10, help="Mode outbound: edit bersamaan ke satu pesan per chat")
+    parser.add_argument("--flood-per-chat", type=float, default=3, help="Mode outbound: batas kiriman per chat per detik di server tiruan")
+    parser.add_argument("--flood-global", type=float, default=30, help="Mode outbound: batas kiriman total per detik di server tiruan")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results"))
+    args = parser.parse_args()
+    report = asyncio.run(run_outbound(args) if args.outbound else run_webhook(args) if args.webhook_workers else run(args))
+    # Cek konsistensi bukan sekadar angka: penjualan/stok yang hilang atau porsi terjual melebihi stok = exit non-nol.
+    gagal = [r for r in (report or {}).get('runs', []) if r.get('concurrent_orders', {}).get('lost_writes') or r.get('last_portion', {}).get('sold', 0) > r.get('last_portion', {}).get('portions', 0)]
+    if gagal: sys.exit(f"GAGAL: lost write / stok minus pada {len(gagal)} tenant")
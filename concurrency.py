@@ -0,0 +1,39 @@
+import asyncio
+import weakref
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class KeyedLocks:
+    """Satu `asyncio.Lock` per kunci (mis. username tenant); lock yang tidak dipakai lagi otomatis dibuang."""
+
+    def __init__(self):
+        self._locks = weakref.WeakValueDictionary()
+
+    def __call__(self, key):
+        lock = self._locks.get(key)
+        if lock is None: lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Proses update secara bersamaan antar chat, tapi tetap berurutan di dalam satu chat.
+
+    Urutan per chat menjaga state ConversationHandler & keranjang di `user_data` tetap konsisten,
+    sementara chat (dan tenant) lain tidak perlu menunggu. Lock chat diambil sebelum slot
+    konkurensi, jadi satu chat yang membanjiri update tidak bisa menghabiskan semua slot.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates); self._chat_locks = KeyedLocks()
+
+    async def process_update(self, update, coroutine):
+        chat = getattr(update, 'effective_chat', None)
+        if chat is None: await super().process_update(update, coroutine); return
+        async with self._chat_locks(chat.id): await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self): pass
+    async def shutdown(self): pass
@@ -1,14 +1,24 @@
 import os
-import json
+import io
+import asyncio
 import logging
 import hashlib
-import locale
-import calendar
 from datetime import date, datetime
 from dotenv import load_dotenv
-from fpdf import FPDF
+from storage import open_storage
+from render_pool import RenderPool, RenderQueueFull
+from rollup import RollupIndex, debtor_key
+from report_cache import ReportCache
+from concurrency import KeyedLocks, PerChatUpdateProcessor
+from menu_index import MenuIndex
+from stock import StockLedger
+from orders import build_order, order_code, parse_order_code, sales_rows
+from sessions import SessionPersistence
+from outbox import OutboundQueue
+from metrics import metrics, instrument_application, instrument_storage, observe_render, format_stats, start_exporters
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -26,6 +36,42 @@ RESTAURANT_NAME = "Warung Percobaan"
 RESTAURANT_LOCATION = "Pucang Gading"
 TAX_PERCENTAGE = 0
 SERVICE_PERCENTAGE = 0
+SHOP_INFO = {'nama': RESTAURANT_NAME, 'lokasi': RESTAURANT_LOCATION, 'tax': TAX_PERCENTAGE, 'service': SERVICE_PERCENTAGE}
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "kasir.db")
+DATA_CACHE_TENANTS = int(os.getenv("DATA_CACHE_TENANTS", "64"))
+DATA_FLUSH_INTERVAL = float(os.getenv("DATA_FLUSH_INTERVAL", "2"))
+DATA_FLUSH_MAX_DIRTY = int(os.getenv("DATA_FLUSH_MAX_DIRTY", "16"))
+ROLLUP_VERIFY_EVERY = int(os.getenv("ROLLUP_VERIFY_EVERY", "0"))
+PDF_POOL_KIND = os.getenv("PDF_POOL_KIND", "thread")
+PDF_POOL_SIZE = int(os.getenv("PDF_POOL_SIZE", "2"))
+PDF_QUEUE_LIMIT = int(os.getenv("PDF_QUEUE_LIMIT", "4"))
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+CART_PAGE_SIZE = int(os.getenv("CART_PAGE_SIZE", "8"))
+KASBON_PAGE_SIZE = int(os.getenv("KASBON_PAGE_SIZE", "8"))
+STOCK_HOLD_TTL = float(os.getenv("STOCK_HOLD_TTL", "900"))
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1"))
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+ADMIN_USER_IDS = {int(i) for i in os.getenv("ADMIN_USER_IDS", "").split(",") if i.strip()}
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "report_cache")
+REPORT_CACHE_MAX_MB = float(os.getenv("REPORT_CACHE_MAX_MB", "50"))
+ARCHIVE_KEEP_MONTHS = int(os.getenv("ARCHIVE_KEEP_MONTHS", "3"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_RECORD_FILE = os.getenv("WEBHOOK_RECORD_FILE", "")
+SESSIONS_PATH = os.getenv("SESSIONS_PATH", "sessions.db")
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "15"))
+OUTBOUND_QUEUE = os.getenv("OUTBOUND_QUEUE", "1") == "1"
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "10"))
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20"))
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -39,81 +85,59 @@ GET_REPORT_PERIOD = range(13, 14)
 GET_CUSTOMER_NAME = range(14, 15)
 CART_INTERACTION = 16
 ADJUST_STOCK_AMOUNT = range(17, 18)
+MENU_KATEGORI, EDIT_MENU_KATEGORI_BARU = range(18, 20)
+KASBON_CARI, KASBON_BAYAR = range(20, 22)
+EDIT_MENU_MODAL_BARU, ANALITIK_PERIODE = range(22, 24)
+NOTA_CARI = range(24, 25)
+STATE_NAMES = {USERNAME: "USERNAME", PASSWORD: "PASSWORD", CONFIRM_PASSWORD: "CONFIRM_PASSWORD", MENU_NAMA: "MENU_NAMA", MENU_HARGA: "MENU_HARGA", MENU_STOK: "MENU_STOK", MENU_KATEGORI: "MENU_KATEGORI", PENGELUARAN_DESKRIPSI: "PENGELUARAN_DESKRIPSI", PENGELUARAN_NOMINAL: "PENGELUARAN_NOMINAL", KASBON_NAMA: "KASBON_NAMA", KASBON_NOMINAL: "KASBON_NOMINAL", EDIT_MENU_PILIH_AKSI: "EDIT_MENU_PILIH_AKSI", EDIT_MENU_NAMA_BARU: "EDIT_MENU_NAMA_BARU", EDIT_MENU_HARGA_BARU: "EDIT_MENU_HARGA_BARU", EDIT_MENU_KATEGORI_BARU: "EDIT_MENU_KATEGORI_BARU", GET_REPORT_PERIOD: "GET_REPORT_PERIOD", GET_CUSTOMER_NAME: "GET_CUSTOMER_NAME", CART_INTERACTION: "CART_INTERACTION", ADJUST_STOCK_AMOUNT: "ADJUST_STOCK_AMOUNT", KASBON_CARI: "KASBON_CARI", KASBON_BAYAR: "KASBON_BAYAR", EDIT_MENU_MODAL_BARU: "EDIT_MENU_MODAL_BARU", ANALITIK_PERIODE: "ANALITIK_PERIODE", NOTA_CARI: "NOTA_CARI"}
 
 # --- FUNGSI HELPER DATA (Multi-Tenant) ---
-def load_central_data(file_path):
-    try:
-        with open(file_path, 'r') as f: return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+# Semua handler membaca & menulis data lewat `db` (lihat storage.py); backend JSON atau SQLite dipilih lewat STORAGE_BACKEND.
+# Layanan di bawah dibuat oleh `setup_services()`, bukan saat impor: proses depan webhook mengimpor modul ini
+# tanpa membuka penyimpanan, pool PDF & indeks; hanya worker (dan mode polling) yang memanggilnya.
+db = rollups = pdf_pool = report_cache = menu_index = stock = analytics = None
+# Update diproses bersamaan, jadi setiap jalur yang mengubah data tenant wajib memegang lock tenant-nya.
+tenant_lock, registry_lock = KeyedLocks(), KeyedLocks()
 
-def save_central_data(file_path, data):
-    with open(file_path, 'w') as f: json.dump(data, f, indent=4)
+def setup_services(storage=None):
+    """Buka penyimpanan (atau pakai `storage`, mis. untuk bench/tes) beserta pool PDF & indeks turunannya."""
+    global db, rollups, pdf_pool, report_cache, menu_index, stock, analytics
+    db = storage or open_storage(STORAGE_BACKEND, sqlite_path=SQLITE_PATH, cache_options={"max_tenants": DATA_CACHE_TENANTS, "flush_interval": DATA_FLUSH_INTERVAL, "max_dirty": DATA_FLUSH_MAX_DIRTY})
+    metrics.sample_rate = METRICS_SAMPLE_RATE; instrument_storage(db)
+    # Total harian/bulanan & kasbon aktif per tenant, diperbarui otomatis setiap kali `db` menulis data.
+    rollups = RollupIndex(db, verify_every=ROLLUP_VERIFY_EVERY)
+    # PDF dibuat di worker terpisah agar event loop tetap melayani tenant lain.
+    # Fungsi render dirujuk lewat nama "modul:fungsi", jadi FPDF & locale baru dimuat saat nota/laporan pertama diminta.
+    pdf_pool = RenderPool(size=PDF_POOL_SIZE, max_queue=PDF_QUEUE_LIMIT, kind=PDF_POOL_KIND, observer=observe_render)
+    # Laporan bulanan yang sudah pernah dibuat disajikan ulang dari cache sampai data bulan itu berubah.
+    report_cache = ReportCache(db, directory=REPORT_CACHE_DIR, max_bytes=int(REPORT_CACHE_MAX_MB * 1024 * 1024))
+    # Menu terurut per tenant; hanya dibangun ulang saat menu ditambah/diedit/dihapus.
+    menu_index = MenuIndex(db)
+    # Porsi di keranjang yang belum selesai ditahan di sini, supaya kasir lain tidak bisa menjual porsi yang sama.
+    stock = StockLedger(db, ttl=STOCK_HOLD_TTL)
+    # Penjualan per tenant dalam kolom array untuk laporan analitik; dibuat saat perintah analitik pertama (lihat `sales_analytics`).
+    analytics = None
 
-def get_user_data_path(username):
-    safe_username = "".join(c for c in username if c.isalnum())
-    return f"data_{safe_username}.json"
+def analytics_module():
+    import analytics as module  # NumPy baru dimuat di sini, bukan saat bot mulai
+    return module
 
-def load_user_data(username):
-    file_path = get_user_data_path(username)
-    try:
-        with open(file_path, 'r') as f: return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"menu": [], "penjualan": [], "pengeluaran": [], "kasbon": []}
+def sales_analytics():
+    """Indeks SalesAnalytics proses ini, dibuat (beserta impor NumPy) saat pertama dipakai."""
+    global analytics
+    if analytics is None: analytics = analytics_module().SalesAnalytics(db)
+    return analytics
 
-def save_user_data(username, data):
-    file_path = get_user_data_path(username)
-    with open(file_path, 'w') as f: json.dump(data, f, indent=4)
+def close_services():
+    pdf_pool.close(); db.close()
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-# --- FUNGSI-FUNGSI PEMBUATAN PDF ---
-def generate_monthly_recap_pdf(data, year_month):
-    try:
-        report_date = date.fromisoformat(f"{year_month}-01"); month_name = report_date.strftime("%B"); year = int(year_month.split('-')[0]); month = int(year_month.split('-')[1])
-    except ValueError: return None
-    filename = f"laporan_bulanan_{year_month}.pdf"; daily_summary = {}
-    for sale in [p for p in data.get('penjualan', []) if p['tanggal'].startswith(year_month)]:
-        day = sale['tanggal']; daily_summary.setdefault(day, {'pemasukan': 0, 'pengeluaran': 0})['pemasukan'] += sale['harga'] * sale['jumlah']
-    for expense in [e for e in data.get('pengeluaran', []) if e['tanggal'].startswith(year_month)]:
-        day = expense['tanggal']; daily_summary.setdefault(day, {'pemasukan': 0, 'pengeluaran': 0})['pengeluaran'] += expense['nominal']
-    total_pemasukan, total_pengeluaran = sum(d['pemasukan'] for d in daily_summary.values()), sum(d['pengeluaran'] for d in daily_summary.values())
-    pdf = FPDF(); pdf.add_page(); pdf.set_font("Helvetica", "B", 16); pdf.cell(0, 10, f"Laporan Bulanan - {month_name} {year}", 0, 1, 'C'); pdf.ln(10)
-    pdf.set_font("Helvetica", "B", 12); pdf.cell(0, 10, "REKAPITULASI HARIAN", 0, 1); pdf.set_font("Helvetica", "B", 10)
-    pdf.cell(40, 8, "Tanggal", 1, 0, 'C'); pdf.cell(50, 8, "Pemasukan", 1, 0, 'C'); pdf.cell(50, 8, "Pengeluaran", 1, 0, 'C'); pdf.cell(50, 8, "Laba Bersih", 1, 1, 'C')
-    pdf.set_font("Helvetica", "", 10)
-    num_days = calendar.monthrange(year, month)[1]
-    for day_num in range(1, num_days + 1):
-        current_date_str = f"{year_month}-{day_num:02d}"; day_data = daily_summary.get(current_date_str, {'pemasukan': 0, 'pengeluaran': 0})
-        pemasukan_harian, pengeluaran_harian = day_data['pemasukan'], day_data['pengeluaran']; laba_harian = pemasukan_harian - pengeluaran_harian
-        formatted_date = date.fromisoformat(current_date_str).strftime("%d %b %Y")
-        pdf.cell(40, 8, formatted_date, 1); pdf.cell(50, 8, f"Rp {pemasukan_harian:,}", 1, 0, 'R'); pdf.cell(50, 8, f"Rp {pengeluaran_harian:,}", 1, 0, 'R'); pdf.cell(50, 8, f"Rp {laba_harian:,}", 1, 1, 'R')
-    pdf.ln(10); pdf.set_font("Helvetica", "B", 12); pdf.cell(70, 8, "Total Pemasukan Bulan Ini:", 0, 0, 'R'); pdf.cell(40, 8, f"Rp {total_pemasukan:,}", 0, 1, 'R')
-    pdf.cell(70, 8, "Total Pengeluaran Bulan Ini:", 0, 0, 'R'); pdf.cell(40, 8, f"Rp {total_pengeluaran:,}", 0, 1, 'R'); pdf.set_font("Helvetica", "B", 14)
-    pdf.cell(70, 10, "LABA BERSIH BULANAN:", 0, 0, 'R'); pdf.cell(40, 10, f"Rp {total_pemasukan - total_pengeluaran:,}", 0, 1, 'R'); pdf.output(filename)
-    return filename
-
-def generate_order_receipt_pdf(cart, menu_map, customer_name, cashier_name):
-    order_id = f"TX-{datetime.now().strftime('%Y%m%d-%H%M%S')}"; filename = f"nota_{customer_name.replace(' ', '_')}_{order_id}.pdf"
-    pdf = FPDF(orientation='P', unit='mm', format=(80, 200)); pdf.add_page(); pdf.set_auto_page_break(auto=True, margin=5); pdf.set_font("Helvetica", "B", 12); pdf.set_margin(5)
-    pdf.cell(0, 6, RESTAURANT_NAME, 0, 1, 'C'); pdf.set_font("Helvetica", "", 8); pdf.cell(0, 4, RESTAURANT_LOCATION, 0, 1, 'C'); pdf.ln(5)
-    col_width, line_height = pdf.w / 2 - pdf.l_margin, 4; pdf.set_font("Helvetica", "", 8)
-    pdf.cell(col_width, line_height, f"Date: {date.today().strftime('%b %d %Y')}", 0, 0, 'L'); pdf.cell(col_width, line_height, f"Cashier: {cashier_name}", 0, 1, 'R')
-    pdf.cell(col_width, line_height, f"Trx ID: {order_id}", 0, 0, 'L'); pdf.cell(col_width, line_height, f"Customer: {customer_name}", 0, 1, 'R')
-    pdf.ln(3); pdf.dashed_line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y()); pdf.ln(3)
-    subtotal = sum(menu_map.get(item_id)['harga'] * jumlah for item_id, jumlah in cart.items() if item_id in menu_map)
-    for item_id, jumlah in cart.items():
-        menu_item = menu_map.get(item_id)
-        if menu_item:
-            pdf.set_font("Helvetica", "B", 8); pdf.cell(col_width + 10, line_height, f"{menu_item['nama']} x{jumlah}", 0, 0, 'L'); pdf.set_font("Helvetica", "", 8); pdf.cell(col_width - 10, line_height, f"Rp{menu_item['harga'] * jumlah:,}", 0, 1, 'R')
-    pdf.ln(3); pdf.dashed_line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y()); pdf.ln(3); pdf.set_font("Helvetica", "B", 8)
-    pdf.cell(0, line_height, "Payment Details", 0, 1, 'L'); pdf.set_font("Helvetica", "", 8)
-    discount, service = 0, int(subtotal * (SERVICE_PERCENTAGE / 100)); tax = int((subtotal + service - discount) * (TAX_PERCENTAGE / 100)); total = subtotal + service + tax - discount
-    pdf.cell(col_width, line_height, "Subtotal", 0, 0, 'L'); pdf.cell(col_width, line_height, f"Rp{subtotal:,}", 0, 1, 'R'); pdf.cell(col_width, line_height, "Discount", 0, 0, 'L'); pdf.cell(col_width, line_height, f"-Rp{discount:,}", 0, 1, 'R'); pdf.cell(col_width, line_height, f"Service ({SERVICE_PERCENTAGE}%)", 0, 0, 'L'); pdf.cell(col_width, line_height, f"Rp{service:,}", 0, 1, 'R'); pdf.cell(col_width, line_height, f"Tax ({TAX_PERCENTAGE}%)", 0, 0, 'L'); pdf.cell(col_width, line_height, f"Rp{tax:,}", 0, 1, 'R')
-    pdf.set_font("Helvetica", "B", 10); pdf.cell(col_width, line_height + 2, "Total", 0, 0, 'L'); pdf.cell(col_width, line_height + 2, f"Rp{total:,}", 0, 1, 'R'); pdf.ln(5)
-    pdf.set_font("Helvetica", "B", 10); pdf.cell(0, 6, "PAID", 0, 1, 'C'); pdf.set_font("Helvetica", "", 8); pdf.cell(0, 4, datetime.now().strftime("%b %d %Y - %H:%M"), 0, 1, 'C'); pdf.ln(5); pdf.cell(0, 4, "Thank you for your order!", 0, 1, 'C'); pdf.output(filename)
-    return filename
+def release_cart(update, context):
+    """Lepas porsi yang ditahan keranjang pengguna ini (keranjang dibatalkan, diganti, atau logout)."""
+    username = context.user_data.get('username')
+    if username and update.effective_user: stock.release(username, update.effective_user.id)
 
 # --- FUNGSI INTI & DASHBOARD ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -121,61 +145,68 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     else: keyboard = [[InlineKeyboardButton("🔐 Login", callback_data="login"), InlineKeyboardButton("✍️ Register", callback_data="register")]]; await update.message.reply_text("Selamat datang di Bot Kasir!", reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data.clear(); await update.message.reply_text("Anda telah berhasil logout."); await start(update, context)
+    release_cart(update, context); context.user_data.clear(); await update.message.reply_text("Anda telah berhasil logout."); await start(update, context)
 
-async def show_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def show_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE, notice=None) -> None:
     username = context.user_data.get('username')
     if not username: logger.warning("Dashboard dipanggil tanpa login."); keyboard = [[InlineKeyboardButton("🔐 Login", callback_data="login"), InlineKeyboardButton("✍️ Register", callback_data="register")]]; await context.bot.send_message(chat_id=update.effective_chat.id, text="Sesi tidak ditemukan.", reply_markup=InlineKeyboardMarkup(keyboard)); return
-    user_data = load_user_data(username); today_str = date.today().isoformat()
-    pemasukan, pengeluaran = sum(i['harga']*i['jumlah'] for i in user_data.get('penjualan',[]) if i['tanggal']==today_str), sum(i['nominal'] for i in user_data.get('pengeluaran',[]) if i['tanggal']==today_str)
-    kasbon_aktif, kasbon_text = [i['nama'] for i in user_data.get('kasbon',[]) if not i['lunas']], "Tidak ada"
-    if kasbon_aktif: kasbon_text = f"{len(kasbon_aktif)} Orang ({', '.join(kasbon_aktif)})"
-    text = (f"📊 *Dashboard Harian* ---\n👤 Login sebagai: *{username}*\n\n💰 Pemasukan : Rp {pemasukan:,}\n💸 Pengeluaran: Rp {pengeluaran:,}\n📈 Laba Bersih: Rp {pemasukan - pengeluaran:,}\n✋ Kasbon Aktif: {kasbon_text}")
-    keyboard = [[InlineKeyboardButton("🛒 Buat Pesanan Baru", callback_data="order_start")], [InlineKeyboardButton("⚙️ Kelola Menu", callback_data="manage_menu"), InlineKeyboardButton("✋ Kelola Kasbon", callback_data="manage_kasbon")], [InlineKeyboardButton("💸 Kelola Pengeluaran", callback_data="manage_expenses"), InlineKeyboardButton("🔄 Refresh", callback_data="refresh_dashboard")], [InlineKeyboardButton("🖨️ Cetak Laporan Bulanan", callback_data="print_report")], [InlineKeyboardButton("🚪 Logout", callback_data="logout")]]
+    rollup = rollups.get(username); pemasukan, pengeluaran = rollup.hari(date.today().isoformat())
+    jumlah_penghutang, kasbon_text = len(rollup.penghutang), "Tidak ada"
+    if jumlah_penghutang:
+        kasbon_text = f"{jumlah_penghutang} Orang, Rp {rollup.total_kasbon:,}\n   Terbesar: " + ", ".join(f"{nama} Rp {sisa:,}" for nama, sisa in rollup.penghutang_terbesar(3))
+        if jumlah_penghutang > 3: kasbon_text += f" +{jumlah_penghutang - 3} lainnya"
+    text = (f"{notice}\n\n" if notice else "") + f"📊 *Dashboard Harian* ---\n👤 Login sebagai: *{username}*\n\n💰 Pemasukan : Rp {pemasukan:,}\n💸 Pengeluaran: Rp {pengeluaran:,}\n📈 Laba Bersih: Rp {pemasukan - pengeluaran:,}\n✋ Kasbon Aktif: {kasbon_text}"
+    keyboard = [[InlineKeyboardButton("🛒 Buat Pesanan Baru", callback_data="order_start"), InlineKeyboardButton("🧾 Riwayat Nota", callback_data="order_history")], [InlineKeyboardButton("⚙️ Kelola Menu", callback_data="manage_menu"), InlineKeyboardButton("✋ Kelola Kasbon", callback_data="manage_kasbon")], [InlineKeyboardButton("💸 Kelola Pengeluaran", callback_data="manage_expenses"), InlineKeyboardButton("🔄 Refresh", callback_data="refresh_dashboard")], [InlineKeyboardButton("🖨️ Cetak Laporan Bulanan", callback_data="print_report"), InlineKeyboardButton("📈 Analitik", callback_data="analytics_menu")], [InlineKeyboardButton("🚪 Logout", callback_data="logout")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     try:
         if update.callback_query: await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
         else: await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    except BadRequest as e:
+        # Tombol Refresh tanpa perubahan: pesan yang sama tidak perlu dikirim ulang.
+        if "not modified" in str(e).lower(): return
+        logger.error(f"Gagal update dashboard: {e}"); await context.bot.send_message(chat_id=update.effective_chat.id, text=text, reply_markup=reply_markup, parse_mode='Markdown')
     except Exception as e: logger.error(f"Gagal update dashboard: {e}"); await context.bot.send_message(chat_id=update.effective_chat.id, text=text, reply_markup=reply_markup, parse_mode='Markdown')
 
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not update.effective_user or update.effective_user.id not in ADMIN_USER_IDS: await update.message.reply_text("Perintah ini khusus admin."); return
+    await update.message.reply_text(format_stats())
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    keys_to_clear = ['edit_menu_id', 'new_menu_name', 'new_menu_price', 'new_expense_desc', 'new_kasbon_name', 'adjust_stock_menu_id', 'customer_name', 'cart']
+    release_cart(update, context)
+    keys_to_clear = ['edit_menu_id', 'new_menu_name', 'new_menu_price', 'new_menu_stock', 'new_menu_kategori_opsi', 'new_expense_desc', 'new_kasbon_name', 'adjust_stock_menu_id', 'customer_name', 'cart', 'cart_page', 'cart_kategori', 'cart_view', 'kasbon_bayar_id', 'kasbon_cari', 'kasbon_page']
     for key in keys_to_clear:
         if key in context.user_data: del context.user_data[key]
     await update.message.reply_text("Proses dibatalkan."); await show_dashboard(update, context); return ConversationHandler.END
 
 # --- HANDLER TOMBOL NAVIGASI ---
 async def logout_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query; await query.answer(); context.user_data.clear()
+    query = update.callback_query; await query.answer(); release_cart(update, context); context.user_data.clear()
     keyboard = [[InlineKeyboardButton("🔐 Login", callback_data="login"), InlineKeyboardButton("✍️ Register", callback_data="register")]]; await query.edit_message_text(text="Anda telah berhasil logout.", reply_markup=InlineKeyboardMarkup(keyboard))
-async def report_ask_period(update: Update, context: ContextTypes.DEFAULT_TYPE): query=update.callback_query; await query.answer(); await query.message.reply_text("Masukkan periode (YYYY-MM):"); return GET_REPORT_PERIOD
-async def report_generate(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username=context.user_data.get('username');
-    if not username: return ConversationHandler.END
-    period = update.message.text; await update.message.reply_text(f"Membuat laporan untuk {period}..."); user_data = load_user_data(username); pdf_file = generate_monthly_recap_pdf(user_data, period)
-    if pdf_file: await update.message.reply_document(document=open(pdf_file, 'rb'), filename=pdf_file); os.remove(pdf_file)
-    else: await update.message.reply_text("Format periode tidak valid.")
-    await show_dashboard(update, context); return ConversationHandler.END
 
 # --- FUNGSI-FUNGSI FITUR ---
 # (LOGIN & REGISTER)
 async def login_ask_username(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.message.reply_text("Masukkan username:"); return USERNAME
 async def login_ask_password(update: Update, context: ContextTypes.DEFAULT_TYPE): context.user_data['login_username']=update.message.text; await update.message.reply_text("Masukkan password:"); return PASSWORD
 async def login_verify(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username, password, users = context.user_data.get('login_username',''), update.message.text, load_central_data('users.json')
-    if username in users and users[username] == hash_password(password): context.user_data['username'] = username; await show_dashboard(update, context)
+    username, password = context.user_data.get('login_username',''), update.message.text; password_hash = db.get_user_hash(username)
+    if password_hash is not None and password_hash == hash_password(password): context.user_data['username'] = username; await show_dashboard(update, context)
     else: await update.message.reply_text("Username/password salah."); keyboard=[[InlineKeyboardButton("🔐 Login", callback_data="login"), InlineKeyboardButton("✍️ Register", callback_data="register")]]; await update.message.reply_text("Coba lagi:", reply_markup=InlineKeyboardMarkup(keyboard))
     return ConversationHandler.END
 async def register_ask_username(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.message.reply_text("Buat username baru:"); return USERNAME
 async def register_ask_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username, users = update.message.text, load_central_data('users.json')
-    if username in users: await update.message.reply_text("Username sudah terpakai. Pilih lain:"); return USERNAME
+    username = update.message.text
+    if db.get_user_hash(username) is not None: await update.message.reply_text("Username sudah terpakai. Pilih lain:"); return USERNAME
     else: context.user_data['register_username']=username; await update.message.reply_text("Username tersedia. Buat password:"); return PASSWORD
 async def register_ask_confirm_password(update: Update, context: ContextTypes.DEFAULT_TYPE): context.user_data['register_password1']=update.message.text; await update.message.reply_text("Ketik ulang password:"); return CONFIRM_PASSWORD
 async def register_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     password2, password1 = update.message.text, context.user_data.get('register_password1','')
     if password1 != password2: await update.message.reply_text("Password tidak cocok. Buat password lagi:"); return PASSWORD
-    else: username, users = context.user_data.get('register_username',''), load_central_data('users.json'); users[username] = hash_password(password1); save_central_data('users.json', users); save_user_data(username, {"menu": [], "penjualan": [], "pengeluaran": [], "kasbon": []}); context.user_data['username'] = username; await show_dashboard(update, context)
+    username = context.user_data.get('register_username','')
+    async with registry_lock('users'):
+        taken = db.get_user_hash(username) is not None
+        if not taken: db.set_user(username, hash_password(password1)); db.create_tenant(username)
+    if taken: await update.message.reply_text("Username sudah terpakai. Pilih lain:"); return USERNAME
+    context.user_data['username'] = username; await show_dashboard(update, context)
     return ConversationHandler.END
 
 # (KELOLA MENU + STOK)
@@ -186,93 +217,124 @@ async def add_menu_ask_stock(update: Update, context: ContextTypes.DEFAULT_TYPE)
     try: context.user_data['new_menu_price'] = int(update.message.text); await update.message.reply_text("Masukkan jumlah stok awal:")
     except ValueError: await update.message.reply_text("Harga tidak valid. Masukkan angka."); return MENU_HARGA
     return MENU_STOK
+async def add_menu_ask_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try: context.user_data['new_menu_stock'] = int(update.message.text)
+    except ValueError: await update.message.reply_text("Stok tidak valid. Masukkan angka."); return MENU_STOK
+    # Langkah kategori boleh dilewati (default tanpa kategori) atau dipilih dari kategori yang sudah ada tanpa mengetik.
+    username = context.user_data.get('username'); opsi = menu_index.get(username).kategori[:12] if username else []
+    context.user_data['new_menu_kategori_opsi'] = opsi; buttons = [InlineKeyboardButton(k, callback_data=f"menu_kat_{n}") for n, k in enumerate(opsi)]
+    keyboard = [buttons[n:n + 3] for n in range(0, len(buttons), 3)] + [[InlineKeyboardButton("⏭️ Lewati (tanpa kategori)", callback_data="menu_kat_skip")]]
+    await update.message.reply_text("Pilih kategori, ketik kategori baru (contoh: Minuman), atau lewati:", reply_markup=InlineKeyboardMarkup(keyboard)); return MENU_KATEGORI
+async def add_menu_pick_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer(); pilihan, opsi = update.callback_query.data.split('_')[-1], context.user_data.get('new_menu_kategori_opsi', [])
+    return await add_menu_store(update, context, opsi[int(pilihan)] if pilihan.isdigit() and int(pilihan) < len(opsi) else None)
 async def add_menu_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    kategori = update.message.text.strip(); return await add_menu_store(update, context, None if kategori in ('', '-') else kategori)
+async def add_menu_store(update: Update, context: ContextTypes.DEFAULT_TYPE, kategori):
     username = context.user_data.get('username');
     if not username: return ConversationHandler.END
-    try: stock, name, price, user_data = int(update.message.text), context.user_data['new_menu_name'], context.user_data['new_menu_price'], load_user_data(username); new_id = max([m.get('id',0) for m in user_data['menu']]+[0])+1; user_data['menu'].append({'id':new_id,'nama':name,'harga':price,'stok':stock}); save_user_data(username, user_data); await update.message.reply_text(f"✅ Menu '{name}' (Stok: {stock}) Rp {price:,} ditambahkan.")
-    except ValueError: await update.message.reply_text("Stok tidak valid.")
-    for key in ['new_menu_name','new_menu_price']:
+    name, price, stock = context.user_data['new_menu_name'], context.user_data['new_menu_price'], context.user_data['new_menu_stock']
+    async with tenant_lock(username): db.insert_rows(username, 'menu', [{'nama':name,'harga':price,'stok':stock,'kategori':kategori}]); await db.commit(username)
+    await update.effective_message.reply_text(f"✅ Menu '{name}' (Stok: {stock}) Rp {price:,} ditambahkan" + (f" di kategori {kategori}." if kategori else "."))
+    for key in ['new_menu_name','new_menu_price','new_menu_stock','new_menu_kategori_opsi']:
         if key in context.user_data: del context.user_data[key]
     await show_dashboard(update, context); return ConversationHandler.END
 async def view_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username');
     if not username: return
-    menu_list=load_user_data(username).get('menu',[]); text="--- 📖 Daftar Menu ---\n";
+    menu_list=menu_index.get(username).items; text="--- 📖 Daftar Menu ---\n";
     if not menu_list: text += "Belum ada menu."
-    else: text += '\n'.join([f"- {i['nama']} : Rp {i['harga']:,} (Stok: {i.get('stok',0)}){' (HABIS)' if i.get('stok',0)<=0 else ''}" for i in sorted(menu_list, key=lambda x:x['nama'])])
+    else: text += '\n'.join([f"- {i['nama']} : Rp {i['harga']:,} (Stok: {i.get('stok',0)}){' (HABIS)' if i.get('stok',0)<=0 else ''}{' [' + i['kategori'] + ']' if i.get('kategori') else ''}" for i in menu_list])
     await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Kembali", callback_data="manage_menu")]]))
 async def delete_menu_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username');
     if not username: return
-    menu_list = load_user_data(username).get('menu',[]);
+    menu_list = menu_index.get(username).items;
     if not menu_list: await update.callback_query.answer("Tidak ada menu untuk dihapus.", show_alert=True); return
-    keyboard = [[InlineKeyboardButton(f"❌ {i['nama']}", callback_data=f"delete_menu_confirm_{i['id']}")] for i in sorted(menu_list, key=lambda x:x['nama'])] + [[InlineKeyboardButton("↩️ Batal", callback_data="manage_menu")]]; await update.callback_query.edit_message_text("Pilih menu untuk dihapus:", reply_markup=InlineKeyboardMarkup(keyboard))
+    keyboard = [[InlineKeyboardButton(f"❌ {i['nama']}", callback_data=f"delete_menu_confirm_{i['id']}")] for i in menu_list] + [[InlineKeyboardButton("↩️ Batal", callback_data="manage_menu")]]; await update.callback_query.edit_message_text("Pilih menu untuk dihapus:", reply_markup=InlineKeyboardMarkup(keyboard))
 async def delete_menu_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username');
     if not username: return
-    menu_id, user_data = int(update.callback_query.data.split('_')[-1]), load_user_data(username); initial_len=len(user_data['menu']); user_data['menu']=[m for m in user_data['menu'] if m['id']!=menu_id]
-    if len(user_data['menu'])<initial_len: save_user_data(username, user_data); await update.callback_query.answer("Menu dihapus!", show_alert=True); await show_dashboard(update, context)
+    menu_id = int(update.callback_query.data.split('_')[-1])
+    async with tenant_lock(username): deleted = db.delete_row(username, 'menu', menu_id); await db.commit(username)
+    if deleted: await update.callback_query.answer("Menu dihapus!", show_alert=True); await show_dashboard(update, context)
     else: await update.callback_query.answer("Gagal hapus.", show_alert=True); await menu_management_menu(update, context)
 async def edit_menu_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username');
     if not username: return ConversationHandler.END
-    menu_list = load_user_data(username).get('menu',[]);
+    menu_list = menu_index.get(username).items;
     if not menu_list: await update.callback_query.answer("Tidak ada menu untuk diedit.", show_alert=True); return
-    keyboard = [[InlineKeyboardButton(f"✏️ {i['nama']}", callback_data=f"edit_menu_select_{i['id']}")] for i in sorted(menu_list, key=lambda x:x['nama'])] + [[InlineKeyboardButton("↩️ Batal", callback_data="manage_menu")]]; await update.callback_query.edit_message_text("Pilih menu untuk diedit:", reply_markup=InlineKeyboardMarkup(keyboard)); return EDIT_MENU_PILIH_AKSI
+    keyboard = [[InlineKeyboardButton(f"✏️ {i['nama']}", callback_data=f"edit_menu_select_{i['id']}")] for i in menu_list] + [[InlineKeyboardButton("↩️ Batal", callback_data="manage_menu")]]; await update.callback_query.edit_message_text("Pilih menu untuk diedit:", reply_markup=InlineKeyboardMarkup(keyboard)); return EDIT_MENU_PILIH_AKSI
 async def edit_menu_pilih_aksi(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username');
     if not username: return ConversationHandler.END
-    menu_id = int(update.callback_query.data.split('_')[-1]); context.user_data['edit_menu_id']=menu_id; menu_item=next((i for i in load_user_data(username)['menu'] if i['id']==menu_id), None)
+    menu_id = int(update.callback_query.data.split('_')[-1]); context.user_data['edit_menu_id']=menu_id; menu_item=db.get_row(username, 'menu', menu_id)
     if not menu_item: await update.callback_query.answer("Menu tidak ditemukan.", show_alert=True); return ConversationHandler.END
-    keyboard=[[InlineKeyboardButton("Ubah Nama", callback_data="edit_name"), InlineKeyboardButton("Ubah Harga", callback_data="edit_price")], [InlineKeyboardButton("↩️ Kembali", callback_data="manage_menu")]]; await update.callback_query.edit_message_text(f"Edit menu: *{menu_item['nama']}*", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown'); return EDIT_MENU_PILIH_AKSI
+    keyboard=[[InlineKeyboardButton("Ubah Nama", callback_data="edit_name"), InlineKeyboardButton("Ubah Harga", callback_data="edit_price")], [InlineKeyboardButton("Ubah Kategori", callback_data="edit_category"), InlineKeyboardButton("Ubah Modal", callback_data="edit_modal")], [InlineKeyboardButton("↩️ Kembali", callback_data="manage_menu")]]; await update.callback_query.edit_message_text(f"Edit menu: *{menu_item['nama']}*" + (f"\nModal: Rp {menu_item['modal']:,}" if menu_item.get('modal') is not None else ""), reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown'); return EDIT_MENU_PILIH_AKSI
 async def edit_menu_ask_new_name(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.message.reply_text("Masukkan nama baru:"); return EDIT_MENU_NAMA_BARU
 async def edit_menu_save_new_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username');
     if not username: return ConversationHandler.END
-    new_name, menu_id, user_data = update.message.text, context.user_data['edit_menu_id'], load_user_data(username)
-    for i in user_data['menu']:
-        if i['id']==menu_id: i['nama']=new_name; break
-    save_user_data(username, user_data); await update.message.reply_text("✅ Nama menu diubah."); del context.user_data['edit_menu_id']; await show_dashboard(update, context); return ConversationHandler.END
+    new_name, menu_id = update.message.text, context.user_data['edit_menu_id']
+    async with tenant_lock(username): db.update_row(username, 'menu', menu_id, nama=new_name); await db.commit(username)
+    await update.message.reply_text("✅ Nama menu diubah."); del context.user_data['edit_menu_id']; await show_dashboard(update, context); return ConversationHandler.END
 async def edit_menu_ask_new_price(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.message.reply_text("Masukkan harga baru:"); return EDIT_MENU_HARGA_BARU
 async def edit_menu_save_new_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username')
     if not username: return ConversationHandler.END
     try:
-        new_price = int(update.message.text); menu_id = context.user_data['edit_menu_id']; user_data = load_user_data(username)
-        for item in user_data['menu']:
-            if item['id'] == menu_id: item['harga'] = new_price; break
-        save_user_data(username, user_data); await update.message.reply_text("✅ Harga menu berhasil diubah."); del context.user_data['edit_menu_id']; await show_dashboard(update, context)
+        new_price = int(update.message.text); menu_id = context.user_data['edit_menu_id']
+        async with tenant_lock(username): db.update_row(username, 'menu', menu_id, harga=new_price); await db.commit(username)
+        await update.message.reply_text("✅ Harga menu berhasil diubah."); del context.user_data['edit_menu_id']; await show_dashboard(update, context)
     except ValueError: await update.message.reply_text("Harga tidak valid. Proses edit dibatalkan.")
     return ConversationHandler.END
+async def edit_menu_ask_new_category(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.message.reply_text("Masukkan kategori baru (ketik - untuk menghapus kategori):"); return EDIT_MENU_KATEGORI_BARU
+async def edit_menu_save_new_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return ConversationHandler.END
+    kategori, menu_id = update.message.text.strip(), context.user_data['edit_menu_id']
+    async with tenant_lock(username): db.update_row(username, 'menu', menu_id, kategori=None if kategori in ('', '-') else kategori); await db.commit(username)
+    await update.message.reply_text("✅ Kategori menu diubah."); del context.user_data['edit_menu_id']; await show_dashboard(update, context); return ConversationHandler.END
+async def edit_menu_ask_new_modal(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.message.reply_text("Masukkan modal (biaya bahan) per porsi, untuk laporan margin:"); return EDIT_MENU_MODAL_BARU
+async def edit_menu_save_new_modal(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return ConversationHandler.END
+    try: modal = int(update.message.text)
+    except ValueError: modal = -1
+    if modal < 0: await update.message.reply_text("Modal tidak valid. Masukkan angka:"); return EDIT_MENU_MODAL_BARU
+    async with tenant_lock(username): db.update_row(username, 'menu', context.user_data['edit_menu_id'], modal=modal); await db.commit(username)
+    await update.message.reply_text("✅ Modal menu diubah. Berlaku untuk penjualan berikutnya."); del context.user_data['edit_menu_id']; await show_dashboard(update, context); return ConversationHandler.END
 async def adjust_stock_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username')
     if not username: return ConversationHandler.END
-    query=update.callback_query; await query.answer(); menu_list=load_user_data(username).get('menu',[])
+    query=update.callback_query; await query.answer(); menu_list=menu_index.get(username).items
     if not menu_list: await query.answer("Tidak ada menu.", show_alert=True); return ConversationHandler.END
     return await display_adjust_stock_menu(update, context)
 async def adjust_stock_ask_new_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query=update.callback_query; await query.answer(); menu_id=int(query.data.split('_')[-1]); context.user_data['adjust_stock_menu_id']=menu_id; username = context.user_data.get('username')
     if not username: return ConversationHandler.END
-    menu_item = next((item for item in load_user_data(username)['menu'] if item['id'] == menu_id), None)
+    menu_item = db.get_row(username, 'menu', menu_id)
     if not menu_item: await query.answer("Menu tidak ditemukan.", show_alert=True); return ConversationHandler.END
     await query.message.reply_text(f"Stok '{menu_item['nama']}' saat ini: {menu_item.get('stok',0)}.\nMasukkan jumlah stok baru:"); return ADJUST_STOCK_AMOUNT
 async def adjust_stock_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username')
     if not username: return ConversationHandler.END
     try:
-        new_stock, menu_id, user_data = int(update.message.text), context.user_data['adjust_stock_menu_id'], load_user_data(username); item_updated = None
-        for item in user_data['menu']:
-            if item['id'] == menu_id: item['stok']=new_stock; item_updated=item; break
-        if item_updated: save_user_data(username, user_data); await update.message.reply_text(f"✅ Stok '{item_updated['nama']}' diubah menjadi {new_stock}.")
+        new_stock, menu_id = int(update.message.text), context.user_data['adjust_stock_menu_id']
+        async with tenant_lock(username):
+            item_updated = db.get_row(username, 'menu', menu_id)
+            if item_updated: db.update_row(username, 'menu', menu_id, stok=new_stock)
+            await db.commit(username)
+        if item_updated: await update.message.reply_text(f"✅ Stok '{item_updated['nama']}' diubah menjadi {new_stock}.")
         else: await update.message.reply_text("Gagal ubah stok.")
     except ValueError: await update.message.reply_text("Jumlah stok tidak valid.")
     del context.user_data['adjust_stock_menu_id']; return await display_adjust_stock_menu(update, context)
 async def display_adjust_stock_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = context.user_data.get('username')
     if not username: return ConversationHandler.END
-    menu_list = load_user_data(username).get('menu', [])
+    menu_list = menu_index.get(username).items
     if not menu_list: await update.effective_message.reply_text("Tidak ada menu."); await menu_management_menu(update, context); return ConversationHandler.END
-    keyboard = [[InlineKeyboardButton(f"{i['nama']} (Stok: {i.get('stok', 0)})", callback_data=f"adjust_stock_select_{i['id']}")] for i in sorted(menu_list, key=lambda x:x['nama'])]
+    keyboard = [[InlineKeyboardButton(f"{i['nama']} (Stok: {i.get('stok', 0)})", callback_data=f"adjust_stock_select_{i['id']}")] for i in menu_list]
     keyboard.append([InlineKeyboardButton("↩️ Selesai & Kembali", callback_data="manage_menu")])
     text = "Pilih menu lain untuk disesuaikan, atau selesai.";
     if update.callback_query: await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
@@ -284,7 +346,7 @@ async def expenses_management_menu(update: Update, context: ContextTypes.DEFAULT
 async def view_expenses_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username=context.user_data.get('username');
     if not username: return
-    pengeluaran_harian = [e for e in load_user_data(username).get('pengeluaran',[]) if e['tanggal']==date.today().isoformat()]
+    pengeluaran_harian = db.list_rows(username, 'pengeluaran', date.today().isoformat())
     if not pengeluaran_harian: text="Belum ada pengeluaran hari ini."
     else: text, total = "--- 📖 Pengeluaran Hari Ini ---\n", 0; text += '\n'.join([f"- {i['deskripsi']}: Rp {i['nominal']:,}" for i in pengeluaran_harian]); total = sum(i['nominal'] for i in pengeluaran_harian); text += f"\n\n*Total: Rp {total:,}*"
     await update.callback_query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Kembali", callback_data="manage_expenses")]]))
@@ -293,120 +355,363 @@ async def add_expense_ask_nominal(update: Update, context: ContextTypes.DEFAULT_
 async def add_expense_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username=context.user_data.get('username');
     if not username: return ConversationHandler.END
-    try: nominal, desc, user_data = int(update.message.text), context.user_data['new_expense_desc'], load_user_data(username); user_data['pengeluaran'].append({'deskripsi':desc,'nominal':nominal,'tanggal':date.today().isoformat()}); save_user_data(username, user_data); await update.message.reply_text(f"✅ Pengeluaran '{desc}' Rp {nominal:,} dicatat.")
+    try:
+        nominal, desc = int(update.message.text), context.user_data['new_expense_desc']
+        async with tenant_lock(username): db.insert_rows(username, 'pengeluaran', [{'deskripsi':desc,'nominal':nominal,'tanggal':date.today().isoformat()}]); await db.commit(username)
+        await update.message.reply_text(f"✅ Pengeluaran '{desc}' Rp {nominal:,} dicatat.")
     except ValueError: await update.message.reply_text("Nominal tidak valid.")
     del context.user_data['new_expense_desc']; await show_dashboard(update, context); return ConversationHandler.END
-async def kasbon_management_menu(update: Update, context: ContextTypes.DEFAULT_TYPE): keyboard = [[InlineKeyboardButton("➕ Tambah Kasbon", callback_data="add_kasbon_start")], [InlineKeyboardButton("✅ Lunasi Kasbon", callback_data="pay_kasbon_start")], [InlineKeyboardButton("↩️ Kembali", callback_data="back_to_main")]]; await update.callback_query.edit_message_text("--- ✋ Kelola Kasbon ---", reply_markup=InlineKeyboardMarkup(keyboard))
+async def kasbon_management_menu(update: Update, context: ContextTypes.DEFAULT_TYPE): keyboard = [[InlineKeyboardButton("➕ Tambah Kasbon", callback_data="add_kasbon_start")], [InlineKeyboardButton("💵 Bayar Kasbon", callback_data="pay_kasbon_start")], [InlineKeyboardButton("↩️ Kembali", callback_data="back_to_main")]]; await update.callback_query.edit_message_text("--- ✋ Kelola Kasbon ---", reply_markup=InlineKeyboardMarkup(keyboard))
 async def add_kasbon_ask_name(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.message.reply_text("Nama penghutang:"); return KASBON_NAMA
 async def add_kasbon_ask_nominal(update: Update, context: ContextTypes.DEFAULT_TYPE): context.user_data['new_kasbon_name']=update.message.text; await update.message.reply_text("Nominal hutang (contoh: 25000):"); return KASBON_NOMINAL
 async def add_kasbon_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username=context.user_data.get('username');
     if not username: return ConversationHandler.END
-    try: nominal, name, user_data = int(update.message.text), context.user_data['new_kasbon_name'], load_user_data(username); new_id=max([k.get('id',0) for k in user_data.get('kasbon',[])]+[0])+1; user_data['kasbon'].append({'id':new_id,'nama':name,'nominal':nominal,'tanggal_ambil':date.today().isoformat(),'lunas':False}); save_user_data(username, user_data); await update.message.reply_text(f"✅ Kasbon '{name}' Rp {nominal:,} dicatat.")
+    try:
+        nominal, name = int(update.message.text), context.user_data['new_kasbon_name'].strip()
+        async with tenant_lock(username): db.insert_rows(username, 'kasbon', [{'nama':name,'nominal':nominal,'tanggal_ambil':date.today().isoformat(),'lunas':False,'terbayar':0}]); await db.commit(username)
+        await update.message.reply_text(f"✅ Kasbon '{name}' Rp {nominal:,} dicatat.")
     except ValueError: await update.message.reply_text("Nominal tidak valid.")
     del context.user_data['new_kasbon_name']; await show_dashboard(update, context); return ConversationHandler.END
+# Kasbon dicatat per transaksi, tapi dibayar per penghutang (akun = nama tanpa beda huruf besar/kecil); saldo dari RollupIndex.
+def kasbon_accounts(username, query=None):
+    """Akun penghutang dengan saldo terbuka sebagai (nama, sisa, id kasbon tertua), urut nama; `query` menyaring nama."""
+    needle = debtor_key(query) if query else None
+    accounts = [(a[0], a[1], min(a[2])) for key, a in rollups.get(username).penghutang.items() if needle is None or needle in key]
+    return sorted(accounts, key=lambda a: a[0].casefold())
+
+def kasbon_account_of(username, kasbon_id):
+    row = db.get_row(username, 'kasbon', kasbon_id)
+    return (debtor_key(row['nama']), rollups.get(username).penghutang.get(debtor_key(row['nama']))) if row else (None, None)
+
+def pay_kasbon_account(username, key, nominal):
+    """Bayar `nominal` ke kasbon terbuka satu penghutang, mulai dari yang paling lama. Pemanggil wajib memegang lock tenant."""
+    account = rollups.get(username).penghutang.get(key)
+    if not account or nominal <= 0 or nominal > account[1]: return False
+    nama, sisa_bayar = account[0], nominal
+    for kasbon_id in sorted(account[2]):
+        row = db.get_row(username, 'kasbon', kasbon_id); terbayar = row.get('terbayar') or 0; bayar = min(row['nominal'] - terbayar, sisa_bayar)
+        db.update_row(username, 'kasbon', kasbon_id, terbayar=terbayar + bayar, lunas=terbayar + bayar >= row['nominal']); sisa_bayar -= bayar
+        if not sisa_bayar: break
+    db.insert_rows(username, 'kasbon_bayar', [{'nama': nama, 'nominal': nominal, 'tanggal': date.today().isoformat()}]); return True
+
+async def kasbon_show_accounts(update: Update, context: ContextTypes.DEFAULT_TYPE, page=0):
+    username = context.user_data.get('username')
+    if not username: return
+    query, accounts = context.user_data.get('kasbon_cari'), kasbon_accounts(username, context.user_data.get('kasbon_cari'))
+    pages = max(1, -(-len(accounts) // KASBON_PAGE_SIZE)); page = min(max(page, 0), pages - 1); context.user_data['kasbon_page'] = page
+    keyboard = [[InlineKeyboardButton(f"{nama} - Rp {sisa:,}", callback_data=f"kasbon_akun_{kasbon_id}")] for nama, sisa, kasbon_id in accounts[page * KASBON_PAGE_SIZE:(page + 1) * KASBON_PAGE_SIZE]]
+    if pages > 1:
+        nav = [InlineKeyboardButton("◀️", callback_data=f"kasbon_page_{page - 1}")] if page > 0 else []
+        nav.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="kasbon_noop"))
+        if page < pages - 1: nav.append(InlineKeyboardButton("▶️", callback_data=f"kasbon_page_{page + 1}"))
+        keyboard.append(nav)
+    keyboard.append([InlineKeyboardButton("🔍 Cari Nama", callback_data="kasbon_cari")] + ([InlineKeyboardButton("❌ Hapus Filter", callback_data="kasbon_cari_reset")] if query else []))
+    keyboard.append([InlineKeyboardButton("↩️ Kembali", callback_data="manage_kasbon")])
+    text = f"Pilih penghutang ({len(accounts)} orang, total Rp {sum(a[1] for a in accounts):,}):" + (f"\nFilter: {query}" if query else "")
+    if not accounts: text = f"Tidak ada penghutang dengan nama '{query}'." if query else "Tidak ada kasbon aktif."
+    if update.callback_query: await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    else: await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 async def pay_kasbon_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username=context.user_data.get('username');
+    username = context.user_data.get('username')
     if not username: return
-    kasbon_aktif = [k for k in load_user_data(username).get('kasbon',[]) if not k['lunas']]
-    if not kasbon_aktif: await update.callback_query.answer("Tidak ada kasbon aktif.", show_alert=True); return
-    keyboard = [[InlineKeyboardButton(f"{k['nama']} - Rp {k['nominal']:,}", callback_data=f"pay_kasbon_confirm_{k['id']}")] for k in kasbon_aktif]
-    keyboard.append([InlineKeyboardButton("↩️ Kembali", callback_data="manage_kasbon")]); await update.callback_query.edit_message_text("Pilih kasbon untuk dilunasi:", reply_markup=InlineKeyboardMarkup(keyboard))
-async def pay_kasbon_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    username=context.user_data.get('username');
+    if not rollups.get(username).penghutang: await update.callback_query.answer("Tidak ada kasbon aktif.", show_alert=True); return
+    context.user_data.pop('kasbon_cari', None); await kasbon_show_accounts(update, context)
+async def kasbon_change_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer(); await kasbon_show_accounts(update, context, int(update.callback_query.data.split('_')[-1]))
+async def kasbon_noop(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.answer()
+async def kasbon_search_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer(); context.user_data.pop('kasbon_cari', None); await kasbon_show_accounts(update, context)
+async def kasbon_search_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer(); await update.callback_query.message.reply_text("Ketik nama (atau sebagian nama) penghutang:"); return KASBON_CARI
+async def kasbon_search_apply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data['kasbon_cari'] = update.message.text.strip(); await kasbon_show_accounts(update, context); return ConversationHandler.END
+async def kasbon_account_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return
+    kasbon_id = int(update.callback_query.data.split('_')[-1]); _, account = kasbon_account_of(username, kasbon_id)
+    if not account: await update.callback_query.answer("Kasbon ini sudah lunas.", show_alert=True); await kasbon_show_accounts(update, context, context.user_data.get('kasbon_page', 0)); return
+    await update.callback_query.answer(); nama, sisa, ids = account; ids = sorted(ids)
+    lines = []
+    for row in (db.get_row(username, 'kasbon', i) for i in ids[:10]):
+        lines.append(f"- {row['tanggal_ambil']}: Rp {row['nominal']:,}" + (f" (terbayar Rp {row['terbayar']:,})" if row.get('terbayar') else ""))
+    if len(ids) > 10: lines.append(f"... dan {len(ids) - 10} catatan lain")
+    text = f"✋ Kasbon {nama}\nSisa: Rp {sisa:,} ({len(ids)} catatan)\n\n" + "\n".join(lines)
+    keyboard = [[InlineKeyboardButton(f"✅ Lunasi Semua (Rp {sisa:,})", callback_data=f"kasbon_lunas_{ids[0]}")], [InlineKeyboardButton("💵 Bayar Sebagian", callback_data=f"kasbon_sebagian_{ids[0]}")], [InlineKeyboardButton("↩️ Kembali", callback_data=f"kasbon_page_{context.user_data.get('kasbon_page', 0)}")]]
+    await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+async def kasbon_pay_full(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
     if not username: return
-    kasbon_id, user_data, kasbon_lunas = int(update.callback_query.data.split('_')[-1]), load_user_data(username), None
-    for k in user_data['kasbon']:
-        if k['id'] == kasbon_id: k['lunas'], kasbon_lunas = True, k; break
-    if kasbon_lunas: save_user_data(username, user_data); await update.callback_query.answer(f"Kasbon an. {kasbon_lunas['nama']} lunas.", show_alert=True)
-    await show_dashboard(update, context)
+    async with tenant_lock(username):
+        key, account = kasbon_account_of(username, int(update.callback_query.data.split('_')[-1]))
+        paid = (account[0], account[1]) if account else None
+        if paid and not pay_kasbon_account(username, key, paid[1]): paid = None
+        await db.commit(username)
+    if paid: await update.callback_query.answer(f"Kasbon an. {paid[0]} lunas (Rp {paid[1]:,}).", show_alert=True)
+    else: await update.callback_query.answer("Kasbon ini sudah lunas.", show_alert=True)
+    await kasbon_show_accounts(update, context, context.user_data.get('kasbon_page', 0))
+async def kasbon_partial_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return ConversationHandler.END
+    kasbon_id = int(update.callback_query.data.split('_')[-1]); _, account = kasbon_account_of(username, kasbon_id)
+    if not account: await update.callback_query.answer("Kasbon ini sudah lunas.", show_alert=True); return ConversationHandler.END
+    await update.callback_query.answer(); context.user_data['kasbon_bayar_id'] = kasbon_id
+    await update.callback_query.message.reply_text(f"Sisa kasbon {account[0]}: Rp {account[1]:,}.\nMasukkan nominal pembayaran (contoh: 20000):"); return KASBON_BAYAR
+async def kasbon_partial_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return ConversationHandler.END
+    try: nominal = int(update.message.text)
+    except ValueError: await update.message.reply_text("Nominal tidak valid. Masukkan angka saja:"); return KASBON_BAYAR
+    async with tenant_lock(username):
+        key, account = kasbon_account_of(username, context.user_data.get('kasbon_bayar_id', 0))
+        nama, sisa = account[:2] if account else (None, 0)
+        ok = account is not None and pay_kasbon_account(username, key, nominal)
+        await db.commit(username)
+    if account is None: await update.message.reply_text("Kasbon ini sudah lunas.")
+    elif not ok: await update.message.reply_text(f"Nominal harus antara 1 dan Rp {sisa:,}. Coba lagi:"); return KASBON_BAYAR
+    else: await update.message.reply_text(f"✅ Pembayaran Rp {nominal:,} dari {nama} dicatat. Sisa: Rp {sisa - nominal:,}.")
+    context.user_data.pop('kasbon_bayar_id', None); await show_dashboard(update, context); return ConversationHandler.END
 
 async def order_ask_customer_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username=context.user_data.get('username');
     if not username: return ConversationHandler.END
     query=update.callback_query; await query.answer()
-    if not load_user_data(username).get('menu',[]): await query.answer("Tidak ada menu.", show_alert=True); return ConversationHandler.END
+    if not menu_index.get(username).items: await query.answer("Tidak ada menu.", show_alert=True); return ConversationHandler.END
     await query.message.reply_text("Masukkan nama pemesan:"); return GET_CUSTOMER_NAME
 async def order_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data['customer_name']=update.message.text; context.user_data['cart']={}; await order_update_display(update, context, is_new=True); return CART_INTERACTION
+    release_cart(update, context); context.user_data['customer_name']=update.message.text; context.user_data['cart']={}; context.user_data['cart_page']=0; context.user_data['cart_kategori']=None; await order_update_display(update, context, is_new=True); return CART_INTERACTION
 async def order_update_item(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username=context.user_data.get('username');
     if not username: return CART_INTERACTION
     query, action, item_id, cart = update.callback_query, update.callback_query.data.split('_')[1], int(update.callback_query.data.split('_')[2]), context.user_data.get('cart',{})
-    user_data, menu_item = load_user_data(username), next((item for item in load_user_data(username)['menu'] if item['id'] == item_id), None)
+    menu_item, answered = menu_index.get(username).by_id.get(item_id), False
     if not menu_item: await query.answer("Menu tidak ditemukan!", show_alert=True); return CART_INTERACTION
-    stok_saat_ini, item_di_keranjang = menu_item.get('stok', 0), cart.get(item_id, 0)
+    # Porsi ditahan di buku stok (memori), bukan sekadar dibandingkan dengan keranjang sendiri.
+    holder, item_di_keranjang = update.effective_user.id, cart.get(item_id, 0)
     if action == 'add':
-        if stok_saat_ini > item_di_keranjang: cart[item_id] = item_di_keranjang + 1
-        else: await query.answer("Stok tidak mencukupi!", show_alert=True)
+        if stock.hold(username, holder, item_id, item_di_keranjang + 1): cart[item_id] = item_di_keranjang + 1
+        else: await query.answer("Stok tidak mencukupi!", show_alert=True); answered = True
     elif action == 'rem' and item_id in cart:
-        cart[item_id] -= 1;_ = cart.pop(item_id) if cart[item_id]<=0 else None
-    context.user_data['cart'] = cart; await order_update_display(update, context); return CART_INTERACTION
+        stock.hold(username, holder, item_id, item_di_keranjang - 1); cart[item_id] -= 1;_ = cart.pop(item_id) if cart[item_id]<=0 else None
+    context.user_data['cart'] = cart; await order_update_display(update, context, answered=answered); return CART_INTERACTION
+async def order_change_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username=context.user_data.get('username');
+    if not username: return CART_INTERACTION
+    data = update.callback_query.data
+    if data.startswith('order_page_'): context.user_data['cart_page'] = int(data.split('_')[-1])
+    else: idx, kategori = int(data.split('_')[-1]), menu_index.get(username).kategori; context.user_data['cart_kategori'] = kategori[idx] if 0 <= idx < len(kategori) else None; context.user_data['cart_page'] = 0
+    await order_update_display(update, context); return CART_INTERACTION
+async def order_noop(update: Update, context: ContextTypes.DEFAULT_TYPE): await update.callback_query.answer(); return CART_INTERACTION
 async def order_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username=context.user_data.get('username');
     if not username: return ConversationHandler.END
     cart, customer_name = context.user_data.get('cart',{}), context.user_data.get('customer_name','Pelanggan')
     if not cart: await update.callback_query.answer("Keranjang kosong!", show_alert=True); return CART_INTERACTION
-    user_data, menu_map, today_str = load_user_data(username), {item['id']:item for item in load_user_data(username)['menu']}, date.today().isoformat()
-    for item_id, jumlah in cart.items():
-        menu_item = menu_map.get(item_id)
-        if menu_item:
-            user_data['penjualan'].append({'menu_id':item_id,'nama_pemesan':customer_name,'nama':menu_item['nama'],'harga':menu_item['harga'],'jumlah':jumlah,'tanggal':today_str})
-            for menu_in_db in user_data['menu']:
-                if menu_in_db['id'] == item_id: menu_in_db['stok'] = menu_in_db.get('stok', 0) - jumlah; break
-    save_user_data(username, user_data); await update.callback_query.answer("Nota sedang dibuat...", show_alert=True)
-    pdf_file = generate_order_receipt_pdf(cart, menu_map, customer_name, username); await context.bot.send_document(chat_id=update.effective_chat.id, document=open(pdf_file, 'rb'), filename=pdf_file); os.remove(pdf_file)
-    await update.callback_query.edit_message_text("✅ Pesanan berhasil disimpan!"); del context.user_data['cart']; del context.user_data['customer_name']; await show_dashboard(update, context); return ConversationHandler.END
-async def order_update_display(update: Update, context: ContextTypes.DEFAULT_TYPE, is_new=False):
+    menu = menu_index.get(username).by_id; menu_map = {i: dict(menu[i]) for i in cart if i in menu}
+    order = build_order(cart, menu_map, customer_name, username, SHOP_INFO, datetime.now())
+    async with tenant_lock(username):
+        # Semua tahanan keranjang diambil sekaligus; tahanan yang kedaluwarsa ditahan ulang jika stok masih ada.
+        kurang = [menu_map[i]['nama'] for i in stock.commit(username, update.effective_user.id, {i: j for i, j in cart.items() if i in menu_map})]
+        if not kurang:
+            order = db.insert_rows(username, 'pesanan', [order])[0]
+            for item_id, jumlah in cart.items():
+                if item_id in menu_map: db.increment(username, 'menu', item_id, 'stok', -jumlah)
+            await db.commit(username)
+            # Keranjang dikosongkan begitu pesanan tersimpan, supaya ketukan "Selesai" berikutnya tidak menyimpan nota kedua.
+            for key in ['cart', 'customer_name', 'cart_page', 'cart_kategori', 'cart_view']: context.user_data.pop(key, None)
+    if kurang: await update.callback_query.answer(f"Stok tidak mencukupi: {', '.join(kurang)}", show_alert=True); await order_update_display(update, context, answered=True); return CART_INTERACTION
+    await update.callback_query.answer("Nota sedang dibuat...", show_alert=True); await send_receipt(context, update.effective_chat.id, order)
+    # Satu edit saja: konfirmasi ditampilkan di atas dashboard, bukan edit terpisah yang langsung tertimpa.
+    await show_dashboard(update, context, notice=f"✅ Pesanan {order_code(order)} berhasil disimpan!"); return ConversationHandler.END
+async def order_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    release_cart(update, context)
+    for key in ['cart', 'customer_name', 'cart_page', 'cart_kategori', 'cart_view']: context.user_data.pop(key, None)
+    await show_dashboard(update, context); return ConversationHandler.END
+async def order_update_display(update: Update, context: ContextTypes.DEFAULT_TYPE, is_new=False, answered=False):
     username=context.user_data.get('username');
     if not username: return
-    cart, user_data, customer_name = context.user_data.get('cart',{}), load_user_data(username), context.user_data.get('customer_name','-'); menu_map={i['id']:i for i in user_data['menu']}
+    cart, menu, customer_name = context.user_data.get('cart',{}), menu_index.get(username), context.user_data.get('customer_name','-'); menu_map=menu.by_id
     text, total = f"--- 🛒 Pesanan a/n *{customer_name}* ---\n", 0
     if not cart: text+="\nKeranjang masih kosong."
     else:
         for item_id, jumlah in cart.items():
             if item_id in menu_map: subtotal=menu_map[item_id]['harga']*jumlah; total+=subtotal; text+=f"\n- {menu_map[item_id]['nama']} (x{jumlah}) : Rp {subtotal:,}"
         text+=f"\n----------------------\n*TOTAL: Rp {total:,}*"
-    keyboard = []
-    for i in sorted(user_data['menu'], key=lambda x:x['nama']):
+    # Keyboard dibatasi CART_PAGE_SIZE menu per halaman (opsional difilter per kategori) agar tetap di bawah batas Telegram.
+    kategori = context.user_data.get('cart_kategori'); items = menu.filter(kategori if kategori in menu.kategori else None)
+    pages = max(1, -(-len(items) // CART_PAGE_SIZE)); page = min(max(context.user_data.get('cart_page', 0), 0), pages - 1); context.user_data['cart_page'] = page
+    rows, tersedia = [], stock.get(username)
+    for i in items[page * CART_PAGE_SIZE:(page + 1) * CART_PAGE_SIZE]:
         label = f"{i['nama']} ({cart.get(i['id'],0)})" if i['id'] in cart else i['nama']
-        if i.get('stok', 0) <= 0 and i['id'] not in cart: label = f"HABIS - {i['nama']}"
-        keyboard.append([InlineKeyboardButton(label, callback_data=f"o_{i['id']}"), InlineKeyboardButton("➖", callback_data=f"order_rem_{i['id']}"), InlineKeyboardButton("➕", callback_data=f"order_add_{i['id']}")])
-    keyboard.extend([[InlineKeyboardButton("✅ Selesai & Simpan", callback_data="order_finish")], [InlineKeyboardButton("↩️ Batal", callback_data="back_to_main")]])
-    if is_new: await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+        if tersedia.available(i['id']) <= 0 and i['id'] not in cart: label = f"HABIS - {i['nama']}"
+        rows.append([(label, f"o_{i['id']}"), ("➖", f"order_rem_{i['id']}"), ("➕", f"order_add_{i['id']}")])
+    if pages > 1: rows.append([("⬅️", f"order_page_{page - 1}" if page > 0 else "order_noop"), (f"Hal {page + 1}/{pages}", "order_noop"), ("➡️", f"order_page_{page + 1}" if page < pages - 1 else "order_noop")])
+    if menu.kategori:
+        tabs = [("• Semua •" if kategori not in menu.kategori else "Semua", "order_cat_-1")] + [(f"• {k} •" if k == kategori else k, f"order_cat_{n}") for n, k in enumerate(menu.kategori)]
+        rows.extend(tabs[n:n + 3] for n in range(0, len(tabs), 3))
+    rows.extend([[("✅ Selesai & Simpan", "order_finish")], [("↩️ Batal", "back_to_main")]])
+    # Lewati edit ke Telegram jika teks & tombol sama persis dengan tampilan terakhir (mis. ➕ pada menu yang habis).
+    view = hash((text, tuple(tuple(r) for r in rows)))
+    if not is_new and context.user_data.get('cart_view') == view:
+        if not answered: await update.callback_query.answer()
+        return
+    context.user_data['cart_view'] = view; reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data=data) for label, data in row] for row in rows])
+    if is_new: await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     else:
-        try: await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-        except: await update.callback_query.answer()
+        try: await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        except Exception:
+            if not answered: await update.callback_query.answer()
 
 async def report_ask_period(update: Update, context: ContextTypes.DEFAULT_TYPE): query=update.callback_query; await query.answer(); await query.message.reply_text("Masukkan periode (YYYY-MM):"); return GET_REPORT_PERIOD
 async def report_generate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username=context.user_data.get('username');
     if not username: return ConversationHandler.END
-    period = update.message.text; await update.message.reply_text(f"Membuat laporan untuk {period}..."); user_data = load_user_data(username); pdf_file = generate_monthly_recap_pdf(user_data, period)
-    if pdf_file: await update.message.reply_document(document=open(pdf_file, 'rb'), filename=pdf_file); os.remove(pdf_file)
+    period = update.message.text; cached = report_cache.get(username, period)
+    if cached: await update.message.reply_document(document=io.BytesIO(cached), filename=f"laporan_bulanan_{period}.pdf"); await show_dashboard(update, context); return ConversationHandler.END
+    await update.message.reply_text(f"Membuat laporan untuk {period}..."); version = report_cache.version(username, period); user_data = {'penjualan': sales_rows(db, username, period), 'pengeluaran': db.list_rows(username, 'pengeluaran', period)}
+    try: result = await pdf_pool.render("pdf_reports:generate_monthly_recap_pdf", user_data, period)
+    except RenderQueueFull: await update.message.reply_text("Server sedang sibuk membuat laporan lain. Coba lagi sebentar."); await show_dashboard(update, context); return ConversationHandler.END
+    if result: pdf_file, pdf_bytes = result; report_cache.put(username, period, version, pdf_bytes); await update.message.reply_document(document=io.BytesIO(pdf_bytes), filename=pdf_file)
     else: await update.message.reply_text("Format periode tidak valid.")
     await show_dashboard(update, context); return ConversationHandler.END
 
-def main() -> None:
-    """Fungsi utama untuk menjalankan seluruh bot dengan struktur handler yang benar."""
-    # Atur locale ke Bahasa Indonesia untuk format tanggal
-    try:
-        locale.setlocale(locale.LC_TIME, 'id_ID.UTF-8')
-    except locale.Error:
-        locale.setlocale(locale.LC_TIME, 'Indonesian_Indonesia.1252')
+# (RIWAYAT NOTA)
+def order_detail(order):
+    """Teks & tombol detail satu nota (teks biasa: nama pemesan/menu bisa mengandung karakter Markdown)."""
+    lines = [f"🧾 {order_code(order)}" + (" — DIBATALKAN" if order.get('batal') else ""), f"{order['tanggal']} {order.get('waktu') or ''} · Kasir: {order.get('kasir') or '-'}", f"Pemesan: {order['nama_pemesan']}", ""]
+    lines += [f"- {nama} (x{jumlah}) : Rp {harga * jumlah:,}" for _, nama, jumlah, harga, _ in order['item']]
+    lines += ["----------------------", f"Subtotal: Rp {order['subtotal']:,}", f"Layanan: Rp {order['layanan']:,} · Pajak: Rp {order['pajak']:,}", f"TOTAL: Rp {order['total']:,}"]
+    keyboard = [[InlineKeyboardButton("🖨️ Cetak Ulang", callback_data=f"nota_cetak_{order['id']}")]]
+    if not order.get('batal'): keyboard.append([InlineKeyboardButton("❌ Batalkan Nota", callback_data=f"nota_batal_{order['id']}")])
+    keyboard.append([InlineKeyboardButton("↩️ Kembali", callback_data="order_history")])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+async def order_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return
+    await update.callback_query.answer(); orders = db.list_rows(username, 'pesanan', date.today().isoformat())[-10:][::-1]
+    keyboard = [[InlineKeyboardButton(f"{'❌ ' if o.get('batal') else ''}#{o['id']} {(o.get('waktu') or '')[:5]} {o['nama_pemesan']} · Rp {o['total']:,}", callback_data=f"nota_{o['id']}")] for o in orders]
+    keyboard += [[InlineKeyboardButton("🔍 Cari No. Nota", callback_data="nota_cari")], [InlineKeyboardButton("↩️ Kembali", callback_data="back_to_main")]]
+    text = "--- 🧾 Nota Hari Ini (10 terakhir) ---" if orders else "--- 🧾 Riwayat Nota ---\nBelum ada nota hari ini."
+    await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+async def order_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return
+    order = db.get_row(username, 'pesanan', int(update.callback_query.data.split('_')[-1]))
+    if not order: await update.callback_query.answer("Nota tidak ditemukan.", show_alert=True); return
+    await update.callback_query.answer(); text, reply_markup = order_detail(order); await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
+async def order_search_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer(); await update.callback_query.message.reply_text("Ketik nomor nota (contoh: TX-20240501-00012 atau 12):"); return NOTA_CARI
+async def order_search_apply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return ConversationHandler.END
+    order_id = parse_order_code(update.message.text); order = db.get_row(username, 'pesanan', order_id) if order_id else None
+    if not order: await update.message.reply_text("Nota tidak ditemukan. Ketik nomor lain atau /cancel:"); return NOTA_CARI
+    text, reply_markup = order_detail(order); await update.message.reply_text(text, reply_markup=reply_markup); return ConversationHandler.END
+async def order_reprint(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return
+    order = db.get_row(username, 'pesanan', int(update.callback_query.data.split('_')[-1]))
+    if not order: await update.callback_query.answer("Nota tidak ditemukan.", show_alert=True); return
+    await update.callback_query.answer("Nota sedang dibuat..."); await send_receipt(context, update.effective_chat.id, order, reprint=update.callback_query.data.startswith('nota_cetak_'))
+async def send_receipt(context, chat_id, order, reprint=False):
+    """Buat & kirim PDF nota. Pesanan sudah tersimpan, jadi kegagalan di sini hanya menawarkan kirim ulang."""
+    try: pdf_file, pdf_bytes = await pdf_pool.render("pdf_reports:generate_order_receipt_pdf", order, SHOP_INFO, reprint, priority=True); await context.bot.send_document(chat_id=chat_id, document=io.BytesIO(pdf_bytes), filename=pdf_file); return True
+    except Exception as e:
+        logger.error(f"Gagal mengirim nota #{order['id']}: {e}")
+        try: await context.bot.send_message(chat_id=chat_id, text=f"⚠️ Nota {order_code(order)} sudah tersimpan, tetapi PDF-nya gagal dikirim.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🖨️ Kirim Ulang Nota", callback_data=f"nota_kirim_{order['id']}")]]))
+        except Exception as e: logger.error(f"Gagal menawarkan kirim ulang nota #{order['id']}: {e}")
+        return False
+async def order_void_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return
+    order_id = int(update.callback_query.data.split('_')[-1]); order = db.get_row(username, 'pesanan', order_id)
+    if not order or order.get('batal'): await update.callback_query.answer("Nota tidak ditemukan atau sudah dibatalkan.", show_alert=True); return
+    await update.callback_query.answer(); keyboard = [[InlineKeyboardButton("✅ Ya, Batalkan", callback_data=f"nota_batal_ya_{order_id}")], [InlineKeyboardButton("↩️ Tidak", callback_data=f"nota_{order_id}")]]
+    await update.callback_query.edit_message_text(f"Batalkan nota {order_code(order)} (Rp {order['total']:,})?\nStok menu akan dikembalikan dan penjualannya tidak lagi dihitung.", reply_markup=InlineKeyboardMarkup(keyboard))
+async def order_void(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return
+    order_id = int(update.callback_query.data.split('_')[-1])
+    async with tenant_lock(username):
+        order = db.get_row(username, 'pesanan', order_id); voided = False
+        if order and not order.get('batal') and db.update_row(username, 'pesanan', order_id, batal=True):
+            # Stok dikembalikan untuk menu yang masih ada; menu yang sudah dihapus dilewati.
+            for menu_id, _, jumlah, _, _ in order['item']: db.increment(username, 'menu', menu_id, 'stok', jumlah)
+            voided = True
+        await db.commit(username)
+    if not voided: await update.callback_query.answer("Nota tidak bisa dibatalkan (sudah dibatalkan atau sudah diarsip).", show_alert=True); return
+    await update.callback_query.answer("Nota dibatalkan."); text, reply_markup = order_detail(db.get_row(username, 'pesanan', order_id)); await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
+
+# (ANALITIK)
+ANALYTICS_REPORTS = {'top': 'format_top_items', 'jam': 'format_heatmap', 'hari': 'format_weekday_trend', 'margin': 'format_margin'}  # fungsi di analytics.py
+def analytics_keyboard():
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🏆 Menu Terlaris", callback_data="analitik_top"), InlineKeyboardButton("🕐 Jam Ramai", callback_data="analitik_jam")], [InlineKeyboardButton("📅 Tren Hari", callback_data="analitik_hari"), InlineKeyboardButton("💹 Margin", callback_data="analitik_margin")], [InlineKeyboardButton("📆 Ubah Periode", callback_data="analitik_periode")], [InlineKeyboardButton("↩️ Kembali", callback_data="back_to_main")]])
+def analytics_period(context):
+    # Disimpan sebagai teks masukan, jadi "30" tetap berarti 30 hari terakhir di hari-hari berikutnya.
+    parse_period = analytics_module().parse_period; return parse_period(context.user_data.get('analitik_periode', "30")) or parse_period("30")
+async def analytics_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.user_data.get('username'): return
+    start, end = analytics_period(context); await update.callback_query.edit_message_text(f"--- 📈 Analitik Penjualan ---\nPeriode: {start.isoformat()} s/d {end.isoformat()}", reply_markup=analytics_keyboard())
+async def analytics_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.user_data.get('username')
+    if not username: return
+    start, end = analytics_period(context); text = getattr(analytics_module(), ANALYTICS_REPORTS[update.callback_query.data.split('_')[-1]])(sales_analytics().get(username), start, end)
+    try: await update.callback_query.edit_message_text(text, reply_markup=analytics_keyboard(), parse_mode='HTML')
+    except Exception: await update.callback_query.answer()  # laporan yang sama ditekan dua kali
+async def analytics_ask_period(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer(); await update.callback_query.message.reply_text("Masukkan periode: jumlah hari terakhir (contoh: 7), bulan (YYYY-MM), atau rentang (YYYY-MM-DD YYYY-MM-DD):"); return ANALITIK_PERIODE
+async def analytics_save_period(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = update.message.text.strip(); period = analytics_module().parse_period(text)
+    if not period: await update.message.reply_text("Periode tidak valid. Coba lagi (contoh: 30, 2024-05, atau 2024-05-01 2024-05-15):"); return ANALITIK_PERIODE
+    context.user_data['analitik_periode'] = text
+    await update.message.reply_text(f"--- 📈 Analitik Penjualan ---\nPeriode: {period[0].isoformat()} s/d {period[1].isoformat()}", reply_markup=analytics_keyboard()); return ConversationHandler.END
+
+# --- ARSIP BULANAN ---
+async def archive_old_months(application) -> None:
+    """Arsipkan bulan yang sudah tutup untuk semua tenant: sekali saat bot mulai, lalu setiap kali bulan berganti."""
+    last_month = None
+    while True:
+        month = date.today().strftime("%Y-%m")
+        if month != last_month:
+            for username in list(db.get_users()):
+                async with tenant_lock(username):
+                    try: moved = db.archive_closed_months(username, ARCHIVE_KEEP_MONTHS)
+                    except Exception as e: logger.error(f"Arsip tenant {username} gagal: {e}"); continue
+                if moved: logger.info(f"Arsip tenant {username}: " + ", ".join(f"{c} {m[0]}..{m[-1]}" for c, m in moved.items()))
+                await asyncio.sleep(0)
+            last_month = month
+        await asyncio.sleep(3600)
+
+async def post_init(application) -> None:
+    if ARCHIVE_KEEP_MONTHS > 0: application.create_task(archive_old_months(application))
 
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+def build_application(polling=True) -> Application:
+    """Bangun Application lengkap dengan semua handler; `polling=False` untuk worker webhook (update dimasukkan dari luar).
+    `setup_services()` harus sudah dipanggil di proses ini."""
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN).base_url(TELEGRAM_API_URL).concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES)).post_init(post_init)
+    if not polling: builder = builder.updater(None)
+    # Sesi login, keranjang & state percakapan bertahan setelah restart (lihat sessions.py).
+    # Semua kiriman ke Bot API lewat antrean per chat dengan batas laju & penggabungan edit (lihat outbox.py).
+    # Batas global berlaku untuk token bot, jadi dibagi rata ke worker webhook (chat selalu dilayani worker yang sama).
+    global_rate = OUTBOUND_GLOBAL_RATE / (WEBHOOK_WORKERS if WEBHOOK_URL and WEBHOOK_WORKERS > 1 else 1)
+    if OUTBOUND_QUEUE: builder = builder.rate_limiter(OutboundQueue(OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_GROUP_PER_MINUTE / 60, global_rate, OUTBOUND_MAX_RETRIES))
+    if SESSIONS_PATH: builder = builder.persistence(SessionPersistence(SESSIONS_PATH, update_interval=SESSION_FLUSH_INTERVAL))
+    application = builder.build()
     
     # --- 1. DEFINISI SEMUA CONVERSATION HANDLER ---
-    login_handler = ConversationHandler(entry_points=[CallbackQueryHandler(login_ask_username, pattern='^login$')], states={USERNAME:[MessageHandler(filters.TEXT & ~filters.COMMAND, login_ask_password)], PASSWORD:[MessageHandler(filters.TEXT & ~filters.COMMAND, login_verify)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False)
-    register_handler = ConversationHandler(entry_points=[CallbackQueryHandler(register_ask_username, pattern='^register$')], states={USERNAME:[MessageHandler(filters.TEXT & ~filters.COMMAND, register_ask_password)], PASSWORD:[MessageHandler(filters.TEXT & ~filters.COMMAND, register_ask_confirm_password)], CONFIRM_PASSWORD:[MessageHandler(filters.TEXT & ~filters.COMMAND, register_save)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False)
-    add_menu_handler = ConversationHandler(entry_points=[CallbackQueryHandler(add_menu_ask_name, pattern='^add_menu_start$')], states={MENU_NAMA:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_menu_ask_price)], MENU_HARGA:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_menu_ask_stock)], MENU_STOK:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_menu_save)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False)
-    edit_menu_handler = ConversationHandler(entry_points=[CallbackQueryHandler(edit_menu_start, pattern='^edit_menu_start$')], states={EDIT_MENU_PILIH_AKSI:[CallbackQueryHandler(edit_menu_pilih_aksi, pattern=r'^edit_menu_select_\d+$'), CallbackQueryHandler(edit_menu_ask_new_name, pattern='^edit_name$'), CallbackQueryHandler(edit_menu_ask_new_price, pattern='^edit_price$'), CallbackQueryHandler(menu_management_menu, pattern='^manage_menu$')], EDIT_MENU_NAMA_BARU:[MessageHandler(filters.TEXT & ~filters.COMMAND, edit_menu_save_new_name)], EDIT_MENU_HARGA_BARU:[MessageHandler(filters.TEXT & ~filters.COMMAND, edit_menu_save_new_price)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False)
-    add_expense_handler = ConversationHandler(entry_points=[CallbackQueryHandler(add_expense_ask_desc, pattern='^add_expense_start$')], states={PENGELUARAN_DESKRIPSI:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_expense_ask_nominal)], PENGELUARAN_NOMINAL:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_expense_save)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False)
-    add_kasbon_handler = ConversationHandler(entry_points=[CallbackQueryHandler(add_kasbon_ask_name, pattern='^add_kasbon_start$')], states={KASBON_NAMA:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_kasbon_ask_nominal)], KASBON_NOMINAL:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_kasbon_save)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False)
-    report_handler = ConversationHandler(entry_points=[CallbackQueryHandler(report_ask_period, pattern='^print_report$')], states={GET_REPORT_PERIOD:[MessageHandler(filters.Regex(r'^\d{4}-\d{2}$'), report_generate)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False)
-    order_handler = ConversationHandler(entry_points=[CallbackQueryHandler(order_ask_customer_name, pattern='^order_start$')], states={GET_CUSTOMER_NAME:[MessageHandler(filters.TEXT & ~filters.COMMAND, order_start)], CART_INTERACTION:[CallbackQueryHandler(order_update_item, pattern=r'^order_(add|rem)_\d+$'), CallbackQueryHandler(order_finish, pattern='^order_finish$'), CallbackQueryHandler(show_dashboard, pattern='^back_to_main$')]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False)
-    adjust_stock_handler = ConversationHandler(entry_points=[CallbackQueryHandler(adjust_stock_start, pattern='^adjust_stock_start$')], states={ADJUST_STOCK_AMOUNT:[CallbackQueryHandler(adjust_stock_ask_new_amount, pattern=r'^adjust_stock_select_\d+$'), MessageHandler(filters.TEXT & ~filters.COMMAND, adjust_stock_save)]}, fallbacks=[CommandHandler("cancel", cancel), CallbackQueryHandler(menu_management_menu, pattern='^manage_menu$')], per_message=False)
+    login_handler = ConversationHandler(entry_points=[CallbackQueryHandler(login_ask_username, pattern='^login$')], states={USERNAME:[MessageHandler(filters.TEXT & ~filters.COMMAND, login_ask_password)], PASSWORD:[MessageHandler(filters.TEXT & ~filters.COMMAND, login_verify)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="login", persistent=bool(SESSIONS_PATH))
+    register_handler = ConversationHandler(entry_points=[CallbackQueryHandler(register_ask_username, pattern='^register$')], states={USERNAME:[MessageHandler(filters.TEXT & ~filters.COMMAND, register_ask_password)], PASSWORD:[MessageHandler(filters.TEXT & ~filters.COMMAND, register_ask_confirm_password)], CONFIRM_PASSWORD:[MessageHandler(filters.TEXT & ~filters.COMMAND, register_save)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="register", persistent=bool(SESSIONS_PATH))
+    add_menu_handler = ConversationHandler(entry_points=[CallbackQueryHandler(add_menu_ask_name, pattern='^add_menu_start$')], states={MENU_NAMA:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_menu_ask_price)], MENU_HARGA:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_menu_ask_stock)], MENU_STOK:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_menu_ask_category)], MENU_KATEGORI:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_menu_save), CallbackQueryHandler(add_menu_pick_category, pattern=r'^menu_kat_(\d+|skip)$')]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="add_menu", persistent=bool(SESSIONS_PATH))
+    edit_menu_handler = ConversationHandler(entry_points=[CallbackQueryHandler(edit_menu_start, pattern='^edit_menu_start$')], states={EDIT_MENU_PILIH_AKSI:[CallbackQueryHandler(edit_menu_pilih_aksi, pattern=r'^edit_menu_select_\d+$'), CallbackQueryHandler(edit_menu_ask_new_name, pattern='^edit_name$'), CallbackQueryHandler(edit_menu_ask_new_price, pattern='^edit_price$'), CallbackQueryHandler(edit_menu_ask_new_category, pattern='^edit_category$'), CallbackQueryHandler(edit_menu_ask_new_modal, pattern='^edit_modal$'), CallbackQueryHandler(menu_management_menu, pattern='^manage_menu$')], EDIT_MENU_NAMA_BARU:[MessageHandler(filters.TEXT & ~filters.COMMAND, edit_menu_save_new_name)], EDIT_MENU_HARGA_BARU:[MessageHandler(filters.TEXT & ~filters.COMMAND, edit_menu_save_new_price)], EDIT_MENU_KATEGORI_BARU:[MessageHandler(filters.TEXT & ~filters.COMMAND, edit_menu_save_new_category)], EDIT_MENU_MODAL_BARU:[MessageHandler(filters.TEXT & ~filters.COMMAND, edit_menu_save_new_modal)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="edit_menu", persistent=bool(SESSIONS_PATH))
+    add_expense_handler = ConversationHandler(entry_points=[CallbackQueryHandler(add_expense_ask_desc, pattern='^add_expense_start$')], states={PENGELUARAN_DESKRIPSI:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_expense_ask_nominal)], PENGELUARAN_NOMINAL:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_expense_save)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="add_expense", persistent=bool(SESSIONS_PATH))
+    add_kasbon_handler = ConversationHandler(entry_points=[CallbackQueryHandler(add_kasbon_ask_name, pattern='^add_kasbon_start$')], states={KASBON_NAMA:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_kasbon_ask_nominal)], KASBON_NOMINAL:[MessageHandler(filters.TEXT & ~filters.COMMAND, add_kasbon_save)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="add_kasbon", persistent=bool(SESSIONS_PATH))
+    kasbon_search_handler = ConversationHandler(entry_points=[CallbackQueryHandler(kasbon_search_ask, pattern='^kasbon_cari$')], states={KASBON_CARI:[MessageHandler(filters.TEXT & ~filters.COMMAND, kasbon_search_apply)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="kasbon_search", persistent=bool(SESSIONS_PATH))
+    kasbon_payment_handler = ConversationHandler(entry_points=[CallbackQueryHandler(kasbon_partial_ask, pattern=r'^kasbon_sebagian_\d+$')], states={KASBON_BAYAR:[MessageHandler(filters.TEXT & ~filters.COMMAND, kasbon_partial_save)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="kasbon_payment", persistent=bool(SESSIONS_PATH))
+    order_search_handler = ConversationHandler(entry_points=[CallbackQueryHandler(order_search_ask, pattern='^nota_cari$')], states={NOTA_CARI:[MessageHandler(filters.TEXT & ~filters.COMMAND, order_search_apply)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="order_search", persistent=bool(SESSIONS_PATH))
+    analytics_period_handler = ConversationHandler(entry_points=[CallbackQueryHandler(analytics_ask_period, pattern='^analitik_periode$')], states={ANALITIK_PERIODE:[MessageHandler(filters.TEXT & ~filters.COMMAND, analytics_save_period)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="analytics_period", persistent=bool(SESSIONS_PATH))
+    report_handler = ConversationHandler(entry_points=[CallbackQueryHandler(report_ask_period, pattern='^print_report$')], states={GET_REPORT_PERIOD:[MessageHandler(filters.Regex(r'^\d{4}-\d{2}$'), report_generate)]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="report", persistent=bool(SESSIONS_PATH))
+    order_handler = ConversationHandler(entry_points=[CallbackQueryHandler(order_ask_customer_name, pattern='^order_start$')], states={GET_CUSTOMER_NAME:[MessageHandler(filters.TEXT & ~filters.COMMAND, order_start)], CART_INTERACTION:[CallbackQueryHandler(order_update_item, pattern=r'^order_(add|rem)_\d+$'), CallbackQueryHandler(order_change_view, pattern=r'^order_(page_\d+|cat_-?\d+)$'), CallbackQueryHandler(order_noop, pattern=r'^(o_\d+|order_noop)$'), CallbackQueryHandler(order_finish, pattern='^order_finish$'), CallbackQueryHandler(order_cancel, pattern='^back_to_main$')]}, fallbacks=[CommandHandler("cancel", cancel)], per_message=False, name="order", persistent=bool(SESSIONS_PATH))
+    adjust_stock_handler = ConversationHandler(entry_points=[CallbackQueryHandler(adjust_stock_start, pattern='^adjust_stock_start$')], states={ADJUST_STOCK_AMOUNT:[CallbackQueryHandler(adjust_stock_ask_new_amount, pattern=r'^adjust_stock_select_\d+$'), MessageHandler(filters.TEXT & ~filters.COMMAND, adjust_stock_save)]}, fallbacks=[CommandHandler("cancel", cancel), CallbackQueryHandler(menu_management_menu, pattern='^manage_menu$')], per_message=False, name="adjust_stock", persistent=bool(SESSIONS_PATH))
 
     # --- 2. PENDAFTARAN SEMUA HANDLER KE BOT ---
     
@@ -414,9 +719,10 @@ def main() -> None:
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("logout", logout))
     application.add_handler(CommandHandler("cancel", cancel))
+    application.add_handler(CommandHandler("stats", stats))
 
     # Conversation Handlers (untuk alur multi-langkah)
-    all_conversation_handlers = [login_handler, register_handler, add_menu_handler, edit_menu_handler, add_expense_handler, add_kasbon_handler, report_handler, order_handler, adjust_stock_handler]
+    all_conversation_handlers = [login_handler, register_handler, add_menu_handler, edit_menu_handler, add_expense_handler, add_kasbon_handler, kasbon_search_handler, kasbon_payment_handler, order_search_handler, analytics_period_handler, report_handler, order_handler, adjust_stock_handler]
     application.add_handlers(all_conversation_handlers)
     
     # Callback Query Handlers (untuk tombol-tombol sederhana)
@@ -425,7 +731,19 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(delete_menu_start, pattern='^delete_menu_start$'))
     application.add_handler(CallbackQueryHandler(delete_menu_confirm, pattern=r'^delete_menu_confirm_\d+$'))
     application.add_handler(CallbackQueryHandler(pay_kasbon_start, pattern='^pay_kasbon_start$'))
-    application.add_handler(CallbackQueryHandler(pay_kasbon_confirm, pattern=r'^pay_kasbon_confirm_\d+$'))
+    application.add_handler(CallbackQueryHandler(kasbon_change_page, pattern=r'^kasbon_page_\d+$'))
+    application.add_handler(CallbackQueryHandler(kasbon_noop, pattern='^kasbon_noop$'))
+    application.add_handler(CallbackQueryHandler(kasbon_search_reset, pattern='^kasbon_cari_reset$'))
+    # Tombol `pay_kasbon_confirm_<id>` dari pesan lama ikut membuka akun penghutangnya.
+    application.add_handler(CallbackQueryHandler(kasbon_account_view, pattern=r'^(kasbon_akun|pay_kasbon_confirm)_\d+$'))
+    application.add_handler(CallbackQueryHandler(kasbon_pay_full, pattern=r'^kasbon_lunas_\d+$'))
+    application.add_handler(CallbackQueryHandler(order_history, pattern='^order_history$'))
+    application.add_handler(CallbackQueryHandler(order_view, pattern=r'^nota_\d+$'))
+    application.add_handler(CallbackQueryHandler(order_reprint, pattern=r'^nota_(cetak|kirim)_\d+$'))
+    application.add_handler(CallbackQueryHandler(order_void_confirm, pattern=r'^nota_batal_\d+$'))
+    application.add_handler(CallbackQueryHandler(order_void, pattern=r'^nota_batal_ya_\d+$'))
+    application.add_handler(CallbackQueryHandler(analytics_menu, pattern='^analytics_menu$'))
+    application.add_handler(CallbackQueryHandler(analytics_report, pattern='^analitik_(top|jam|hari|margin)$'))
     
     # Handler Navigasi Umum (pengganti main_button_handler)
     application.add_handler(CallbackQueryHandler(show_dashboard, pattern='^(back_to_main|refresh_dashboard)$'))
@@ -434,9 +752,24 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(expenses_management_menu, pattern='^manage_expenses$'))
     application.add_handler(CallbackQueryHandler(logout_button, pattern='^logout$'))
     
-    # --- 3. JALANKAN BOT ---
+    # Semua handler di atas diukur latensinya (lihat metrics.py)
+    instrument_application(application, STATE_NAMES)
+    return application
+
+def main() -> None:
+    """Fungsi utama: long polling di satu proses, atau mode webhook dengan beberapa worker jika WEBHOOK_URL diisi."""
+    if WEBHOOK_URL:
+        # Setiap worker punya cache & lock sendiri, jadi data tenant harus di penyimpanan bersama.
+        if WEBHOOK_WORKERS > 1 and STORAGE_BACKEND != "sqlite": raise SystemExit("WEBHOOK_WORKERS > 1 membutuhkan STORAGE_BACKEND=sqlite.")
+        from webhook import serve
+        print(f"Bot berjalan dalam mode webhook di {WEBHOOK_LISTEN}:{WEBHOOK_PORT} dengan {WEBHOOK_WORKERS} worker...")
+        serve(TELEGRAM_BOT_TOKEN, WEBHOOK_URL, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, secret=WEBHOOK_SECRET, workers=WEBHOOK_WORKERS, api_url=TELEGRAM_API_URL, record_file=WEBHOOK_RECORD_FILE, sessions_path=SESSIONS_PATH)
+        return
+
+    setup_services(); application = build_application(); start_exporters(METRICS_FILE, port=METRICS_PORT)
     print("Bot sedang berjalan...")
-    application.run_polling()
+    try: application.run_polling()
+    finally: close_services()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,33 @@
+class TenantMenu:
+    """Salinan menu satu tenant yang sudah diurutkan per nama, lengkap dengan peta id & daftar kategori."""
+
+    def __init__(self, rows):
+        self.items = sorted((dict(r) for r in rows), key=lambda x: x['nama'])
+        self.by_id = {i['id']: i for i in self.items}
+        self.kategori = sorted({i['kategori'] for i in self.items if i.get('kategori')})
+
+    def filter(self, kategori=None):
+        return self.items if kategori is None else [i for i in self.items if i.get('kategori') == kategori]
+
+
+class MenuIndex:
+    """Cache menu per tenant yang hanya dibangun ulang ketika menu diubah (tambah/edit/hapus).
+
+    Perubahan stok saja (mis. dari penjualan) diterapkan langsung ke salinan di cache tanpa mengurutkan ulang.
+    """
+
+    def __init__(self, db):
+        self.db, self._tenants = db, {}
+        db.add_listener(self.on_write)
+
+    def get(self, tenant):
+        menu = self._tenants.get(tenant)
+        if menu is None: menu = self._tenants[tenant] = TenantMenu(self.db.list_rows(tenant, 'menu'))
+        return menu
+
+    def on_write(self, tenant, collection, op, payload):
+        if op == 'evict': self._tenants.pop(tenant, None); return
+        if collection != 'menu' or tenant not in self._tenants: return
+        if op == 'update' and set(payload[1]) == {'stok'} and payload[0] in self._tenants[tenant].by_id:
+            self._tenants[tenant].by_id[payload[0]]['stok'] = payload[1]['stok']
+        else: self._tenants.pop(tenant, None)
@@ -0,0 +1,187 @@
+import time
+import random
+import logging
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from storage import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+# Batas atas bucket histogram latensi, dalam detik.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets, self.counts, self.count, self.sum = buckets, [0] * (len(buckets) + 1), 0, 0.0
+
+    def observe(self, value):
+        index = next((n for n, upper in enumerate(self.buckets) if value <= upper), len(self.buckets))
+        self.counts[index] += 1; self.count += 1; self.sum += value
+
+    def quantile(self, q):
+        """Perkiraan kuantil: batas atas bucket tempat kuantil itu jatuh."""
+        if not self.count: return 0.0
+        target, seen = q * self.count, 0
+        for n, c in enumerate(self.counts):
+            seen += c
+            if seen >= target: return self.buckets[n] if n < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class Metrics:
+    """Histogram latensi & counter berlabel, aman dipakai dari banyak thread.
+
+    `sample_rate` < 1 membuat hanya sebagian pemanggilan yang diukur, sehingga overhead di bawah
+    beban tetap kecil; jumlah di histogram berarti jumlah sampel, bukan total pemanggilan.
+    """
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate, self._lock = sample_rate, threading.Lock()
+        self._histograms, self._counters, self._help = {}, {}, {}
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def describe(self, name, text): self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None: histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock: self._counters[key] = self._counters.get(key, 0) + amount
+
+    def histograms(self, name=None):
+        with self._lock: return [(k[0], dict(k[1]), h) for k, h in sorted(self._histograms.items()) if name is None or k[0] == name]
+
+    def counters(self, name=None):
+        with self._lock: return [(k[0], dict(k[1]), v) for k, v in sorted(self._counters.items()) if name is None or k[0] == name]
+
+    def render_prometheus(self):
+        lines, seen = [], set()
+        fmt = lambda labels, extra=(): "{" + ",".join(f'{k}="{str(v)}"' for k, v in list(labels.items()) + list(extra)) + "}"
+        for name, labels, h in self.histograms():
+            if name not in seen:
+                seen.add(name); lines += [f"# HELP {name} {self._help.get(name, name)}", f"# TYPE {name} histogram"]
+            cumulative = 0
+            for upper, count in zip(h.buckets, h.counts):
+                cumulative += count; lines.append(f"{name}_bucket{fmt(labels, [('le', upper)])} {cumulative}")
+            lines += [f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {h.count}", f"{name}_sum{fmt(labels)} {h.sum:.6f}", f"{name}_count{fmt(labels)} {h.count}"]
+        for name, labels, value in self.counters():
+            if name not in seen:
+                seen.add(name); lines += [f"# HELP {name} {self._help.get(name, name)}", f"# TYPE {name} counter"]
+            lines.append(f"{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("kasir_handler_seconds", "Latensi handler Telegram per callback dan state percakapan")
+metrics.describe("kasir_storage_seconds", "Latensi operasi penyimpanan per backend, operasi dan koleksi")
+metrics.describe("kasir_storage_io_seconds", "Latensi baca/tulis file data tenant")
+metrics.describe("kasir_storage_bytes_total", "Byte data tenant yang dibaca/ditulis ke disk")
+metrics.describe("kasir_pdf_render_seconds", "Waktu render PDF di worker")
+metrics.describe("kasir_pdf_queue_seconds", "Waktu tunggu PDF di antrean worker")
+metrics.describe("kasir_outbound_queue_seconds", "Waktu tunggu permintaan Bot API di antrean kirim per chat")
+metrics.describe("kasir_outbound_merged_total", "Edit pesan yang tidak dikirim karena tertimpa edit baru ke pesan yang sama")
+metrics.describe("kasir_outbound_retry_total", "Permintaan Bot API yang diulang setelah flood control (RetryAfter)")
+
+
+# --- INSTRUMENTASI ---
+def instrument_callback(callback, handler_name, state="-"):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        if not metrics.sampled(): return await callback(update, context)
+        started = time.perf_counter()
+        try: return await callback(update, context)
+        finally: metrics.observe("kasir_handler_seconds", time.perf_counter() - started, handler=handler_name, state=state)
+    return wrapper
+
+
+def instrument_application(application, state_names=None):
+    """Bungkus callback semua handler terdaftar (termasuk entry point, state & fallback ConversationHandler)."""
+    state_names = state_names or {}
+
+    def wrap(handler, conversation=None, state="-"):
+        if hasattr(handler, 'states') and hasattr(handler, 'entry_points'):
+            name = getattr(handler, 'name', None) or handler.entry_points[0].callback.__name__
+            for h in handler.entry_points: wrap(h, name, "entry")
+            for key, handlers in handler.states.items():
+                for h in handlers: wrap(h, name, state_names.get(key, str(key)))
+            for h in handler.fallbacks: wrap(h, name, "fallback")
+        elif getattr(handler, 'callback', None) is not None:
+            label = f"{conversation}/{handler.callback.__name__}" if conversation else handler.callback.__name__
+            handler.callback = instrument_callback(handler.callback, label, state)
+
+    for handlers in application.handlers.values():
+        for handler in handlers: wrap(handler)
+
+
+def instrument_storage(db):
+    """Ukur setiap operasi `db`, plus I/O file tenant (byte & waktu) jika backend-nya JSON."""
+    backend = type(db).__name__
+    for op in ("list_rows", "get_row", "insert_rows", "update_row", "increment", "delete_row", "flush"):
+        original = getattr(db, op)
+
+        def timed(*args, _original=original, _op=op, **kwargs):
+            if not metrics.sampled(): return _original(*args, **kwargs)
+            started = time.perf_counter()
+            try: return _original(*args, **kwargs)
+            finally: metrics.observe("kasir_storage_seconds", time.perf_counter() - started, backend=backend, op=_op, collection=args[1] if len(args) > 1 else "-")
+        setattr(db, op, timed)
+    cache = getattr(db, 'cache', None)
+    if cache is not None:
+        def on_io(op, tenant, size, seconds):
+            metrics.inc("kasir_storage_bytes_total", size, op=op); metrics.observe("kasir_storage_io_seconds", seconds, op=op)
+        cache.io_observer = on_io
+
+
+def observe_render(fn_name, queue_seconds, render_seconds):
+    metrics.observe("kasir_pdf_queue_seconds", queue_seconds, fn=fn_name); metrics.observe("kasir_pdf_render_seconds", render_seconds, fn=fn_name)
+
+
+# --- EKSPOR ---
+def format_stats(limit=15):
+    """Ringkasan teks polos (tanpa Markdown, nama handler mengandung '_') untuk perintah /stats."""
+    def section(title, name, label_fn):
+        rows = sorted(metrics.histograms(name), key=lambda r: -r[2].sum)[:limit]
+        if not rows: return [title, "- (belum ada data)"]
+        return [title] + [f"- {label_fn(labels)}: n={h.count}, avg={h.sum / h.count * 1000:.1f}ms, p50≤{h.quantile(0.5) * 1000:g}ms, p95≤{h.quantile(0.95) * 1000:g}ms" for _, labels, h in rows]
+    lines = [f"📈 Statistik Bot (sampel {metrics.sample_rate:.0%})", ""]
+    lines += section("Handler", "kasir_handler_seconds", lambda l: f"{l['handler']} [{l['state']}]") + [""]
+    lines += section("Storage", "kasir_storage_seconds", lambda l: f"{l['op']} {l['collection']}") + [""]
+    lines += section("I/O file tenant", "kasir_storage_io_seconds", lambda l: l['op'])
+    io_bytes = {l['op']: v for _, l, v in metrics.counters("kasir_storage_bytes_total")}
+    if io_bytes: lines.append("- byte: " + ", ".join(f"{op}={v:,}" for op, v in io_bytes.items()))
+    lines += [""] + section("Render PDF", "kasir_pdf_render_seconds", lambda l: l['fn'])
+    lines += [""] + section("Antrean kirim Telegram", "kasir_outbound_queue_seconds", lambda l: l['method'])
+    outbound = {name: sum(v for _, _, v in metrics.counters(name)) for name in ("kasir_outbound_merged_total", "kasir_outbound_retry_total")}
+    if any(outbound.values()): lines.append(f"- edit digabung={outbound['kasir_outbound_merged_total']:,}, kirim ulang (flood)={outbound['kasir_outbound_retry_total']:,}")
+    return "\n".join(lines)
+
+
+def start_exporters(file_path=None, interval=15.0, port=0, host="127.0.0.1"):
+    """Tulis metrik format Prometheus ke `file_path` secara berkala dan/atau layani di http://host:port/metrics."""
+    if file_path:
+        def write_loop():
+            while True:
+                try: atomic_write_text(file_path, metrics.render_prometheus())
+                except OSError as e: logger.error(f"Gagal menulis file metrik: {e}")
+                time.sleep(interval)
+        threading.Thread(target=write_loop, name="metrics-file", daemon=True).start()
+    if port:
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics": self.send_error(404); return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200); self.send_header("Content-Type", "text/plain; version=0.0.4"); self.send_header("Content-Length", str(len(body))); self.end_headers(); self.wfile.write(body)
+            def log_message(self, *args): pass
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Metrik Prometheus tersedia di http://{host}:{port}/metrics")
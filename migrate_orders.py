@@ -0,0 +1,83 @@
+"""Ubah baris `penjualan` lama (satu baris per item) menjadi `pesanan` (satu baris per nota), sekali jalan.
+
+Baris lama dikelompokkan per nota dengan `orders.group_legacy_sales`; layanan & pajak dihitung ulang dari
+persentase yang diberikan (data lama tidak menyimpannya). Per tenant, total omzet per bulan dari nota hasil
+konversi dicocokkan dengan data lama SEBELUM apa pun ditulis; jika berbeda, migrasi dibatalkan dengan exit
+non-nol. Penghapusan `penjualan` dan penyisipan `pesanan` terjadi dalam satu tulis/transaksi dan totalnya
+dicocokkan lagi sesudahnya. Jalankan saat bot mati. Sampai skrip ini dijalankan bot tetap membaca baris lama
+(lihat `orders.sales_rows`).
+
+Pengelompokan bersifat heuristik: data lama tidak menyimpan nomor nota, jadi baris berurutan dengan tanggal,
+pemesan & jam yang sama (dan menu yang tidak berulang) dianggap satu nota. Baris tanpa jam (`waktu`) dari
+pemesan yang sama di hari yang sama bisa tergabung menjadi satu nota; jumlahnya dilaporkan per tenant.
+
+Pemakaian:
+    python migrate_orders.py [--data-dir .] [--backend json|sqlite] [--db kasir.db] [--tenant NAMA]
+                             [--tax 0] [--service 0] [--keep-months 3]
+"""
+import sys
+import argparse
+
+from storage import ArchiveError, JsonBackend, SqliteBackend
+from orders import group_legacy_sales, order_from_legacy, sales_rows
+
+
+def monthly_totals(db, tenant):
+    totals = {}
+    for row in sales_rows(db, tenant): totals[row['tanggal'][:7]] = totals.get(row['tanggal'][:7], 0) + row['harga'] * row['jumlah']
+    return totals
+
+
+class TotalsMismatch(Exception):
+    """Total omzet per bulan hasil migrasi tidak sama dengan data lama."""
+
+
+def order_month_totals(orders, totals=None):
+    totals = {} if totals is None else totals
+    for order in orders:
+        if not order.get('batal'): totals[order['tanggal'][:7]] = totals.get(order['tanggal'][:7], 0) + sum(l[2] * l[3] for l in order['item'])
+    return totals
+
+
+def _differing_months(before, after):
+    return sorted(m for m in set(before) | set(after) if before.get(m) != after.get(m))
+
+
+HEURISTIC_NOTE = ("Catatan: nota lama disusun ulang secara heuristik (baris berurutan dengan tanggal, pemesan & jam yang sama, "
+                  "tanpa menu berulang = satu nota). Baris tanpa jam dari pemesan yang sama di hari yang sama bisa tergabung.")
+
+
+def migrate(db, tenants=None, tax=0, service=0, keep_months=3):
+    shop = {'tax': tax, 'service': service}; print(HEURISTIC_NOTE)
+    for tenant in tenants or sorted(db.get_users()):
+        rows = db.list_rows(tenant, 'penjualan')  # termasuk segmen arsip bulan lama
+        if not rows: print(f"- {tenant}: tidak ada penjualan lama"); continue
+        before, groups = monthly_totals(db, tenant), group_legacy_sales(rows); orders = [order_from_legacy(g, shop) for g in groups]
+        # Dicocokkan sebelum menulis: nota yang sudah ada + nota hasil konversi harus sama dengan total lama.
+        selisih = _differing_months(before, order_month_totals(orders, order_month_totals(db.list_rows(tenant, 'pesanan'))))
+        if selisih: raise TotalsMismatch(f"{tenant}: total hasil konversi berbeda dengan data lama (bulan: {', '.join(selisih)}); tidak ada yang diubah")
+        inserted = db.migrate_rows(tenant, 'penjualan', 'pesanan', orders)
+        selisih = _differing_months(before, monthly_totals(db, tenant))
+        if selisih: raise TotalsMismatch(f"{tenant}: total berbeda SETELAH migrasi (bulan: {', '.join(selisih)}); pulihkan dari cadangan")
+        tanpa_jam = sum(1 for g in groups if len(g) > 1 and not g[0].get('waktu'))
+        print(f"- {tenant}: {len(rows):,} baris penjualan -> {len(inserted):,} nota (#{inserted[0]['id']} s/d #{inserted[-1]['id']})" + (f", {tanpa_jam:,} nota tanpa jam berisi >1 baris (mungkin gabungan beberapa transaksi)" if tanpa_jam else ""))
+        if isinstance(db, JsonBackend) and keep_months > 0:
+            # Nota bulan lama kembali ke file tenant; arsipkan ulang (sekaligus membuang segmen penjualan lama).
+            try: db.archive_closed_months(tenant, keep_months)
+            except ArchiveError as e: print(f"- {tenant}: arsip ulang gagal, jalankan archive_sales.py nanti ({e})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrasi penjualan per item ke nota (pesanan) per transaksi.")
+    parser.add_argument("--data-dir", default=".", help="Folder berisi users.json dan data_*.json (backend json)")
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--db", default="kasir.db", help="Path database SQLite (backend sqlite)")
+    parser.add_argument("--tenant", action="append", help="Hanya tenant ini (boleh diulang); default semua pengguna")
+    parser.add_argument("--tax", type=float, default=0, help="Persen pajak untuk nota lama")
+    parser.add_argument("--service", type=float, default=0, help="Persen layanan untuk nota lama")
+    parser.add_argument("--keep-months", type=int, default=3, help="Backend json: bulan terakhir yang tetap di file tenant setelah migrasi (0 = tidak diarsip ulang)")
+    args = parser.parse_args()
+    db = SqliteBackend(args.db) if args.backend == "sqlite" else JsonBackend(args.data_dir, flush_interval=0)
+    try: migrate(db, args.tenant, args.tax, args.service, args.keep_months)
+    except TotalsMismatch as e: sys.exit(f"DIBATALKAN: {e}")
+    finally: db.close()
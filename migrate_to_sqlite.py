@@ -0,0 +1,46 @@
+"""Impor sekali jalan: users.json + semua data_*.json ke database SQLite.
+
+Pemakaian:
+    python migrate_to_sqlite.py [--data-dir .] [--db kasir.db] [--force]
+"""
+import os
+import glob
+import json
+import argparse
+
+from storage import COLLECTIONS, JsonBackend, SqliteBackend
+
+
+def migrate(data_dir=".", db_path="kasir.db", force=False):
+    db, source = SqliteBackend(db_path), JsonBackend(data_dir, flush_interval=0)
+    try:
+        users_path = os.path.join(data_dir, "users.json")
+        users = {}
+        if os.path.exists(users_path):
+            with open(users_path, 'r') as f: users = json.load(f)
+        for username, password_hash in users.items(): db.set_user(username, password_hash)
+        # Nama file tenant hanya memuat karakter alfanumerik dari username (lihat get_user_data_path).
+        tenant_by_file = {"data_" + "".join(c for c in u if c.isalnum()) + ".json": u for u in users}
+        for path in sorted(glob.glob(os.path.join(data_dir, "data_*.json"))):
+            file_name = os.path.basename(path); tenant = tenant_by_file.get(file_name, file_name[len("data_"):-len(".json")])
+            existing = any(db.list_rows(tenant, name) for name in COLLECTIONS)
+            if existing and not force: print(f"- {tenant}: sudah ada di database, dilewati (pakai --force untuk menimpa)"); continue
+            db.delete_tenant(tenant)
+            counts = []
+            for name in COLLECTIONS:
+                rows = source.list_rows(tenant, name)  # termasuk segmen arsip bulan lama
+                if rows: db.insert_rows(tenant, name, rows)
+                counts.append(f"{name}={len(rows)}")
+            print(f"- {tenant}: {', '.join(counts)}")
+        print(f"Selesai: {len(users)} pengguna dimigrasikan ke {db_path}.")
+    finally:
+        db.close(); source.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrasi data JSON bot kasir ke SQLite.")
+    parser.add_argument("--data-dir", default=".", help="Folder berisi users.json dan data_*.json")
+    parser.add_argument("--db", default="kasir.db", help="Path file database SQLite tujuan")
+    parser.add_argument("--force", action="store_true", help="Timpa data tenant yang sudah ada di database")
+    args = parser.parse_args()
+    migrate(args.data_dir, args.db, args.force)
@@ -0,0 +1,71 @@
+"""Pesanan (nota) sebagai satu entitas: header + baris item ringkas, menggantikan baris `penjualan` per item.
+
+Satu pesanan = satu baris koleksi `pesanan`:
+    {id, nama_pemesan, kasir, tanggal, waktu, subtotal, layanan, pajak, total, batal,
+     item: [[menu_id, nama, jumlah, harga, modal], ...]}
+Id per tenant adalah nomor nota (lihat `order_code`) dan dicari lewat `db.get_row`, yang memakai indeks
+(primary key di SQLite; indeks id di memori plus rentang id per segmen arsip di backend JSON).
+
+Pembaca yang butuh baris per item (laporan bulanan, analitik) memakai `sales_rows`: baris pesanan yang
+tidak dibatalkan dalam bentuk lama `penjualan`, ditambah baris `penjualan` lama yang belum dimigrasi
+(lihat migrate_orders.py).
+"""
+import re
+
+LINE_FIELDS = ("menu_id", "nama", "jumlah", "harga", "modal")
+
+
+def order_totals(subtotal, shop):
+    """Rincian layanan & pajak (pajak dihitung dari subtotal + layanan), sama seperti yang tercetak di nota."""
+    layanan = int(subtotal * (shop['service'] / 100)); pajak = int((subtotal + layanan) * (shop['tax'] / 100))
+    return {'subtotal': subtotal, 'layanan': layanan, 'pajak': pajak, 'total': subtotal + layanan + pajak}
+
+
+def build_order(cart, menu_map, customer_name, cashier, shop, now):
+    """Baris `pesanan` dari keranjang {menu_id: jumlah}; nama, harga & modal dibekukan saat transaksi."""
+    lines = [[item_id, menu_map[item_id]['nama'], jumlah, menu_map[item_id]['harga'], menu_map[item_id].get('modal')] for item_id, jumlah in cart.items() if item_id in menu_map]
+    return {'nama_pemesan': customer_name, 'kasir': cashier, 'tanggal': now.date().isoformat(), 'waktu': now.strftime("%H:%M:%S"), **order_totals(sum(l[2] * l[3] for l in lines), shop), 'batal': False, 'item': lines}
+
+
+def order_code(order):
+    return f"TX-{order['tanggal'].replace('-', '')}-{order['id']:05d}"
+
+
+def parse_order_code(text):
+    """'TX-20240501-00012', '#12' atau '12' -> 12; None jika bukan nomor nota."""
+    match = re.fullmatch(r"(?:TX-\d{8}-|#)?0*(\d+)", text.strip(), re.IGNORECASE)
+    return int(match.group(1)) if match and int(match.group(1)) > 0 else None
+
+
+def order_lines(order):
+    """Baris item pesanan dalam bentuk lama koleksi `penjualan` (plus `pesanan_id`)."""
+    for menu_id, nama, jumlah, harga, modal in order['item']:
+        yield {'pesanan_id': order['id'], 'menu_id': menu_id, 'nama_pemesan': order['nama_pemesan'], 'nama': nama, 'harga': harga, 'jumlah': jumlah, 'tanggal': order['tanggal'], 'waktu': order.get('waktu'), 'modal': modal}
+
+
+def sales_rows(db, tenant, tanggal=None):
+    """Semua penjualan per item (opsional difilter prefix tanggal): baris lama + item pesanan yang tidak dibatalkan."""
+    rows = db.list_rows(tenant, 'penjualan', tanggal)
+    for order in db.list_rows(tenant, 'pesanan', tanggal):
+        if not order.get('batal'): rows.extend(order_lines(order))
+    return rows
+
+
+def group_legacy_sales(rows):
+    """Kelompokkan baris `penjualan` lama (berurutan sesuai urutan simpan) menjadi daftar baris per pesanan.
+
+    Satu `order_finish` lama menulis baris-baris yang berurutan dengan tanggal, pemesan & jam yang sama, dan
+    setiap menu hanya sekali; pesanan baru dimulai begitu salah satunya berubah atau menu yang sama muncul lagi.
+    """
+    groups, current, seen, key = [], [], set(), None
+    for row in rows:
+        row_key = (row.get('tanggal'), row.get('nama_pemesan'), row.get('waktu'))
+        if current and (row_key != key or row.get('menu_id') in seen): groups.append(current); current, seen = [], set()
+        current.append(row); seen.add(row.get('menu_id')); key = row_key
+    if current: groups.append(current)
+    return groups
+
+
+def order_from_legacy(rows, shop):
+    first = rows[0]; lines = [[r.get('menu_id'), r.get('nama') or '-', r.get('jumlah') or 0, r.get('harga') or 0, r.get('modal')] for r in rows]
+    return {'nama_pemesan': first.get('nama_pemesan') or '-', 'kasir': None, 'tanggal': first['tanggal'], 'waktu': first.get('waktu'), **order_totals(sum(l[2] * l[3] for l in lines), shop), 'batal': False, 'item': lines}
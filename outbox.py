@@ -0,0 +1,146 @@
+"""Antrean kirim ke Bot API: satu antrean per chat, batas laju per chat & global, dan penggabungan edit.
+
+Dipasang sebagai rate limiter PTB (`Application.builder().rate_limiter(...)`), jadi semua pemanggilan
+`context.bot.*` / `query.edit_message_text` dari handler lewat sini tanpa perlu diubah satu per satu.
+
+- Permintaan ke satu chat dikirim berurutan; setiap kiriman mengambil token dari bucket chat itu (chat
+  pribadi & grup punya laju berbeda) dan dari bucket global. `answerCallbackQuery` & method lain tanpa
+  `chat_id` tidak diantrekan, hanya ikut berhenti saat kena flood control.
+- Edit yang masih antre dan tertimpa edit baru ke pesan yang sama tidak dikirim; pemanggilnya menerima
+  hasil edit terbaru (hasil akhirnya sama dengan mengirim keduanya berurutan).
+- RetryAfter (HTTP 429) menghentikan semua kiriman selama `retry_after` lalu permintaan diulang (mengambil
+  token chat & global lagi), paling banyak `max_retries` kali.
+- Lama tunggu di antrean dicatat ke metrik `kasir_outbound_queue_seconds` per method.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Edit baru (kunci) menimpa edit yang masih antre (nilai) ke pesan yang sama. Edit teks/caption tanpa
+# `reply_markup` juga menghapus tombol, jadi edit tombol yang antre sebelumnya ikut tertimpa.
+SUPERSEDES = {
+    'editMessageText': {'editMessageText', 'editMessageReplyMarkup'},
+    'editMessageCaption': {'editMessageCaption', 'editMessageReplyMarkup'},
+    'editMessageReplyMarkup': {'editMessageReplyMarkup'},
+}
+
+
+class TokenBucket:
+    """`rate` token per detik, maksimal `capacity` token tersimpan (boleh burst sebanyak itu)."""
+
+    def __init__(self, rate, capacity):
+        self.rate, self.capacity, self.tokens, self.updated, self.paused_until = rate, capacity, capacity, time.monotonic(), 0.0
+
+    def delay(self):
+        """Detik sampai satu token tersedia (0 = boleh sekarang)."""
+        now = time.monotonic(); self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate); self.updated = now
+        return max(self.paused_until - now, 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate)
+
+    async def acquire(self):
+        while (wait := self.delay()) > 0: await asyncio.sleep(wait)
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def wait_paused(self):
+        """Tunggu sampai jeda flood control selesai tanpa mengambil token."""
+        while (wait := self.paused_until - time.monotonic()) > 0: await asyncio.sleep(wait)
+
+
+class _Request:
+    __slots__ = ("endpoint", "callback", "args", "kwargs", "key", "futures", "enqueued")
+
+    def __init__(self, endpoint, callback, args, kwargs, key, future):
+        self.endpoint, self.callback, self.args, self.kwargs, self.key = endpoint, callback, args, kwargs, key
+        self.futures, self.enqueued = [future], time.monotonic()
+
+
+class OutboundQueue(BaseRateLimiter):
+    """Rate limiter PTB: `chat_rate`/`group_rate` kiriman per detik per chat (burst `chat_burst`), `global_rate` untuk semua chat."""
+
+    def __init__(self, chat_rate=1.0, chat_burst=10, group_rate=20 / 60, global_rate=30.0, max_retries=3):
+        self.chat_rate, self.chat_burst, self.group_rate, self.max_retries = chat_rate, chat_burst, group_rate, max_retries
+        self.global_bucket = TokenBucket(global_rate, 1)  # global tanpa burst: kiriman dari semua chat diratakan
+        self._chats, self._buckets = {}, {}
+
+    async def initialize(self): pass
+
+    async def shutdown(self):
+        for queue, worker in list(self._chats.values()):
+            worker.cancel()
+            for request in queue:
+                for future in request.futures:
+                    if not future.done(): future.cancel()
+        self._chats.clear(); self._buckets.clear()
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= 4096:
+                # Bucket chat yang sedang diam dan sudah penuh kembali sama dengan bucket baru, jadi aman dibuang.
+                for idle in [c for c, b in self._buckets.items() if c not in self._chats and b.delay() == 0 and b.tokens >= b.capacity]: del self._buckets[idle]
+            # Id grup/kanal negatif (atau @username kanal); chat pribadi boleh lebih cepat.
+            group = isinstance(chat_id, str) or chat_id < 0
+            bucket = self._buckets[chat_id] = TokenBucket(self.group_rate if group else self.chat_rate, self.chat_burst)
+        return bucket
+
+    def pending(self):
+        return sum(len(queue) for queue, _ in self._chats.values())
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None: return await self._send(endpoint, callback, args, kwargs)
+        future = asyncio.get_running_loop().create_future()
+        key = (chat_id, data['message_id']) if endpoint in SUPERSEDES and data.get('message_id') is not None else None
+        request = _Request(endpoint, callback, args, kwargs, key, future)
+        entry = self._chats.get(chat_id)
+        if entry is None: entry = self._chats[chat_id] = (deque(), asyncio.create_task(self._drain(chat_id)))
+        queue = entry[0]
+        if key is not None:
+            for old in [r for r in queue if r.key == key and r.endpoint in SUPERSEDES[endpoint]]:
+                queue.remove(old); request.futures.extend(old.futures); metrics.inc("kasir_outbound_merged_total", method=old.endpoint)
+        queue.append(request)
+        return await future
+
+    async def _drain(self, chat_id):
+        queue, bucket = self._chats[chat_id][0], self._bucket(chat_id)
+        try:
+            while queue:
+                # Token diambil sebelum permintaan dikeluarkan dari antrean, supaya edit yang menunggu masih bisa digabung.
+                await bucket.acquire(); await self.global_bucket.acquire()
+                if not queue: break
+                request = queue.popleft()
+                if metrics.sampled(): metrics.observe("kasir_outbound_queue_seconds", time.monotonic() - request.enqueued, method=request.endpoint)
+                try: result = await self._send(request.endpoint, request.callback, request.args, request.kwargs, bucket)
+                except Exception as e:
+                    for future in request.futures:
+                        if not future.done(): future.set_exception(e)
+                else:
+                    for future in request.futures:
+                        if not future.done(): future.set_result(result)
+        finally:
+            self._chats.pop(chat_id, None)
+
+    async def _send(self, endpoint, callback, args, kwargs, bucket=None):
+        """Kirim dengan ulang saat RetryAfter. Tanpa `bucket` (method tanpa chat) hanya menunggu jeda global;
+        dengan `bucket`, setiap kirim ulang mengambil token chat & global lagi supaya tidak menumpuk jadi burst."""
+        for attempt in range(self.max_retries + 1):
+            if bucket is None: await self.global_bucket.wait_paused()
+            elif attempt: await bucket.acquire(); await self.global_bucket.acquire()
+            try: return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries: raise
+                # Sama seperti AIORateLimiter bawaan PTB: baca nilai timedelta langsung agar tidak memicu peringatan deprecation.
+                seconds = e._retry_after.total_seconds() + 0.1
+                metrics.inc("kasir_outbound_retry_total", method=endpoint); logger.warning(f"Flood control pada {endpoint}, kirim ulang dalam {seconds:.1f} detik.")
+                self.global_bucket.pause(seconds)
+                if bucket is not None: bucket.pause(seconds)
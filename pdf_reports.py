@@ -0,0 +1,73 @@
+"""Pembuatan PDF laporan bulanan & nota.
+
+Fungsi di sini murni (tanpa akses Telegram/penyimpanan) dan mengembalikan `(filename, bytes)`,
+sehingga bisa dijalankan di thread atau proses worker lewat RenderPool.
+"""
+import locale
+import calendar
+from datetime import date, datetime
+from fpdf import FPDF
+
+from orders import order_code, order_totals
+
+
+def setup_locale():
+    # Atur locale ke Bahasa Indonesia untuk format tanggal
+    try:
+        locale.setlocale(locale.LC_TIME, 'id_ID.UTF-8')
+    except locale.Error:
+        try: locale.setlocale(locale.LC_TIME, 'Indonesian_Indonesia.1252')
+        except locale.Error: pass
+
+# Modul ini baru diimpor di worker render saat PDF pertama diminta, jadi locale diatur di sini, bukan saat bot start.
+setup_locale()
+
+# --- FUNGSI-FUNGSI PEMBUATAN PDF ---
+def generate_monthly_recap_pdf(data, year_month):
+    try:
+        report_date = date.fromisoformat(f"{year_month}-01"); month_name = report_date.strftime("%B"); year = int(year_month.split('-')[0]); month = int(year_month.split('-')[1])
+    except ValueError: return None
+    filename = f"laporan_bulanan_{year_month}.pdf"; daily_summary = {}
+    for sale in [p for p in data.get('penjualan', []) if p['tanggal'].startswith(year_month)]:
+        day = sale['tanggal']; daily_summary.setdefault(day, {'pemasukan': 0, 'pengeluaran': 0})['pemasukan'] += sale['harga'] * sale['jumlah']
+    for expense in [e for e in data.get('pengeluaran', []) if e['tanggal'].startswith(year_month)]:
+        day = expense['tanggal']; daily_summary.setdefault(day, {'pemasukan': 0, 'pengeluaran': 0})['pengeluaran'] += expense['nominal']
+    total_pemasukan, total_pengeluaran = sum(d['pemasukan'] for d in daily_summary.values()), sum(d['pengeluaran'] for d in daily_summary.values())
+    pdf = FPDF(); pdf.add_page(); pdf.set_font("Helvetica", "B", 16); pdf.cell(0, 10, f"Laporan Bulanan - {month_name} {year}", 0, 1, 'C'); pdf.ln(10)
+    pdf.set_font("Helvetica", "B", 12); pdf.cell(0, 10, "REKAPITULASI HARIAN", 0, 1); pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(40, 8, "Tanggal", 1, 0, 'C'); pdf.cell(50, 8, "Pemasukan", 1, 0, 'C'); pdf.cell(50, 8, "Pengeluaran", 1, 0, 'C'); pdf.cell(50, 8, "Laba Bersih", 1, 1, 'C')
+    pdf.set_font("Helvetica", "", 10)
+    num_days = calendar.monthrange(year, month)[1]
+    for day_num in range(1, num_days + 1):
+        current_date_str = f"{year_month}-{day_num:02d}"; day_data = daily_summary.get(current_date_str, {'pemasukan': 0, 'pengeluaran': 0})
+        pemasukan_harian, pengeluaran_harian = day_data['pemasukan'], day_data['pengeluaran']; laba_harian = pemasukan_harian - pengeluaran_harian
+        formatted_date = date.fromisoformat(current_date_str).strftime("%d %b %Y")
+        pdf.cell(40, 8, formatted_date, 1); pdf.cell(50, 8, f"Rp {pemasukan_harian:,}", 1, 0, 'R'); pdf.cell(50, 8, f"Rp {pengeluaran_harian:,}", 1, 0, 'R'); pdf.cell(50, 8, f"Rp {laba_harian:,}", 1, 1, 'R')
+    pdf.ln(10); pdf.set_font("Helvetica", "B", 12); pdf.cell(70, 8, "Total Pemasukan Bulan Ini:", 0, 0, 'R'); pdf.cell(40, 8, f"Rp {total_pemasukan:,}", 0, 1, 'R')
+    pdf.cell(70, 8, "Total Pengeluaran Bulan Ini:", 0, 0, 'R'); pdf.cell(40, 8, f"Rp {total_pengeluaran:,}", 0, 1, 'R'); pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(70, 10, "LABA BERSIH BULANAN:", 0, 0, 'R'); pdf.cell(40, 10, f"Rp {total_pemasukan - total_pengeluaran:,}", 0, 1, 'R')
+    return filename, bytes(pdf.output())
+
+def generate_order_receipt_pdf(order, shop, reprint=False):
+    """Nota satu pesanan dari data yang tersimpan (item, harga & total saat transaksi), jadi cetak ulang selalu sama."""
+    order_id = order_code(order); filename = f"nota_{order['nama_pemesan'].replace(' ', '_')}_{order_id}.pdf"
+    waktu = datetime.fromisoformat(f"{order['tanggal']}T{order.get('waktu') or '00:00:00'}")
+    pdf = FPDF(orientation='P', unit='mm', format=(80, 200)); pdf.add_page(); pdf.set_auto_page_break(auto=True, margin=5); pdf.set_font("Helvetica", "B", 12); pdf.set_margin(5)
+    pdf.cell(0, 6, shop['nama'], 0, 1, 'C'); pdf.set_font("Helvetica", "", 8); pdf.cell(0, 4, shop['lokasi'], 0, 1, 'C'); pdf.ln(5)
+    col_width, line_height = pdf.w / 2 - pdf.l_margin, 4; pdf.set_font("Helvetica", "", 8)
+    pdf.cell(col_width, line_height, f"Date: {waktu.strftime('%b %d %Y')}", 0, 0, 'L'); pdf.cell(col_width, line_height, f"Cashier: {order.get('kasir') or '-'}", 0, 1, 'R')
+    pdf.cell(col_width, line_height, f"Trx ID: {order_id}", 0, 0, 'L'); pdf.cell(col_width, line_height, f"Customer: {order['nama_pemesan']}", 0, 1, 'R')
+    pdf.ln(3); pdf.dashed_line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y()); pdf.ln(3)
+    for _, nama, jumlah, harga, _ in order['item']:
+        pdf.set_font("Helvetica", "B", 8); pdf.cell(col_width + 10, line_height, f"{nama} x{jumlah}", 0, 0, 'L'); pdf.set_font("Helvetica", "", 8); pdf.cell(col_width - 10, line_height, f"Rp{harga * jumlah:,}", 0, 1, 'R')
+    pdf.ln(3); pdf.dashed_line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y()); pdf.ln(3); pdf.set_font("Helvetica", "B", 8)
+    pdf.cell(0, line_height, "Payment Details", 0, 1, 'L'); pdf.set_font("Helvetica", "", 8)
+    # Persentase toko bisa sudah berubah sejak transaksi; hanya ditampilkan jika masih cocok dengan nominal tersimpan.
+    percent = order_totals(order['subtotal'], shop) == {k: order[k] for k in ('subtotal', 'layanan', 'pajak', 'total')}
+    service_label, tax_label = (f"Service ({shop['service']}%)", f"Tax ({shop['tax']}%)") if percent else ("Service", "Tax")
+    pdf.cell(col_width, line_height, "Subtotal", 0, 0, 'L'); pdf.cell(col_width, line_height, f"Rp{order['subtotal']:,}", 0, 1, 'R'); pdf.cell(col_width, line_height, "Discount", 0, 0, 'L'); pdf.cell(col_width, line_height, "-Rp0", 0, 1, 'R'); pdf.cell(col_width, line_height, service_label, 0, 0, 'L'); pdf.cell(col_width, line_height, f"Rp{order['layanan']:,}", 0, 1, 'R'); pdf.cell(col_width, line_height, tax_label, 0, 0, 'L'); pdf.cell(col_width, line_height, f"Rp{order['pajak']:,}", 0, 1, 'R')
+    pdf.set_font("Helvetica", "B", 10); pdf.cell(col_width, line_height + 2, "Total", 0, 0, 'L'); pdf.cell(col_width, line_height + 2, f"Rp{order['total']:,}", 0, 1, 'R'); pdf.ln(5)
+    pdf.set_font("Helvetica", "B", 10); pdf.cell(0, 6, "VOID" if order.get('batal') else "PAID", 0, 1, 'C'); pdf.set_font("Helvetica", "", 8); pdf.cell(0, 4, waktu.strftime("%b %d %Y - %H:%M"), 0, 1, 'C')
+    if reprint: pdf.cell(0, 4, f"REPRINT {datetime.now().strftime('%b %d %Y - %H:%M')}", 0, 1, 'C')
+    pdf.ln(5); pdf.cell(0, 4, "Thank you for your order!", 0, 1, 'C')
+    return filename, bytes(pdf.output())
@@ -0,0 +1,77 @@
+import time
+import heapq
+import asyncio
+import logging
+import importlib
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve(path):
+    module, name = path.split(":"); return getattr(importlib.import_module(module), name)
+
+
+def _timed_call(fn, *args):
+    # Dijalankan di worker; waktu mulai memakai time.time() agar bisa dibandingkan antar proses.
+    # `fn` boleh berupa "modul:fungsi" supaya modulnya (mis. FPDF) baru diimpor di worker saat pertama dipakai.
+    if isinstance(fn, str): fn = _resolve(fn)
+    started = time.time(); result = fn(*args)
+    return started, time.time() - started, result
+
+
+class RenderQueueFull(Exception):
+    """Antrean render sudah penuh; permintaan non-prioritas ditolak daripada menunda handler lain."""
+
+
+class RenderPool:
+    """Pool worker (thread atau proses) untuk menjalankan pembuatan PDF di luar event loop.
+
+    `size` worker berjalan bersamaan dan paling banyak `max_queue` permintaan lain boleh menunggu.
+    Permintaan dengan `priority=True` (mis. nota pesanan) tetap diterima walau antrean penuh dan
+    mendapat worker kosong berikutnya sebelum semua permintaan biasa yang sedang menunggu.
+    """
+
+    def __init__(self, size=2, max_queue=8, kind="thread", initializer=None, observer=None):
+        self.size, self.max_queue, self.kind, self._pending = size, max_queue, kind, 0
+        # Antrean slot worker milik pool sendiri (bukan antrean executor yang FIFO): heap (prioritas, urutan, future).
+        self._free, self._waiting, self._order = size, [], itertools.count()
+        self.observer = observer  # opsional: fn(nama_fungsi, detik_antre, detik_render)
+        if kind == "process": self.executor = ProcessPoolExecutor(max_workers=size, initializer=initializer)
+        elif kind == "thread": self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="pdf", initializer=initializer)
+        else: raise ValueError(f"Jenis pool render tidak dikenal: {kind}")
+
+    @property
+    def pending(self): return self._pending
+
+    async def render(self, fn, *args, priority=False):
+        if not priority and self._pending >= self.size + self.max_queue: raise RenderQueueFull(f"{self._pending} render sedang berjalan/antre")
+        self._pending += 1; submitted = time.time()
+        try:
+            await self._acquire(priority)
+            try: started, duration, result = await asyncio.get_running_loop().run_in_executor(self.executor, _timed_call, fn, *args)
+            finally: self._release()
+        finally: self._pending -= 1
+        if self.observer is not None: self.observer(fn.split(":")[-1] if isinstance(fn, str) else fn.__name__, started - submitted, duration)
+        return result
+
+    async def _acquire(self, priority):
+        if self._free > 0 and not self._waiting: self._free -= 1; return
+        future = asyncio.get_running_loop().create_future(); heapq.heappush(self._waiting, (0 if priority else 1, next(self._order), future))
+        try: await future
+        except asyncio.CancelledError:
+            # Slot sudah diserahkan tepat sebelum pembatalan: teruskan ke antrean berikutnya.
+            if future.done() and not future.cancelled(): self._release()
+            raise
+
+    def _release(self):
+        while self._waiting:
+            future = heapq.heappop(self._waiting)[2]
+            if not future.done(): future.set_result(None); return
+        self._free += 1
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,130 @@
+import os
+import json
+import hashlib
+import logging
+import itertools
+from collections import OrderedDict
+
+from storage import COLLECTIONS, atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def _safe(tenant):
+    return "".join(c for c in tenant if c.isalnum())
+
+
+class ReportCache:
+    """Cache PDF laporan bulanan per (tenant, YYYY-MM, versi data bulan itu).
+
+    Setiap penulisan yang menyentuh suatu bulan mengganti versinya dan membuang cache bulan
+    itu saja; nomor versi diambil dari satu penghitung, jadi tidak pernah terpakai ulang walau
+    versi tenant yang tidak aktif dibuang. Tier memori menyimpan `memory_entries` laporan terakhir; tier disk (`directory`)
+    dibatasi `max_bytes` dan bertahan setelah restart. Nama file memuat sidik data bulan itu; file
+    yang ada saat bot dinyalakan dicocokkan ulang dengan data saat pertama diminta, karena skrip di
+    luar proses bot (migrasi, arsip) bisa mengubah data tanpa membuang cache.
+    """
+
+    def __init__(self, db, directory="report_cache", max_bytes=50 * 1024 * 1024, memory_entries=16):
+        self.directory, self.max_bytes, self.memory_entries = directory, max_bytes, memory_entries
+        self.db, self._versions, self._memory, self._disk, self._clock = db, {}, OrderedDict(), OrderedDict(), itertools.count(1)
+        self._unverified = set()  # file dari sebelum restart yang sidiknya belum dicocokkan
+        if directory and max_bytes > 0:
+            os.makedirs(directory, exist_ok=True); self._load_disk_index()
+        db.add_listener(self.on_write)
+
+    def _path(self, key, fingerprint=None):
+        fingerprint = fingerprint or self._disk[key][1]
+        return os.path.join(self.directory, f"{key[0]}__{key[1]}__{fingerprint}.pdf")
+
+    def fingerprint(self, tenant, year_month):
+        """Sidik semua baris yang bisa masuk laporan bulan itu (nota, penjualan lama, pengeluaran)."""
+        digest = hashlib.sha1()
+        for collection in ("pesanan", "penjualan", "pengeluaran"):
+            rows = self.db.list_rows(tenant, collection, year_month)
+            digest.update(collection.encode()); digest.update(json.dumps(rows, sort_keys=True, default=str).encode())
+        return digest.hexdigest()[:16]
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"): continue
+            path, parts = os.path.join(self.directory, name), name[:-len(".pdf")].split("__")
+            if len(parts) != 3:
+                # Format lama tanpa sidik: tidak bisa dicocokkan dengan data, jadi dibuang.
+                try: os.remove(path)
+                except OSError: pass
+                continue
+            stat = os.stat(path); entries.append((stat.st_mtime, (parts[0], parts[1]), stat.st_size, parts[2]))
+        for _, key, size, fingerprint in sorted(entries): self._disk[key] = (size, fingerprint); self._unverified.add(key)
+        self._enforce_disk_cap()
+
+    def version(self, tenant, year_month):
+        key = (_safe(tenant), year_month); version = self._versions.get(key)
+        if version is None: version = self._versions[key] = next(self._clock)
+        return version
+
+    def get(self, tenant, year_month):
+        key = (_safe(tenant), year_month); memory_key = key + (self.version(tenant, year_month),)
+        if memory_key in self._memory: self._memory.move_to_end(memory_key); return self._memory[memory_key]
+        if key not in self._disk: return None
+        if key in self._unverified:
+            self._unverified.discard(key)
+            if self._disk[key][1] != self.fingerprint(tenant, year_month):
+                logger.info(f"Cache laporan {key} tidak cocok lagi dengan data, dibuat ulang."); self._remove_file(key); del self._disk[key]; return None
+        try:
+            with open(self._path(key), 'rb') as f: pdf_bytes = f.read()
+        except OSError:
+            self._disk.pop(key, None); self._unverified.discard(key); return None
+        self._disk.move_to_end(key); self._remember(memory_key, pdf_bytes)
+        return pdf_bytes
+
+    def put(self, tenant, year_month, version, pdf_bytes):
+        """Simpan hasil render; diabaikan jika data bulan itu sudah berubah selama render berjalan."""
+        if version != self.version(tenant, year_month): return False
+        key = (_safe(tenant), year_month); self._remember(key + (version,), pdf_bytes)
+        if self.directory and self.max_bytes > 0 and len(pdf_bytes) <= self.max_bytes:
+            try:
+                fingerprint = self.fingerprint(tenant, year_month); atomic_write_bytes(self._path(key, fingerprint), pdf_bytes)
+                if key in self._disk and self._disk[key][1] != fingerprint: self._remove_file(key)
+                self._disk[key] = (len(pdf_bytes), fingerprint); self._disk.move_to_end(key); self._unverified.discard(key); self._enforce_disk_cap()
+            except OSError as e: logger.error(f"Gagal menyimpan cache laporan {key}: {e}")
+        return True
+
+    def _remember(self, memory_key, pdf_bytes):
+        self._memory[memory_key] = pdf_bytes; self._memory.move_to_end(memory_key)
+        while len(self._memory) > self.memory_entries: self._memory.popitem(last=False)
+
+    def _enforce_disk_cap(self):
+        while self._disk and sum(size for size, _ in self._disk.values()) > self.max_bytes:
+            key = next(iter(self._disk)); self._remove_file(key); del self._disk[key]; self._unverified.discard(key)
+
+    def _remove_file(self, key):
+        try: os.remove(self._path(key))
+        except FileNotFoundError: pass
+
+    def invalidate(self, tenant, year_month=None):
+        """Buang cache satu bulan (atau semua bulan tenant jika `year_month` None)."""
+        safe = _safe(tenant)
+        months = {year_month} if year_month else {k[1] for k in list(self._disk) + list(self._memory) if k[0] == safe} | {k[1] for k in self._versions if k[0] == safe}
+        for month in months:
+            key = (safe, month); self._versions[key] = next(self._clock)
+            for memory_key in [k for k in self._memory if k[:2] == key]: del self._memory[memory_key]
+            if key in self._disk: self._remove_file(key); del self._disk[key]; self._unverified.discard(key)
+
+    def on_write(self, tenant, collection, op, payload):
+        if op == 'evict':
+            # Tenant tidak aktif: versi & PDF di memori dibuang; file di disk tetap valid (dihapus setiap kali bulannya berubah di proses ini).
+            safe = _safe(tenant)
+            for key in [k for k in self._versions if k[0] == safe]: del self._versions[key]
+            for key in [k for k in self._memory if k[0] == safe]: del self._memory[key]
+            return
+        if collection not in ("penjualan", "pesanan", "pengeluaran"): return
+        date_field = COLLECTIONS[collection]["tanggal"]
+        if op == 'insert':
+            for month in {row[date_field][:7] for row in payload}: self.invalidate(tenant, month)
+        elif op == 'update':
+            # Hanya bulan baris itu (sebelum & sesudah diubah), mis. bulan nota yang dibatalkan.
+            _, fields, before = payload
+            for month in {before[date_field][:7], fields.get(date_field, before[date_field])[:7]}: self.invalidate(tenant, month)
+        else: self.invalidate(tenant)
@@ -0,0 +1,127 @@
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def debtor_key(nama):
+    """Kunci akun penghutang: nama tanpa beda huruf besar/kecil dan spasi berlebih."""
+    return " ".join(nama.split()).casefold()
+
+
+class TenantRollup:
+    """Total pemasukan/pengeluaran per hari & per bulan, plus saldo kasbon terbuka per penghutang, untuk satu tenant."""
+
+    def __init__(self):
+        self.harian, self.bulanan = {}, {}
+        # id kasbon terbuka -> (akun, sisa); akun -> [nama, sisa, {id kasbon terbuka}]
+        self.kasbon, self.penghutang, self.total_kasbon = {}, {}, 0
+
+    def _add(self, tanggal, index, amount):
+        for bucket, key in ((self.harian, tanggal), (self.bulanan, tanggal[:7])):
+            totals = bucket.setdefault(key, [0, 0]); totals[index] += amount
+
+    def add_sale(self, row, sign=1): self._add(row['tanggal'], 0, sign * row['harga'] * row['jumlah'])
+    def add_order(self, row, sign=1):
+        if not row.get('batal'): self._add(row['tanggal'], 0, sign * row['subtotal'])
+    def add_expense(self, row, sign=1): self._add(row['tanggal'], 1, sign * row['nominal'])
+
+    def set_kasbon(self, row):
+        """Terapkan keadaan terbaru satu catatan kasbon (baru, dibayar sebagian, lunas) ke saldo penghutangnya."""
+        self.remove_kasbon(row['id'])
+        sisa = 0 if row.get('lunas') else row['nominal'] - (row.get('terbayar') or 0)
+        if sisa <= 0: return
+        key = debtor_key(row['nama']); account = self.penghutang.setdefault(key, [row['nama'], 0, set()])
+        account[0] = row['nama']; account[1] += sisa; account[2].add(row['id'])
+        self.kasbon[row['id']] = (key, sisa); self.total_kasbon += sisa
+
+    def remove_kasbon(self, row_id):
+        entry = self.kasbon.pop(row_id, None)
+        if entry is None: return
+        key, sisa = entry; account = self.penghutang[key]; account[1] -= sisa; account[2].discard(row_id); self.total_kasbon -= sisa
+        if not account[2]: del self.penghutang[key]
+
+    def penghutang_terbesar(self, n):
+        """`n` penghutang dengan sisa terbesar sebagai (nama, sisa), tanpa mengurutkan semua akun."""
+        return [(a[0], a[1]) for a in heapq.nlargest(n, self.penghutang.values(), key=lambda a: a[1])]
+
+    def hari(self, tanggal):
+        pemasukan, pengeluaran = self.harian.get(tanggal, (0, 0)); return pemasukan, pengeluaran
+
+    def bulan(self, year_month):
+        pemasukan, pengeluaran = self.bulanan.get(year_month, (0, 0)); return pemasukan, pengeluaran
+
+    def snapshot(self):
+        return {'harian': {k: list(v) for k, v in self.harian.items() if any(v)}, 'bulanan': {k: list(v) for k, v in self.bulanan.items() if any(v)}, 'penghutang': {k: [a[1], sorted(a[2])] for k, a in self.penghutang.items()}}
+
+
+# Koleksi pemasukan/pengeluaran -> method TenantRollup yang menambahkan satu barisnya.
+ADDERS = {'penjualan': 'add_sale', 'pesanan': 'add_order', 'pengeluaran': 'add_expense'}
+
+
+class RollupIndex:
+    """Indeks rollup per tenant yang diperbarui O(1) lewat listener storage.
+
+    Tenant dibangun ulang dari nol (`rebuild`) saat pertama kali diakses; setelah itu hanya
+    diperbarui inkremental. Jika `verify_every` > 0, setiap sekian perubahan indeks dicocokkan
+    dengan hitung ulang penuh dan dibangun ulang bila ada selisih.
+    """
+
+    def __init__(self, db, verify_every=0):
+        self.db, self.verify_every, self._tenants, self._changes = db, verify_every, {}, {}
+        db.add_listener(self.on_write)
+
+    def get(self, tenant):
+        rollup = self._tenants.get(tenant)
+        return rollup if rollup is not None else self.rebuild(tenant)
+
+    def compute(self, tenant):
+        rollup = TenantRollup()
+        for row in self.db.list_rows(tenant, 'penjualan'): rollup.add_sale(row)
+        for row in self.db.list_rows(tenant, 'pesanan'): rollup.add_order(row)
+        for row in self.db.list_rows(tenant, 'pengeluaran'): rollup.add_expense(row)
+        for row in self.db.list_rows(tenant, 'kasbon', lunas=False): rollup.set_kasbon(row)
+        return rollup
+
+    def rebuild(self, tenant):
+        rollup = self._tenants[tenant] = self.compute(tenant); self._changes[tenant] = 0
+        return rollup
+
+    def verify(self, tenant):
+        """Bandingkan indeks dengan hitung ulang penuh; kembalikan daftar selisih (kosong jika konsisten)."""
+        if tenant not in self._tenants: return []
+        current, expected = self._tenants[tenant].snapshot(), self.compute(tenant).snapshot(); mismatches = []
+        for section in expected:
+            for key in set(current[section]) | set(expected[section]):
+                if current[section].get(key) != expected[section].get(key): mismatches.append((section, key, current[section].get(key), expected[section].get(key)))
+        return mismatches
+
+    def on_write(self, tenant, collection, op, payload):
+        if op == 'evict': self._tenants.pop(tenant, None); self._changes.pop(tenant, None); return
+        rollup = self._tenants.get(tenant)
+        if rollup is None: return  # belum pernah dibangun, nanti dihitung langsung dari storage
+        if collection == 'penjualan' and op == 'insert':
+            for row in payload: rollup.add_sale(row)
+        elif collection == 'pesanan' and op == 'insert':
+            for row in payload: rollup.add_order(row)
+        elif collection == 'pengeluaran' and op == 'insert':
+            for row in payload: rollup.add_expense(row)
+        elif collection == 'kasbon':
+            if op == 'insert':
+                for row in payload: rollup.set_kasbon(row)
+            elif op == 'update':
+                row = self.db.get_row(tenant, 'kasbon', payload[0])
+                if row: rollup.set_kasbon(row)
+                else: rollup.remove_kasbon(payload[0])
+            elif op == 'delete': rollup.remove_kasbon(payload)
+        elif op == 'update' and collection in ADDERS:
+            # Nota dibatalkan / baris diubah: kurangi nilai lama lalu tambahkan nilai baru (bisa beda tanggal).
+            row_id, fields, before = payload; add = getattr(rollup, ADDERS[collection])
+            add(before, sign=-1); add({**before, **fields})
+        elif op == 'delete' and collection in ADDERS:
+            self._tenants.pop(tenant, None); return  # baris yang dihapus tidak dikirim, jadi dihitung ulang
+        else: return
+        self._changes[tenant] = self._changes.get(tenant, 0) + 1
+        if self.verify_every and self._changes[tenant] >= self.verify_every:
+            mismatches = self.verify(tenant); self._changes[tenant] = 0
+            if mismatches: logger.warning(f"Rollup tenant {tenant} tidak konsisten ({len(mismatches)} selisih), dibangun ulang."); self.rebuild(tenant)
@@ -0,0 +1,111 @@
+"""Penyimpanan sesi bot (user_data & state ConversationHandler) di SQLite, supaya restart tidak me-logout kasir.
+
+PTB memanggil `update_*` hanya untuk data yang berubah, setiap `update_interval` detik (bukan setiap update).
+`user_data` tidak dimuat saat start: sesi seorang pengguna baru dibaca ketika update pertamanya datang
+(`refresh_user_data`). State percakapan kecil dan dibutuhkan ConversationHandler sejak awal, jadi dimuat langsung.
+
+Sesi dikunci per pengguna dan dipakai bersama oleh semua worker webhook: saat rute pengguna pindah ke worker
+lain (login/logout), worker lama menyimpan sesinya saat itu juga lalu melepasnya (`release_user_data`).
+"""
+import json
+import pickle
+import sqlite3
+import logging
+import threading
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# Kunci user_data yang tidak ikut disimpan: password sementara saat registrasi & hash tampilan keranjang.
+SKIP_KEYS = frozenset({'register_password1', 'cart_view'})
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS sesi (scope TEXT NOT NULL, user_id INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (scope, user_id))")
+    conn.execute("CREATE TABLE IF NOT EXISTS percakapan (scope TEXT NOT NULL, nama TEXT NOT NULL, kunci TEXT NOT NULL, state BLOB NOT NULL, PRIMARY KEY (scope, nama, kunci))")
+    conn.execute("CREATE TABLE IF NOT EXISTS rute (user_id INTEGER PRIMARY KEY, tenant TEXT NOT NULL)")
+    # Sesi lama dipisah per worker (scope "w<N>"); sekarang satu sesi per pengguna. Baris scope "" yang sudah ada menang.
+    conn.execute("INSERT OR IGNORE INTO sesi (scope, user_id, data) SELECT '', user_id, data FROM sesi WHERE scope LIKE 'w%'")
+    conn.execute("INSERT OR IGNORE INTO percakapan (scope, nama, kunci, state) SELECT '', nama, kunci, state FROM percakapan WHERE scope LIKE 'w%'")
+    conn.execute("DELETE FROM sesi WHERE scope LIKE 'w%'"); conn.execute("DELETE FROM percakapan WHERE scope LIKE 'w%'")
+    return conn
+
+
+class SessionPersistence(BasePersistence):
+    """Persistence PTB untuk user_data & percakapan; `scope` memisahkan beberapa bot dalam satu file."""
+
+    def __init__(self, path="sessions.db", scope="", update_interval=15):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False), update_interval=update_interval)
+        self.scope, self.conn, self._lock, self._loaded, self._released = scope, _connect(path), threading.Lock(), set(), set()
+
+    # --- user_data (lazy) ---
+    async def get_user_data(self):
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        if user_id in self._loaded: return
+        self._loaded.add(user_id)
+        with self._lock: row = self.conn.execute("SELECT data FROM sesi WHERE scope = ? AND user_id = ?", (self.scope, user_id)).fetchone()
+        # Pengguna yang kembali setelah dilepas: isi di memori sudah basi, sesi tersimpan yang berlaku.
+        if user_id in self._released: self._released.discard(user_id); user_data.clear()
+        if row is None: return
+        try: stored = pickle.loads(row[0])
+        except Exception as e: logger.error(f"Sesi pengguna {user_id} rusak, diabaikan: {e}"); return
+        for key, value in stored.items(): user_data.setdefault(key, value)
+
+    async def update_user_data(self, user_id, data):
+        # Pengguna yang sesinya belum dimuat di proses ini tidak boleh menimpa sesi tersimpan dengan data kosong.
+        if user_id not in self._loaded: return
+        blob = pickle.dumps({k: v for k, v in data.items() if k not in SKIP_KEYS}, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock: self.conn.execute("INSERT OR REPLACE INTO sesi (scope, user_id, data) VALUES (?, ?, ?)", (self.scope, user_id, blob))
+
+    async def release_user_data(self, user_id, data):
+        """Simpan sesi pengguna sekarang juga lalu berhenti menyimpannya dari proses ini (ia pindah ke worker lain)."""
+        await self.update_user_data(user_id, data); self._loaded.discard(user_id); self._released.add(user_id)
+
+    async def drop_user_data(self, user_id):
+        self._loaded.discard(user_id)
+        with self._lock: self.conn.execute("DELETE FROM sesi WHERE scope = ? AND user_id = ?", (self.scope, user_id))
+
+    # --- state percakapan ---
+    async def get_conversations(self, name):
+        with self._lock: rows = self.conn.execute("SELECT kunci, state FROM percakapan WHERE scope = ? AND nama = ?", (self.scope, name)).fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        with self._lock:
+            if new_state is None: self.conn.execute("DELETE FROM percakapan WHERE scope = ? AND nama = ? AND kunci = ?", (self.scope, name, json.dumps(list(key))))
+            else: self.conn.execute("INSERT OR REPLACE INTO percakapan (scope, nama, kunci, state) VALUES (?, ?, ?, ?)", (self.scope, name, json.dumps(list(key)), pickle.dumps(new_state, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    async def flush(self):
+        with self._lock: self.conn.close()
+
+    # chat_data, bot_data & callback_data tidak dipakai bot ini.
+    async def get_chat_data(self): return {}
+    async def get_bot_data(self): return {}
+    async def get_callback_data(self): return None
+    async def update_chat_data(self, chat_id, data): pass
+    async def update_bot_data(self, data): pass
+    async def update_callback_data(self, data): pass
+    async def drop_chat_data(self, chat_id): pass
+    async def refresh_chat_data(self, chat_id, chat_data): pass
+    async def refresh_bot_data(self, bot_data): pass
+
+
+class RouteStore:
+    """Tabel rute pengguna -> tenant milik proses depan webhook, disimpan di file sesi yang sama."""
+
+    def __init__(self, path="sessions.db"):
+        self.conn = _connect(path)
+
+    def load(self):
+        return dict(self.conn.execute("SELECT user_id, tenant FROM rute").fetchall())
+
+    def set(self, user_id, tenant):
+        if tenant: self.conn.execute("INSERT OR REPLACE INTO rute (user_id, tenant) VALUES (?, ?)", (user_id, tenant))
+        else: self.conn.execute("DELETE FROM rute WHERE user_id = ?", (user_id,))
+
+    def close(self): self.conn.close()
@@ -0,0 +1,102 @@
+"""Buku stok per tenant di memori: stok menu dikurangi porsi yang sedang ditahan keranjang kasir.
+
+Setiap tap tambah di keranjang menahan porsinya (`hold`), jadi dua kasir tidak bisa sama-sama memasukkan
+porsi terakhir. Tahanan dilepas saat item dikurangi, keranjang dibatalkan/diganti, atau keranjang tidak
+disentuh selama `ttl` detik; `commit` mengambil semua porsi satu keranjang sekaligus saat pesanan selesai.
+Angka stok sendiri diikuti lewat listener storage, sama seperti MenuIndex & RollupIndex.
+
+Semua operasi sinkron (tanpa await), jadi atomik di event loop tanpa lock. Buku ini hanya benar jika semua
+kasir satu tenant dilayani satu proses: berlaku untuk polling dan mode webhook (tenant selalu di worker yang sama).
+"""
+import time
+
+
+class TenantStock:
+    """Stok & tahanan satu tenant."""
+
+    def __init__(self, rows):
+        self.stok = {r['id']: r.get('stok') or 0 for r in rows}
+        # menu_id -> total porsi ditahan semua keranjang; holder -> [kedaluwarsa, {menu_id: porsi}]
+        self.held, self.carts = {}, {}
+
+    def reserved(self, holder, menu_id):
+        cart = self.carts.get(holder)
+        return cart[1].get(menu_id, 0) if cart else 0
+
+    def available(self, menu_id, holder=None):
+        """Porsi yang bisa dimiliki `holder` (tahanannya sendiri ikut dihitung), atau sisa bebas jika holder None."""
+        return self.stok.get(menu_id, 0) - self.held.get(menu_id, 0) + self.reserved(holder, menu_id)
+
+    def set_hold(self, holder, menu_id, qty, expires):
+        cart = self.carts.setdefault(holder, [expires, {}]); cart[0] = expires
+        held = self.held.get(menu_id, 0) + qty - cart[1].get(menu_id, 0)
+        if held: self.held[menu_id] = held
+        else: self.held.pop(menu_id, None)
+        if qty > 0: cart[1][menu_id] = qty
+        else: cart[1].pop(menu_id, None)
+        if not cart[1]: del self.carts[holder]
+
+    def release(self, holder):
+        cart = self.carts.pop(holder, None)
+        for menu_id, qty in (cart[1].items() if cart else ()):
+            held = self.held.get(menu_id, 0) - qty
+            if held: self.held[menu_id] = held
+            else: self.held.pop(menu_id, None)
+
+    def drop_item(self, menu_id):
+        self.stok.pop(menu_id, None); self.held.pop(menu_id, None)
+        for holder in [h for h, c in self.carts.items() if c[1].pop(menu_id, None) is not None and not c[1]]: del self.carts[holder]
+
+    def expire(self, now):
+        for holder in [h for h, c in self.carts.items() if c[0] <= now]: self.release(holder)
+
+
+class StockLedger:
+    """Tahanan stok per tenant; `holder` adalah pemilik keranjang (id pengguna Telegram)."""
+
+    def __init__(self, db, ttl=900):
+        self.db, self.ttl, self._tenants = db, ttl, {}
+        db.add_listener(self.on_write)
+
+    def get(self, tenant):
+        stock = self._tenants.get(tenant)
+        if stock is None: stock = self._tenants[tenant] = TenantStock(self.db.list_rows(tenant, 'menu'))
+        if stock.carts: stock.expire(time.monotonic())
+        return stock
+
+    def available(self, tenant, menu_id, holder=None):
+        return self.get(tenant).available(menu_id, holder)
+
+    def hold(self, tenant, holder, menu_id, qty):
+        """Jadikan tahanan `holder` untuk satu menu `qty` porsi; False (tanpa perubahan) jika stok tidak cukup.
+
+        Mengurangi selalu berhasil. Tahanan yang hilang (kedaluwarsa/restart) ikut ditahan ulang saat menambah.
+        """
+        stock = self.get(tenant)
+        if qty > stock.reserved(holder, menu_id) and qty > stock.available(menu_id, holder): return False
+        stock.set_hold(holder, menu_id, max(qty, 0), time.monotonic() + self.ttl); return True
+
+    def release(self, tenant, holder):
+        stock = self._tenants.get(tenant)
+        if stock is not None: stock.release(holder)
+
+    def commit(self, tenant, holder, cart):
+        """Ambil semua porsi `cart` ({menu_id: jumlah}) sekaligus; kembalikan menu_id yang stoknya kurang.
+
+        Jika tidak ada yang kurang, tahanan keranjang dilepas dan pemanggil wajib langsung (tanpa await)
+        mengurangi stok di storage; listener lalu memperbarui angka stok di sini.
+        """
+        stock = self.get(tenant)
+        kurang = [menu_id for menu_id, jumlah in cart.items() if jumlah > stock.available(menu_id, holder)]
+        if not kurang: stock.release(holder)
+        return kurang
+
+    def on_write(self, tenant, collection, op, payload):
+        stock = self._tenants.get(tenant)
+        # Tenant yang masih punya keranjang aktif tidak dibuang, supaya tahanannya tidak hilang.
+        if op == 'evict' and stock is not None and not stock.carts: del self._tenants[tenant]
+        if collection != 'menu' or stock is None: return
+        if op == 'insert':
+            for row in payload: stock.stok[row['id']] = row.get('stok') or 0
+        elif op == 'update' and 'stok' in payload[1]: stock.stok[payload[0]] = payload[1]['stok']
+        elif op == 'delete': stock.drop_item(payload)
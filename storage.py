@@ -0,0 +1,597 @@
+import os
+import gzip
+import json
+import atexit
+import logging
+import sqlite3
+import time
+import tempfile
+import threading
+from datetime import date
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Skema tiap koleksi data tenant: apakah punya `id` per tenant, kolom tanggal (untuk filter periode), kolom-kolomnya,
+# dan apakah bulan yang sudah tutup boleh dipindah ke arsip (lihat JsonBackend.archive_closed_months).
+# Kolom JSON berisi list/dict (disimpan sebagai teks JSON di SQLite). `penjualan` hanya berisi data lama per item;
+# transaksi baru disimpan sebagai `pesanan` (lihat orders.py & migrate_orders.py).
+COLLECTIONS = {
+    "menu": {"id": True, "tanggal": None, "arsip": False, "kolom": [("nama", "TEXT"), ("harga", "INTEGER"), ("stok", "INTEGER"), ("kategori", "TEXT"), ("modal", "INTEGER")]},
+    "penjualan": {"id": False, "tanggal": "tanggal", "arsip": True, "kolom": [("menu_id", "INTEGER"), ("nama_pemesan", "TEXT"), ("nama", "TEXT"), ("harga", "INTEGER"), ("jumlah", "INTEGER"), ("tanggal", "TEXT"), ("waktu", "TEXT"), ("modal", "INTEGER")]},
+    "pesanan": {"id": True, "tanggal": "tanggal", "arsip": True, "kolom": [("nama_pemesan", "TEXT"), ("kasir", "TEXT"), ("tanggal", "TEXT"), ("waktu", "TEXT"), ("subtotal", "INTEGER"), ("layanan", "INTEGER"), ("pajak", "INTEGER"), ("total", "INTEGER"), ("batal", "BOOLEAN"), ("item", "JSON")]},
+    "pengeluaran": {"id": False, "tanggal": "tanggal", "arsip": True, "kolom": [("deskripsi", "TEXT"), ("nominal", "INTEGER"), ("tanggal", "TEXT")]},
+    "kasbon": {"id": True, "tanggal": "tanggal_ambil", "arsip": False, "kolom": [("nama", "TEXT"), ("nominal", "INTEGER"), ("tanggal_ambil", "TEXT"), ("lunas", "BOOLEAN"), ("terbayar", "INTEGER")]},
+    "kasbon_bayar": {"id": False, "tanggal": "tanggal", "arsip": True, "kolom": [("nama", "TEXT"), ("nominal", "INTEGER"), ("tanggal", "TEXT")]},
+}
+# Kunci di file tenant JSON yang mencatat segmen arsip: {koleksi: {"YYYY-MM": {"file", "versi", "baris"[, "id_min", "id_max"]}}}.
+ARCHIVE_KEY = "_arsip"
+
+
+class ArchiveError(Exception):
+    """Verifikasi arsip gagal; file tenant tidak diubah."""
+
+
+def empty_user_data():
+    return {name: [] for name in COLLECTIONS}
+
+
+def safe_tenant_name(username):
+    return "".join(c for c in username if c.isalnum())
+
+
+def get_user_data_path(username, base_dir="."):
+    return os.path.join(base_dir, f"data_{safe_tenant_name(username)}.json")
+
+
+def atomic_write_json(file_path, data):
+    return atomic_write_text(file_path, json.dumps(data, ensure_ascii=False))
+
+
+def atomic_write_text(file_path, payload):
+    return atomic_write_bytes(file_path, payload.encode('utf-8'))
+
+
+def atomic_write_bytes(file_path, payload):
+    """Tulis ke file sementara lalu rename, supaya file lama tidak pernah terpotong."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+    return len(payload)
+
+
+# --- CACHE DATA TENANT (LRU + WRITE-BEHIND) ---
+class TenantCache:
+    """Cache data tenant di memori dengan eviksi LRU dan flush tertunda ke disk.
+
+    Perubahan hanya menandai tenant sebagai "kotor"; thread latar menulisnya ke disk
+    setiap `flush_interval` detik, atau lebih cepat jika jumlah tenant kotor mencapai `max_dirty`.
+    Data tenant hanya boleh diubah di dalam `edit`, karena thread flush menserialisasinya di bawah lock yang sama.
+    """
+
+    def __init__(self, path_fn, max_tenants=64, flush_interval=2.0, max_dirty=16):
+        self.path_fn, self.max_tenants, self.flush_interval, self.max_dirty = path_fn, max_tenants, flush_interval, max_dirty
+        self._data, self._dirty = OrderedDict(), set()
+        self._lock, self._flush_lock = threading.RLock(), threading.Lock()
+        self._wake, self._stop = threading.Event(), threading.Event()
+        self._thread = None
+        self.io_observer = None  # opsional: fn(op, tenant, bytes, detik) untuk instrumentasi
+        self.on_evict = None  # opsional: fn(tenant) setelah data tenant dibuang dari memori
+
+    def _observe(self, op, username, size, started):
+        if self.io_observer is not None: self.io_observer(op, username, size, time.perf_counter() - started)
+
+    def _read_disk(self, username):
+        started = time.perf_counter()
+        try:
+            with open(self.path_fn(username), 'rb') as f: raw = f.read()
+            data = json.loads(raw); self._observe('read', username, len(raw), started); return data
+        except (FileNotFoundError, json.JSONDecodeError):
+            return empty_user_data()
+
+    def get(self, username):
+        with self._lock:
+            if username in self._data:
+                self._data.move_to_end(username); return self._data[username]
+        data = self._read_disk(username)
+        with self._lock:
+            # Thread lain mungkin sudah memuat tenant yang sama selama kita membaca disk.
+            data = self._data.setdefault(username, data); self._data.move_to_end(username); evicted = self._evict()
+        self._evicted(evicted)
+        return data
+
+    def put(self, username, data):
+        with self._lock:
+            self._data[username] = data; self._data.move_to_end(username); self._dirty.add(username)
+            dirty_count = len(self._dirty); evicted = self._evict()
+        self._evicted(evicted)
+        if self.flush_interval <= 0: self.flush(username); return
+        self._ensure_thread()
+        if dirty_count >= self.max_dirty: self._wake.set()
+
+    @contextmanager
+    def edit(self, username):
+        """Ubah data tenant di dalam blok ini (di bawah lock cache), lalu tandai kotor."""
+        data = self.get(username)
+        with self._lock: yield data
+        self.put(username, data)
+
+    def _evict(self):
+        evicted = []
+        while len(self._data) > self.max_tenants:
+            victim = next((u for u in self._data if u not in self._dirty), None)
+            if victim is None: break  # semua kotor, tunggu flush berikutnya
+            del self._data[victim]; evicted.append(victim)
+        return evicted
+
+    def _evicted(self, evicted):
+        # Dipanggil di luar lock dan hanya dari thread pemanggil get/put (event loop), bukan thread flush.
+        for username in evicted:
+            if self.on_evict is not None: self.on_evict(username)
+
+    def flush(self, username=None):
+        with self._flush_lock: self._flush(username)
+
+    def _flush(self, username):
+        with self._lock:
+            targets = [username] if username is not None else list(self._dirty)
+            snapshots, failed = [], []
+            for u in targets:
+                if u not in self._dirty: continue
+                self._dirty.discard(u)
+                # Serialisasi di dalam lock: semua perubahan lewat `edit`, jadi data tidak berubah di tengah jalan.
+                try: snapshots.append((u, json.dumps(self._data[u], ensure_ascii=False)))
+                except Exception as e: logger.error(f"Gagal menserialisasi data tenant {u}: {e}"); failed.append(u)
+            self._dirty.update(failed)
+        for u, payload in snapshots:
+            started = time.perf_counter()
+            try: self._observe('write', u, atomic_write_text(self.path_fn(u), payload), started)
+            except Exception as e:
+                logger.error(f"Gagal menyimpan data tenant {u}: {e}")
+                with self._lock: self._dirty.add(u)
+        if threading.current_thread() is self._thread: return  # eviksi (dan listener-nya) hanya di thread pemanggil
+        with self._lock: evicted = self._evict()
+        self._evicted(evicted)
+
+    def _ensure_thread(self):
+        if self._thread is not None or self.flush_interval <= 0: return
+        with self._lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name="tenant-flush", daemon=True); self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval); self._wake.clear()
+            # Tenant yang gagal tetap ditandai kotor dan dicoba lagi; thread ini tidak boleh mati.
+            try: self.flush()
+            except Exception as e: logger.error(f"Flush data tenant gagal: {e}")
+
+    def close(self):
+        """Hentikan thread flush dan pastikan semua perubahan tertulis ke disk."""
+        self._stop.set(); self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread(): self._thread.join(timeout=10)
+        self.flush()
+
+
+# --- INTERFACE PENYIMPANAN ---
+class StorageBackend:
+    """Antarmuka penyimpanan yang dipakai semua handler.
+
+    Baris yang dikembalikan `list_rows`/`get_row` hanya untuk dibaca; perubahan harus lewat
+    `insert_rows`, `update_row`, `increment` atau `delete_row`. Setiap perubahan yang berhasil
+    diteruskan ke listener (lihat `add_listener`) supaya indeks turunan bisa diperbarui secara inkremental.
+    """
+
+    def __init__(self):
+        self._listeners = []
+
+    def add_listener(self, fn):
+        """Daftarkan `fn(tenant, collection, op, payload)`; op: insert (daftar baris), update (id, fields, baris sebelum diubah),
+        delete (id), atau evict (collection & payload None: tenant lama tidak dipakai dan datanya dibuang dari memori,
+        indeks turunan tenant itu sebaiknya ikut dibuang)."""
+        self._listeners.append(fn)
+
+    def _notify(self, tenant, collection, op, payload):
+        for fn in self._listeners:
+            try: fn(tenant, collection, op, payload)
+            except Exception as e: logger.error(f"Listener penyimpanan gagal ({collection}/{op}): {e}")
+
+    # Registry pengguna (username -> hash password)
+    def get_user_hash(self, username): raise NotImplementedError
+    def set_user(self, username, password_hash): raise NotImplementedError
+    def get_users(self): raise NotImplementedError
+
+    # Data per tenant
+    def create_tenant(self, tenant): raise NotImplementedError
+    def list_rows(self, tenant, collection, tanggal=None, **equals): raise NotImplementedError
+    def get_row(self, tenant, collection, row_id): raise NotImplementedError
+    def insert_rows(self, tenant, collection, rows): raise NotImplementedError
+    def update_row(self, tenant, collection, row_id, **fields): raise NotImplementedError
+    def increment(self, tenant, collection, row_id, field, delta): raise NotImplementedError
+    def delete_row(self, tenant, collection, row_id): raise NotImplementedError
+    def migrate_rows(self, tenant, source, target, rows): raise NotImplementedError
+    def load_tenant(self, tenant): raise NotImplementedError
+
+    def archive_closed_months(self, tenant, keep_months=3, today=None):
+        """Pindahkan bulan lama ke arsip; backend yang sudah membaca per rentang (SQLite) tidak perlu melakukan apa-apa."""
+        return {}
+
+    async def commit(self, tenant):
+        """Ditunggu di akhir setiap blok tulis, masih di dalam lock tenant. Backend bawaan menulis langsung jadi tidak
+        ada yang ditunggu; backend yang menunda tulis (mis. transaksi async) menyelesaikannya di sini."""
+
+    def flush(self): pass
+    def close(self): pass
+
+
+def _matches(row, collection, tanggal, equals):
+    if tanggal is not None and not row.get(COLLECTIONS[collection]["tanggal"], "").startswith(tanggal): return False
+    return all(row.get(k) == v for k, v in equals.items())
+
+
+def collection_totals(rows, collection):
+    """Per bulan: jumlah baris dan total tiap kolom INTEGER; dipakai untuk memverifikasi arsip."""
+    spec = COLLECTIONS[collection]; numeric = [c for c, t in spec["kolom"] if t == "INTEGER"]; totals = {}
+    for row in rows:
+        month = totals.setdefault(row.get(spec["tanggal"], "")[:7], [0] * (len(numeric) + 1)); month[0] += 1
+        for n, col in enumerate(numeric, 1): month[n] += row.get(col) or 0
+    return totals
+
+
+def _sql_type(typ):
+    return {"BOOLEAN": "INTEGER", "JSON": "TEXT"}.get(typ, typ)
+
+
+def _month_shift(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class JsonBackend(StorageBackend):
+    """Satu file `data_<tenant>.json` per tenant plus `users.json`, di-cache lewat TenantCache.
+
+    Bulan yang sudah tutup bisa dipindah dari file tenant ke segmen arsip `arsip/<tenant>/<koleksi>-YYYY-MM.<versi>.json.gz`
+    (lihat `archive_closed_months`). Segmen tidak pernah diubah; `list_rows` dengan filter tanggal hanya membuka
+    segmen bulan yang cocok, dan segmen yang baru dibaca disimpan di LRU kecil (`segment_cache`).
+    """
+
+    def __init__(self, base_dir=".", users_file="users.json", archive_dir="arsip", segment_cache=8, **cache_options):
+        super().__init__(); self.base_dir, self.users_path = base_dir, os.path.join(base_dir, users_file)
+        self.archive_dir, self.segment_cache = os.path.join(base_dir, archive_dir), segment_cache
+        self.cache = TenantCache(lambda u: get_user_data_path(u, base_dir), **cache_options)
+        self._segments, self._segment_lock = OrderedDict(), threading.Lock()
+        # Indeks id -> baris per (tenant, koleksi) untuk data di file tenant; dibangun ulang jika list-nya diganti.
+        self._ids = OrderedDict()
+        self.cache.on_evict = self._on_evict
+
+    def _on_evict(self, tenant):
+        for key in [k for k in self._ids if k[0] == tenant]: del self._ids[key]
+        with self._segment_lock:
+            for key in [k for k in self._segments if k[0] == tenant]: del self._segments[key]
+        self._notify(tenant, None, 'evict', None)
+
+    def get_users(self):
+        try:
+            with open(self.users_path, 'r') as f: return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get_user_hash(self, username):
+        return self.get_users().get(username)
+
+    def set_user(self, username, password_hash):
+        users = self.get_users(); users[username] = password_hash; atomic_write_json(self.users_path, users)
+
+    def _collection(self, tenant, collection):
+        return self.cache.get(tenant).get(collection, [])  # hanya baca; koleksi baru dibuat di dalam `cache.edit`
+
+    def create_tenant(self, tenant):
+        self.cache.put(tenant, empty_user_data())
+
+    def load_tenant(self, tenant):
+        return {name: self.list_rows(tenant, name) for name in COLLECTIONS}
+
+    # --- Segmen arsip ---
+    def _segment_path(self, tenant, file_name):
+        return os.path.join(self.archive_dir, safe_tenant_name(tenant), file_name)
+
+    def _archived(self, tenant, collection):
+        return self.cache.get(tenant).get(ARCHIVE_KEY, {}).get(collection, {})
+
+    def _read_segment(self, tenant, file_name, keep=True):
+        key = (tenant, file_name)
+        with self._segment_lock:
+            if key in self._segments: self._segments.move_to_end(key); return self._segments[key]
+        started = time.perf_counter()
+        with open(self._segment_path(tenant, file_name), 'rb') as f: raw = f.read()
+        rows = json.loads(gzip.decompress(raw)); self.cache._observe('read_arsip', tenant, len(raw), started)
+        if keep and self.segment_cache > 0:
+            with self._segment_lock:
+                self._segments[key] = rows
+                while len(self._segments) > self.segment_cache: self._segments.popitem(last=False)
+        return rows
+
+    def list_rows(self, tenant, collection, tanggal=None, **equals):
+        rows = []
+        for month, info in sorted(self._archived(tenant, collection).items()):
+            # Filter bisa berupa tahun, bulan, atau tanggal; segmen dibuka hanya jika bulannya bisa cocok.
+            if tanggal is not None and not (month.startswith(tanggal) or tanggal.startswith(month)): continue
+            rows += [r for r in self._read_segment(tenant, info['file'], keep=tanggal is not None) if _matches(r, collection, tanggal, equals)]
+        return rows + [r for r in self._collection(tenant, collection) if _matches(r, collection, tanggal, equals)]
+
+    def archive_closed_months(self, tenant, keep_months=3, today=None):
+        """Pindahkan baris bulan yang lebih lama dari `keep_months` bulan terakhir ke segmen arsip gzip.
+
+        Total per bulan (jumlah baris & kolom angka) dari arsip baru + sisa data dicocokkan dengan total sebelum
+        pemadatan; jika berbeda, file tenant dibiarkan apa adanya dan ArchiveError dilempar. Manifest segmen ikut
+        tersimpan di file tenant, jadi segmen baru baru "terlihat" setelah file tenant tertulis. Pemanggil harus
+        memegang lock tenant. Mengembalikan {koleksi: [bulan, ...]} yang diarsipkan.
+        """
+        cutoff = _month_shift(today or date.today(), -(keep_months - 1)); data = self.cache.get(tenant)
+        directory = os.path.join(self.archive_dir, safe_tenant_name(tenant)); staged, written = {}, []
+        try:
+            for collection, spec in COLLECTIONS.items():
+                if not spec["arsip"]: continue
+                old, keep = {}, []
+                for row in data.get(collection, []):
+                    month = row.get(spec["tanggal"], "")[:7]
+                    if month and month < cutoff: old.setdefault(month, []).append(row)
+                    else: keep.append(row)
+                if not old: continue
+                before, entries = collection_totals(self.list_rows(tenant, collection), collection), dict(self._archived(tenant, collection))
+                os.makedirs(directory, exist_ok=True)
+                for month, rows in sorted(old.items()):
+                    previous = entries.get(month)  # baris susulan untuk bulan yang sudah diarsip: gabung ke versi baru
+                    if previous: rows = self._read_segment(tenant, previous['file'], keep=False) + rows
+                    version = previous['versi'] + 1 if previous else 1; file_name = f"{collection}-{month}.{version}.json.gz"
+                    started = time.perf_counter(); size = atomic_write_bytes(os.path.join(directory, file_name), gzip.compress(json.dumps(rows, ensure_ascii=False).encode('utf-8')))
+                    self.cache._observe('write_arsip', tenant, size, started); written.append(file_name)
+                    entries[month] = {'file': file_name, 'versi': version, 'baris': len(rows)}
+                    if spec["id"]: entries[month].update(id_min=min(r['id'] for r in rows), id_max=max(r['id'] for r in rows))
+                # Verifikasi dari disk: segmen yang baru ditulis + baris yang tetap di file tenant harus sama dengan sebelumnya.
+                after_rows = [r for m in sorted(entries) for r in self._read_segment(tenant, entries[m]['file'], keep=False)] + keep
+                after = collection_totals(after_rows, collection)
+                selisih = sorted(m for m in set(before) | set(after) if before.get(m) != after.get(m))
+                if selisih: raise ArchiveError(f"Total {collection} tenant {tenant} berbeda setelah diarsip (bulan: {', '.join(selisih)})")
+                staged[collection] = (keep, entries, sorted(old))
+        except BaseException:
+            for file_name in written:
+                if os.path.exists(os.path.join(directory, file_name)): os.remove(os.path.join(directory, file_name))
+            raise
+        if not staged: return {}
+        with self.cache.edit(tenant) as data:
+            manifest = data.setdefault(ARCHIVE_KEY, {})
+            for collection, (keep, entries, _) in staged.items(): data[collection] = keep; manifest[collection] = entries
+        self.cache.flush(tenant)
+        with self._segment_lock:
+            for key in [k for k in self._segments if k[0] == tenant]: del self._segments[key]
+        if tenant not in self.cache._dirty:
+            # File tenant sudah menunjuk ke segmen baru; versi lama & sisa pemadatan yang gagal aman dihapus.
+            referenced = {e['file'] for entries in manifest.values() for e in entries.values()}
+            for file_name in os.listdir(directory):
+                if file_name.endswith(".json.gz") and file_name not in referenced: os.remove(os.path.join(directory, file_name))
+        return {collection: months for collection, (_, _, months) in staged.items()}
+
+    def _id_index(self, tenant, collection):
+        items, key = self._collection(tenant, collection), (tenant, collection); cached = self._ids.get(key)
+        if cached is None or cached[0] is not items or len(cached[1]) != len(items):
+            cached = self._ids[key] = (items, {r.get('id'): r for r in items})
+            while len(self._ids) > 4 * self.cache.max_tenants: self._ids.popitem(last=False)
+        else: self._ids.move_to_end(key)
+        return cached[1]
+
+    def get_row(self, tenant, collection, row_id):
+        """Baris dengan `row_id`; jika sudah diarsip, dicari di segmen yang rentang id-nya memuat `row_id` (hanya baca)."""
+        row = self._id_index(tenant, collection).get(row_id)
+        if row is not None or not COLLECTIONS[collection]["arsip"]: return row
+        for month, info in sorted(self._archived(tenant, collection).items(), reverse=True):
+            if info.get('id_min', 0) <= row_id <= info.get('id_max', -1):
+                row = next((r for r in self._read_segment(tenant, info['file']) if r.get('id') == row_id), None)
+                if row is not None: return dict(row)
+        return None
+
+    def _next_id(self, tenant, collection, items):
+        # Id terbesar di arsip ikut dihitung, supaya id tidak terpakai ulang setelah semua baris lama diarsip.
+        archived = [info.get('id_max', 0) for info in self._archived(tenant, collection).values()]
+        return max([r.get('id', 0) for r in items] + archived + [0]) + 1
+
+    def _append_rows(self, tenant, collection, items, rows):
+        next_id = self._next_id(tenant, collection, items) if COLLECTIONS[collection]["id"] else None
+        index, inserted = self._ids.get((tenant, collection)), []
+        for row in rows:
+            row = dict(row)
+            if next_id is not None and 'id' not in row: row['id'] = next_id; next_id += 1
+            items.append(row); inserted.append(row)
+            if index is not None and index[0] is items: index[1][row.get('id')] = row
+        return inserted
+
+    def insert_rows(self, tenant, collection, rows):
+        with self.cache.edit(tenant) as data: inserted = self._append_rows(tenant, collection, data.setdefault(collection, []), rows)
+        self._notify(tenant, collection, 'insert', inserted); return inserted
+
+    def migrate_rows(self, tenant, source, target, rows):
+        """Kosongkan koleksi `source` (termasuk arsipnya) dan sisipkan `rows` ke `target` dalam satu tulis file tenant."""
+        with self.cache.edit(tenant) as data:
+            data[source] = []; data.get(ARCHIVE_KEY, {}).pop(source, None)
+            inserted = self._append_rows(tenant, target, data.setdefault(target, []), rows)
+        self.cache.flush(tenant); self._notify(tenant, target, 'insert', inserted); return inserted
+
+    def update_row(self, tenant, collection, row_id, **fields):
+        row = self._id_index(tenant, collection).get(row_id)
+        if row is None: return False
+        before = dict(row)
+        with self.cache.edit(tenant): row.update(fields)
+        self._notify(tenant, collection, 'update', (row_id, fields, before)); return True
+
+    def increment(self, tenant, collection, row_id, field, delta):
+        row = self._id_index(tenant, collection).get(row_id)
+        if row is None: return False
+        return self.update_row(tenant, collection, row_id, **{field: row.get(field, 0) + delta})
+
+    def delete_row(self, tenant, collection, row_id):
+        if self._id_index(tenant, collection).get(row_id) is None: return False
+        with self.cache.edit(tenant) as data: data[collection] = [r for r in data.setdefault(collection, []) if r.get('id') != row_id]
+        self._notify(tenant, collection, 'delete', row_id); return True
+
+    def flush(self): self.cache.flush()
+    def close(self): self.cache.close()
+
+
+class SqliteBackend(StorageBackend):
+    """Satu database SQLite (mode WAL) untuk semua tenant; satu tabel per koleksi dengan indeks tenant & tanggal.
+
+    Data tidak di-cache di sini, tapi indeks turunan per tenant (rollup, menu, stok, analitik) tetap di memori; tenant
+    yang paling lama tidak dibaca di atas `max_tenants` diumumkan lewat listener `evict` seperti di JsonBackend.
+    """
+
+    def __init__(self, path="kasir.db", max_tenants=64):
+        super().__init__(); self.path, self._lock = path, threading.RLock()
+        self.max_tenants, self._active = max_tenants, OrderedDict()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL"); self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Worker webhook berbagi file ini. Transaksi tulis memakai BEGIN IMMEDIATE: transaksi biasa yang membaca dulu
+        # (mis. MAX(id)) gagal langsung dengan "database is locked" jika proses lain menulis di antaranya, tanpa menunggu timeout.
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password_hash TEXT NOT NULL)")
+            for name, spec in COLLECTIONS.items():
+                columns = ", ".join(f"{col} {_sql_type(typ)}" for col, typ in spec["kolom"])
+                if spec["id"]: self.conn.execute(f"CREATE TABLE IF NOT EXISTS {name} (tenant TEXT NOT NULL, id INTEGER NOT NULL, {columns}, PRIMARY KEY (tenant, id))")
+                else: self.conn.execute(f"CREATE TABLE IF NOT EXISTS {name} (tenant TEXT NOT NULL, {columns})")
+                # Database lama: tambahkan kolom yang belum ada (mis. setelah skema bertambah).
+                existing = {r[1] for r in self.conn.execute(f"PRAGMA table_info({name})")}
+                for col, typ in spec["kolom"]:
+                    if col not in existing: self.conn.execute(f"ALTER TABLE {name} ADD COLUMN {col} {_sql_type(typ)}")
+                if spec["tanggal"]: self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_tenant_tanggal ON {name} (tenant, {spec['tanggal']})")
+                elif not spec["id"]: self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_tenant ON {name} (tenant)")
+
+    def _to_dict(self, collection, row):
+        data = dict(row); data.pop('tenant', None)
+        for col, typ in COLLECTIONS[collection]["kolom"]:
+            if data.get(col) is None: continue
+            if typ == "BOOLEAN": data[col] = bool(data[col])
+            elif typ == "JSON": data[col] = json.loads(data[col])
+        return data
+
+    def _to_sql(self, collection, values):
+        types = dict(COLLECTIONS[collection]["kolom"])
+        return {col: json.dumps(v, ensure_ascii=False) if types.get(col) == "JSON" and v is not None else v for col, v in values.items()}
+
+    def get_users(self):
+        with self._lock: return {r['username']: r['password_hash'] for r in self.conn.execute("SELECT username, password_hash FROM users")}
+
+    def get_user_hash(self, username):
+        with self._lock: row = self.conn.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+        return row['password_hash'] if row else None
+
+    def set_user(self, username, password_hash):
+        with self._lock: self.conn.execute("INSERT OR REPLACE INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
+
+    def create_tenant(self, tenant):
+        pass  # tabel dibagi semua tenant, tidak ada yang perlu dibuat
+
+    def delete_tenant(self, tenant):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for name in COLLECTIONS: self.conn.execute(f"DELETE FROM {name} WHERE tenant = ?", (tenant,))
+            self.conn.execute("COMMIT")
+
+    def load_tenant(self, tenant):
+        return {name: self.list_rows(tenant, name) for name in COLLECTIONS}
+
+    def _touch(self, tenant):
+        with self._lock:
+            self._active[tenant] = True; self._active.move_to_end(tenant); evicted = []
+            while len(self._active) > self.max_tenants: evicted.append(self._active.popitem(last=False)[0])
+        for victim in evicted: self._notify(victim, None, 'evict', None)
+
+    def list_rows(self, tenant, collection, tanggal=None, **equals):
+        self._touch(tenant); spec, sql, params = COLLECTIONS[collection], f"SELECT * FROM {collection} WHERE tenant = ?", [tenant]
+        if tanggal is not None:
+            # Rentang string setara dengan LIKE 'prefix%' tapi tetap memakai indeks (tenant, tanggal).
+            sql += f" AND {spec['tanggal']} >= ? AND {spec['tanggal']} < ?"; params += [tanggal, tanggal + "\uffff"]
+        for col, value in equals.items(): sql += f" AND {self._column(collection, col)} = ?"; params.append(value)
+        sql += " ORDER BY id" if spec["id"] else " ORDER BY rowid"
+        with self._lock: return [self._to_dict(collection, r) for r in self.conn.execute(sql, params)]
+
+    def get_row(self, tenant, collection, row_id):
+        self._touch(tenant)
+        with self._lock: row = self.conn.execute(f"SELECT * FROM {collection} WHERE tenant = ? AND id = ?", (tenant, row_id)).fetchone()
+        return self._to_dict(collection, row) if row else None
+
+    def _column(self, collection, col):
+        if col != 'id' and col not in {c for c, _ in COLLECTIONS[collection]["kolom"]}: raise KeyError(f"Kolom '{col}' tidak ada di {collection}")
+        return col
+
+    def _insert(self, tenant, collection, rows):
+        spec = COLLECTIONS[collection]; columns = (["id"] if spec["id"] else []) + [c for c, _ in spec["kolom"]]
+        sql = f"INSERT INTO {collection} (tenant, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})"
+        next_id, inserted = None, []
+        if spec["id"]: next_id = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {collection} WHERE tenant = ?", (tenant,)).fetchone()[0]
+        for row in rows:
+            row = dict(row)
+            if spec["id"] and 'id' not in row: row['id'] = next_id
+            if spec["id"]: next_id = max(next_id, row['id']) + 1
+            values = self._to_sql(collection, row); self.conn.execute(sql, [tenant] + [values.get(c) for c in columns]); inserted.append(row)
+        return inserted
+
+    def insert_rows(self, tenant, collection, rows):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try: inserted = self._insert(tenant, collection, rows); self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK"); raise
+        self._notify(tenant, collection, 'insert', inserted); return inserted
+
+    def migrate_rows(self, tenant, source, target, rows):
+        """Hapus semua baris `source` tenant dan sisipkan `rows` ke `target` dalam satu transaksi."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try: self.conn.execute(f"DELETE FROM {source} WHERE tenant = ?", (tenant,)); inserted = self._insert(tenant, target, rows); self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK"); raise
+        self._notify(tenant, target, 'insert', inserted); return inserted
+
+    def update_row(self, tenant, collection, row_id, **fields):
+        if not fields: return self.get_row(tenant, collection, row_id) is not None
+        assignments = ", ".join(f"{self._column(collection, col)} = ?" for col in fields)
+        with self._lock:
+            before = self.conn.execute(f"SELECT * FROM {collection} WHERE tenant = ? AND id = ?", (tenant, row_id)).fetchone()
+            if before is None: return False
+            self.conn.execute(f"UPDATE {collection} SET {assignments} WHERE tenant = ? AND id = ?", list(self._to_sql(collection, fields).values()) + [tenant, row_id])
+        self._notify(tenant, collection, 'update', (row_id, fields, self._to_dict(collection, before))); return True
+
+    def increment(self, tenant, collection, row_id, field, delta):
+        col = self._column(collection, field)
+        with self._lock:
+            before = self.conn.execute(f"SELECT * FROM {collection} WHERE tenant = ? AND id = ?", (tenant, row_id)).fetchone()
+            if before is None: return False
+            self.conn.execute(f"UPDATE {collection} SET {col} = COALESCE({col}, 0) + ? WHERE tenant = ? AND id = ?", (delta, tenant, row_id))
+            value = self.conn.execute(f"SELECT {col} FROM {collection} WHERE tenant = ? AND id = ?", (tenant, row_id)).fetchone()[0]
+        self._notify(tenant, collection, 'update', (row_id, {field: value}, self._to_dict(collection, before))); return True
+
+    def delete_row(self, tenant, collection, row_id):
+        with self._lock: cursor = self.conn.execute(f"DELETE FROM {collection} WHERE tenant = ? AND id = ?", (tenant, row_id))
+        if cursor.rowcount > 0: self._notify(tenant, collection, 'delete', row_id)
+        return cursor.rowcount > 0
+
+    def close(self):
+        with self._lock: self.conn.close()
+
+
+def open_storage(kind="json", **options):
+    """Buat backend penyimpanan sesuai konfigurasi (`json` atau `sqlite`)."""
+    if kind == "sqlite": return SqliteBackend(options.get("sqlite_path", "kasir.db"), options.get("cache_options", {}).get("max_tenants", 64))
+    if kind == "json": return JsonBackend(options.get("base_dir", "."), **options.get("cache_options", {}))
+    raise ValueError(f"Backend penyimpanan tidak dikenal: {kind}")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Modul bot ada di akar repo (bukan paket), jadi akar repo dimasukkan ke sys.path.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: menjalankan main.py sungguhan (lewati dengan -m 'not slow')")
@@ -0,0 +1,71 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from bench import FakeBot, FakeUpdate, make_context
+from orders import sales_rows
+from storage import JsonBackend
+
+CASHIERS, ORDERS_PER_CASHIER, TENANT = 6, 5, "warung"
+
+
+class DeferredBackend(JsonBackend):
+    """Backend yang menunda tulis seperti transaksi async: `increment` dihitung dari nilai saat dibaca, tapi baru
+    diterapkan di `commit`, setelah event loop sempat menjalankan handler lain (yield di dalam critical section)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs); self._pending = {}
+
+    def increment(self, tenant, collection, row_id, field, delta):
+        row = self.get_row(tenant, collection, row_id)
+        if row is None: return False
+        self._pending.setdefault(asyncio.current_task(), []).append((tenant, collection, row_id, {field: row.get(field, 0) + delta})); return True
+
+    async def commit(self, tenant):
+        pending = self._pending.pop(asyncio.current_task(), [])
+        await asyncio.sleep(0)
+        for tenant, collection, row_id, fields in pending: self.update_row(tenant, collection, row_id, **fields)
+
+
+async def _no_receipt(*args, **kwargs):
+    return True
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    import main
+    monkeypatch.setattr(main, 'REPORT_CACHE_DIR', str(tmp_path / 'report_cache'))
+    monkeypatch.setattr(main, 'send_receipt', _no_receipt)  # PDF nota tidak relevan untuk uji lost write
+    main.setup_services(DeferredBackend(str(tmp_path)))
+    yield main
+    main.close_services()
+
+
+def _run_orders(main):
+    fake, item = FakeBot(), main.db.insert_rows(TENANT, 'menu', [{'nama': 'Es Teh', 'harga': 5000, 'stok': 1000, 'kategori': None}])[0]
+
+    async def cashier(n):
+        for _ in range(ORDERS_PER_CASHIER):
+            context = make_context(fake, TENANT); context.user_data.update({'customer_name': f"Kasir {n}", 'cart': {item['id']: 1}})
+            await main.order_finish(FakeUpdate(fake, 100 + n, data="order_finish"), context)
+
+    async def scenario():
+        await asyncio.gather(*(cashier(n) for n in range(CASHIERS)))
+
+    asyncio.run(scenario())
+    sold = sum(r['jumlah'] for r in sales_rows(main.db, TENANT) if r['menu_id'] == item['id'])
+    return sold, 1000 - main.db.get_row(TENANT, 'menu', item['id'])['stok']
+
+
+def test_parallel_orders_lose_no_writes(bot):
+    sold, stock_drop = _run_orders(bot)
+    assert sold == stock_drop == CASHIERS * ORDERS_PER_CASHIER
+
+
+def test_without_tenant_lock_stock_decrements_are_lost(bot, monkeypatch):
+    # Kontrol negatif: tanpa lock, handler lain membaca stok lama di antara baca dan commit.
+    monkeypatch.setattr(bot, 'tenant_lock', lambda key: contextlib.nullcontext())
+    sold, stock_drop = _run_orders(bot)
+    assert sold == CASHIERS * ORDERS_PER_CASHIER
+    assert stock_drop < sold
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import pytest
+
+import migrate_orders
+from orders import build_order, sales_rows
+from report_cache import ReportCache
+from rollup import RollupIndex
+from storage import JsonBackend, SqliteBackend
+
+SHOP = {'tax': 10, 'service': 5}
+MENU = {1: {'nama': 'Kopi', 'harga': 8000, 'modal': 3000}, 2: {'nama': 'Roti', 'harga': 5000, 'modal': None}}
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def db(request, tmp_path):
+    backend = JsonBackend(str(tmp_path)) if request.param == 'json' else SqliteBackend(str(tmp_path / 'kasir.db'))
+    yield backend
+    backend.close()
+
+
+def _order(day, cart):
+    return build_order(cart, MENU, 'Budi', 'warung', SHOP, datetime.fromisoformat(f"{day}T12:00:00"))
+
+
+def test_void_updates_rollup_and_only_that_month(db, tmp_path):
+    rollups, cache = RollupIndex(db), ReportCache(db, directory=str(tmp_path / 'cache'))
+    lama, baru = db.insert_rows('warung', 'pesanan', [_order('2026-08-10', {1: 2}), _order('2026-09-03', {1: 1, 2: 1})])
+    rollup = rollups.get('warung')
+    for month in ('2026-08', '2026-09'): cache.put('warung', month, cache.version('warung', month), f"%PDF-{month}".encode())
+
+    db.update_row('warung', 'pesanan', lama['id'], batal=True)
+    assert rollups.get('warung') is rollup  # diperbarui inkremental, bukan dibangun ulang
+    assert rollup.bulan('2026-08') == (0, 0) and rollup.bulan('2026-09') == (13000, 0)
+    assert rollups.verify('warung') == []
+    assert cache.get('warung', '2026-08') is None
+    assert cache.get('warung', '2026-09') == b"%PDF-2026-09"
+
+
+def test_update_payload_carries_row_before_change(db):
+    seen = []; db.add_listener(lambda tenant, collection, op, payload: op == 'update' and seen.append(payload))
+    menu = db.insert_rows('warung', 'menu', [{'nama': 'Kopi', 'harga': 8000, 'stok': 5, 'kategori': None}])[0]
+    db.increment('warung', 'menu', menu['id'], 'stok', -2); db.update_row('warung', 'menu', menu['id'], harga=9000)
+    assert [(p[0], p[1], p[2]['stok'], p[2]['harga']) for p in seen] == [(menu['id'], {'stok': 3}, 5, 8000), (menu['id'], {'harga': 9000}, 3, 8000)]
+
+
+def _legacy(db):
+    rows = [{'menu_id': 1, 'nama_pemesan': 'Budi', 'nama': 'Kopi', 'harga': 8000, 'jumlah': 2, 'tanggal': '2026-08-10', 'waktu': '09:00:00'},
+            {'menu_id': 2, 'nama_pemesan': 'Budi', 'nama': 'Roti', 'harga': 5000, 'jumlah': 1, 'tanggal': '2026-08-10', 'waktu': '09:00:00'},
+            {'menu_id': 1, 'nama_pemesan': 'Sari', 'nama': 'Kopi', 'harga': 8000, 'jumlah': 1, 'tanggal': '2026-09-01', 'waktu': None}]
+    db.insert_rows('warung', 'penjualan', rows)
+
+
+def test_migrate_keeps_monthly_totals(db):
+    _legacy(db); before = migrate_orders.monthly_totals(db, 'warung')
+    migrate_orders.migrate(db, ['warung'], keep_months=0)
+    assert db.list_rows('warung', 'penjualan') == [] and len(db.list_rows('warung', 'pesanan')) == 2
+    assert migrate_orders.monthly_totals(db, 'warung') == before
+
+
+def test_migrate_aborts_before_writing_on_mismatch(db, monkeypatch):
+    _legacy(db); rows = sales_rows(db, 'warung')
+    convert = migrate_orders.order_from_legacy
+    monkeypatch.setattr(migrate_orders, 'order_from_legacy', lambda group, shop: {**convert(group, shop), 'item': convert(group, shop)['item'][:1]})
+    with pytest.raises(migrate_orders.TotalsMismatch): migrate_orders.migrate(db, ['warung'], keep_months=0)
+    assert sales_rows(db, 'warung') == rows and db.list_rows('warung', 'pesanan') == []
@@ -0,0 +1,112 @@
+import time
+import asyncio
+from datetime import timedelta
+
+import pytest
+from telegram.error import RetryAfter
+
+from outbox import OutboundQueue
+
+
+def _queue(**kwargs):
+    return OutboundQueue(**{'chat_rate': 1000, 'chat_burst': 100, 'group_rate': 1000, 'global_rate': 1000, **kwargs})
+
+
+class FakeApi:
+    """Callback palsu: mencatat (method, chat, teks, waktu); `flood` = jumlah RetryAfter sebelum berhasil."""
+
+    def __init__(self, flood=0, retry_after=0.05):
+        self.calls, self.flood, self.retry_after, self.gate = [], flood, retry_after, None
+
+    def callback(self, endpoint, chat_id, text):
+        async def call():
+            if self.gate is not None: await self.gate.wait()
+            self.calls.append((endpoint, chat_id, text, time.monotonic()))
+            if self.flood > 0: self.flood -= 1; raise RetryAfter(timedelta(seconds=self.retry_after))
+            return text
+        return call
+
+    def send(self, queue, endpoint, chat_id, text, message_id=None):
+        data = {'chat_id': chat_id, 'text': text} if message_id is None else {'chat_id': chat_id, 'message_id': message_id, 'text': text}
+        if chat_id is None: data = {}  # answerCallbackQuery & method lain tanpa chat
+        return asyncio.ensure_future(queue.process_request(self.callback(endpoint, chat_id, text), (), {}, endpoint, data, None))
+
+
+def test_requests_to_one_chat_keep_their_order():
+    async def scenario():
+        queue, api = _queue(), FakeApi()
+        results = await asyncio.gather(*(api.send(queue, 'sendMessage', chat, f"{chat}-{n}") for n in range(5) for chat in (1, 2)))
+        await queue.shutdown()
+        return api, results
+
+    api, results = asyncio.run(scenario())
+    for chat in (1, 2): assert [c[2] for c in api.calls if c[1] == chat] == [f"{chat}-{n}" for n in range(5)]
+    assert results == [f"{chat}-{n}" for n in range(5) for chat in (1, 2)]
+
+
+def test_queued_edits_to_one_message_are_merged():
+    async def scenario():
+        queue, api = _queue(), FakeApi(); api.gate = asyncio.Event()
+        first = api.send(queue, 'sendMessage', 1, "keranjang"); await asyncio.sleep(0.01)  # drain chat 1 tertahan di sini
+        edits = [api.send(queue, 'editMessageText', 1, f"total {n}", message_id=7) for n in range(5)]
+        markup = api.send(queue, 'editMessageReplyMarkup', 1, "tombol", message_id=7)
+        await asyncio.sleep(0); api.gate.set()
+        results = await asyncio.gather(first, *edits, markup); await queue.shutdown()
+        return api, results
+
+    api, results = asyncio.run(scenario())
+    assert [(c[0], c[2]) for c in api.calls] == [('sendMessage', "keranjang"), ('editMessageText', "total 4"), ('editMessageReplyMarkup', "tombol")]
+    assert results == ["keranjang"] + ["total 4"] * 5 + ["tombol"]
+
+
+def test_retry_after_pauses_every_chat():
+    async def scenario():
+        queue, api = _queue(), FakeApi(flood=1)
+        flooded = api.send(queue, 'sendMessage', 1, "a"); await asyncio.sleep(0.005)
+        other = api.send(queue, 'sendMessage', 2, "b")
+        await asyncio.gather(flooded, other); await queue.shutdown()
+        return api
+
+    api = asyncio.run(scenario())
+    flood_at, retried_at = [c[3] for c in api.calls if c[1] == 1]
+    sent_b = [c[3] for c in api.calls if c[1] == 2][0]
+    assert sent_b - flood_at >= 0.05 and retried_at - flood_at >= 0.05  # chat 2 ikut menunggu jeda global
+
+
+def test_requests_without_chat_wait_for_flood_pause():
+    async def scenario():
+        queue, api = _queue(), FakeApi(flood=1)
+        flooded = api.send(queue, 'sendMessage', 1, "a"); await asyncio.sleep(0.005)
+        answer = api.send(queue, 'answerCallbackQuery', None, "ok")
+        await asyncio.gather(flooded, answer); await queue.shutdown()
+        return api
+
+    api = asyncio.run(scenario())
+    flood_at = [c[3] for c in api.calls if c[1] == 1][0]
+    answered_at = [c[3] for c in api.calls if c[0] == 'answerCallbackQuery'][0]
+    assert answered_at - flood_at >= 0.05
+
+
+def test_retry_takes_a_fresh_global_token():
+    async def scenario():
+        # Global 10/detik: setelah jeda, kirim ulang chat 1 & kiriman chat 2 yang antre tidak boleh keluar bersamaan.
+        queue, api = _queue(global_rate=10), FakeApi(flood=1)
+        flooded = api.send(queue, 'sendMessage', 1, "a"); await asyncio.sleep(0.005)
+        other = api.send(queue, 'sendMessage', 2, "b")
+        await asyncio.gather(flooded, other); await queue.shutdown()
+        return api
+
+    api = asyncio.run(scenario())
+    retried_at = [c[3] for c in api.calls if c[1] == 1][1]
+    sent_b = [c[3] for c in api.calls if c[1] == 2][0]
+    assert abs(retried_at - sent_b) >= 0.08
+
+
+def test_retry_limit_is_honoured():
+    async def scenario():
+        queue, api = _queue(max_retries=2), FakeApi(flood=10, retry_after=0.01)
+        with pytest.raises(RetryAfter): await api.send(queue, 'sendMessage', 1, "a")
+        await queue.shutdown()
+        return api
+
+    assert len(asyncio.run(scenario()).calls) == 3
@@ -0,0 +1,47 @@
+import time
+import asyncio
+
+import pytest
+
+from render_pool import RenderPool, RenderQueueFull
+
+
+def test_priority_jumps_waiting_renders():
+    async def scenario():
+        pool, done = RenderPool(size=1, max_queue=10), []
+
+        async def job(name, priority=False):
+            await pool.render(time.sleep, 0.02, priority=priority); done.append(name)
+
+        tasks = [asyncio.create_task(job(f"biasa{i}")) for i in range(3)]
+        await asyncio.sleep(0.005); tasks.append(asyncio.create_task(job("nota", priority=True)))
+        await asyncio.gather(*tasks); pool.close()
+        return done, pool
+
+    done, pool = asyncio.run(scenario())
+    assert done == ["biasa0", "nota", "biasa1", "biasa2"]
+    assert pool.pending == 0 and pool._free == 1
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        pool = RenderPool(size=1, max_queue=10)
+        first = asyncio.create_task(pool.render(time.sleep, 0.02)); await asyncio.sleep(0.005)
+        waiting = asyncio.create_task(pool.render(time.sleep, 0.02)); await asyncio.sleep(0)
+        waiting.cancel(); await first
+        with pytest.raises(asyncio.CancelledError): await waiting
+        await pool.render(time.sleep, 0); pool.close()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.pending == 0 and pool._free == 1
+
+
+def test_queue_full_rejects_only_normal_requests():
+    async def scenario():
+        pool = RenderPool(size=1, max_queue=0)
+        busy = asyncio.create_task(pool.render(time.sleep, 0.02)); await asyncio.sleep(0.005)
+        with pytest.raises(RenderQueueFull): await pool.render(time.sleep, 0)
+        await pool.render(time.sleep, 0, priority=True); await busy; pool.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,47 @@
+import os
+
+from storage import JsonBackend
+from report_cache import ReportCache
+
+
+def _expense(nominal):
+    return {'deskripsi': 'gas', 'nominal': nominal, 'tanggal': '2026-09-03'}
+
+
+def test_disk_cache_survives_restart_when_data_unchanged(tmp_path):
+    db = JsonBackend(str(tmp_path), flush_interval=0); db.insert_rows('budi', 'pengeluaran', [_expense(5000)])
+    cache = ReportCache(db, directory=str(tmp_path / 'cache'))
+    assert cache.put('budi', '2026-09', cache.version('budi', '2026-09'), b'%PDF-1')
+
+    restarted = ReportCache(db, directory=str(tmp_path / 'cache'))
+    assert restarted.get('budi', '2026-09') == b'%PDF-1'
+
+
+def test_disk_cache_dropped_after_out_of_process_change(tmp_path):
+    db = JsonBackend(str(tmp_path), flush_interval=0); db.insert_rows('budi', 'pengeluaran', [_expense(5000)])
+    cache = ReportCache(db, directory=str(tmp_path / 'cache'))
+    cache.put('budi', '2026-09', cache.version('budi', '2026-09'), b'%PDF-1'); db.close()
+
+    # Skrip lain (mis. migrasi) mengubah data saat bot mati, tanpa listener cache.
+    script = JsonBackend(str(tmp_path), flush_interval=0); script.insert_rows('budi', 'pengeluaran', [_expense(7000)]); script.close()
+
+    db = JsonBackend(str(tmp_path), flush_interval=0); restarted = ReportCache(db, directory=str(tmp_path / 'cache'))
+    assert restarted.get('budi', '2026-09') is None
+    assert os.listdir(tmp_path / 'cache') == []
+
+
+def test_legacy_file_names_are_removed(tmp_path):
+    (tmp_path / 'cache').mkdir(); (tmp_path / 'cache' / 'budi__2026-09.pdf').write_bytes(b'%PDF-lama')
+    cache = ReportCache(JsonBackend(str(tmp_path), flush_interval=0), directory=str(tmp_path / 'cache'))
+    assert cache.get('budi', '2026-09') is None
+    assert os.listdir(tmp_path / 'cache') == []
+
+
+def test_write_in_process_replaces_file(tmp_path):
+    db = JsonBackend(str(tmp_path), flush_interval=0); db.insert_rows('budi', 'pengeluaran', [_expense(5000)])
+    cache = ReportCache(db, directory=str(tmp_path / 'cache'))
+    cache.put('budi', '2026-09', cache.version('budi', '2026-09'), b'%PDF-1')
+    db.insert_rows('budi', 'pengeluaran', [_expense(7000)])
+    assert cache.get('budi', '2026-09') is None and os.listdir(tmp_path / 'cache') == []
+    cache.put('budi', '2026-09', cache.version('budi', '2026-09'), b'%PDF-2')
+    assert len(os.listdir(tmp_path / 'cache')) == 1
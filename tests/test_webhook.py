@@ -0,0 +1,117 @@
+import os
+import time
+import random
+import shutil
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import ClientSession
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import bench
+
+from sessions import SessionPersistence, RouteStore
+from webhook import Dispatcher, create_app, shard_for
+
+SECRET = "rahasia"
+
+
+def _stub_worker(index, workers, inbox, outbox):
+    """Worker tiruan: mencatat setiap update yang diproses, dan meniru login/logout lewat teks pesan."""
+    outbox.put(('ready', index, None, index))
+    with open(os.path.join(os.environ['KASIR_TEST_LOG'], f"w{index}.log"), 'a') as log:
+        while (envelope := inbox.get()) is not None:
+            update_id, tenant, data = envelope; text = data['message']['text']
+            if text.startswith('/login '): tenant = text.split()[1]
+            elif text == '/logout': tenant = None
+            log.write(f"{update_id}\n"); log.flush()
+            outbox.put(('done', update_id, tenant, index))
+
+
+def _message(update_id, user, text):
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': text, 'from': {'id': user, 'is_bot': False, 'first_name': 'Kasir'}, 'chat': {'id': user, 'type': 'private'}}}
+
+
+def test_each_update_processed_once_by_its_route_worker(tmp_path, monkeypatch):
+    monkeypatch.setenv('KASIR_TEST_LOG', str(tmp_path))
+    workers, users, script = 3, range(101, 111), ['/start', '/login {toko}', 'jual', 'jual', '/logout', 'halo']
+    updates, expected, routes = [], {}, {}
+    for step, text in enumerate(script):
+        for user in users:
+            update_id = len(updates) + 1; text_now = text.format(toko=f"toko{user % 3}")
+            updates.append(_message(update_id, user, text_now)); expected[update_id] = shard_for(routes.get(user) or user, workers)
+            if text_now.startswith('/login '): routes[user] = text_now.split()[1]
+            elif text_now == '/logout': routes.pop(user)
+    assert len(set(expected.values())) > 1
+    dispatcher = Dispatcher(workers, sessions_path=str(tmp_path / 'sessions.db'), target=_stub_worker)
+
+    async def scenario():
+        async with TestClient(TestServer(create_app(dispatcher, "/telegram", SECRET))) as client:
+            assert (await client.post("/telegram", json=updates[0])).status == 403
+            for data in updates: assert (await client.post("/telegram", json=data, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})).status == 200
+            deadline = time.monotonic() + 30
+            while dispatcher.done < len(updates) and time.monotonic() < deadline: await asyncio.sleep(0.01)
+            return await (await client.get("/status")).json()
+
+    status = asyncio.run(scenario())
+    assert status['diterima'] == status['selesai'] == len(updates)
+    assert status['per_worker'] == status['selesai_per_worker']
+    processed = {}
+    for index in range(workers):
+        path = tmp_path / f"w{index}.log"
+        for line in (path.read_text().split() if path.exists() else []): processed.setdefault(int(line), []).append(index)
+    assert processed == {update_id: [worker] for update_id, worker in expected.items()}
+    store = RouteStore(str(tmp_path / 'sessions.db')); assert store.load() == {}; store.close()
+
+
+def test_session_follows_user_between_workers(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+
+    async def scenario():
+        lama, baru = SessionPersistence(path), SessionPersistence(path)
+        data = {}; await lama.refresh_user_data(7, data); data.update(username='toko', cart={1: 2})
+        await lama.release_user_data(7, data)
+        await lama.update_user_data(7, {'basi': True})  # flush berkala setelah dilepas tidak menimpa sesi
+        pindah = {}; await baru.refresh_user_data(7, pindah); dimuat = dict(pindah)
+        pindah['cart'] = {1: 3}; await baru.release_user_data(7, pindah)
+        await lama.refresh_user_data(7, data)
+        return dimuat, data
+
+    dimuat, kembali = asyncio.run(scenario())
+    assert dimuat == {'username': 'toko', 'cart': {1: 2}}
+    assert kembali == {'username': 'toko', 'cart': {1: 3}}
+
+
+def test_legacy_worker_scopes_are_merged(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+
+    async def scenario():
+        lama = SessionPersistence(path, scope="w1"); data = {}
+        await lama.refresh_user_data(7, data); data['username'] = 'toko'; await lama.update_user_data(7, data)
+        sesi = {}; await SessionPersistence(path).refresh_user_data(7, sesi)
+        return sesi
+
+    assert asyncio.run(scenario()) == {'username': 'toko'}
+
+
+@pytest.mark.slow
+def test_replay_against_fake_api_scales_with_workers():
+    """Rekaman update sintetis diputar ke main.py mode webhook melawan Bot API tiruan, 1 lalu 2 worker."""
+    args = SimpleNamespace(tenants=8, cashiers=2, orders_per_cashier=10, items_per_order=3, menu=20, sales="200", expenses=10, kasbon=5, days=30, password="rahasia", seed=42, replay_db=None, outbound_queue=False)
+    updates = bench.synthesize_updates(args.tenants, args.cashiers, args.orders_per_cashier, args.items_per_order, args.menu, args.password, random.Random(args.seed))
+    expected_sales = args.tenants * args.cashiers * args.orders_per_cashier * args.items_per_order
+
+    async def scenario():
+        api = bench.FakeTelegramApi(); api_url = await api.start()
+        try:
+            async with ClientSession() as session: return [await bench.run_webhook_case(args, session, api, api_url, updates, workers, expected_sales) for workers in (1, 2)]
+        finally: await api.stop()
+
+    runs = asyncio.run(scenario())
+    for result in runs: assert result['recorded_sales'] == expected_sales and sum(result['per_worker']) == len(updates), result  # workdir berisi bot.log
+    assert all(runs[1]['per_worker'])
+    for result in runs: shutil.rmtree(result['workdir'], ignore_errors=True)
+    if (os.cpu_count() or 1) < 2: pytest.skip("penjualan cocok; perbandingan throughput butuh >= 2 CPU")
+    assert runs[1]['updates_per_second'] >= 1.3 * runs[0]['updates_per_second'], runs
@@ -0,0 +1,196 @@
+"""Mode webhook: satu proses depan (aiohttp) menerima update Telegram lalu membaginya ke N proses worker.
+
+Pembagian deterministik: update dari pengguna yang sudah login dikirim ke worker milik tenant-nya
+(crc32(tenant) % N), pengguna yang belum login ke worker crc32(user_id) % N. Dengan begitu semua
+kasir satu tenant dilayani worker yang sama (lock tenant, rollup & cache menu tetap konsisten).
+
+Proses depan memegang tabel rute user -> tenant. Setiap update membawa tenant terakhir yang tercatat;
+worker memasang `username` di `user_data` sesuai rute itu sebelum handler jalan, lalu membalas dengan
+tenant setelah handler selesai (berubah saat login/register/logout). Update satu pengguna diteruskan
+berurutan (menunggu balasan worker), jadi rute selalu mutakhir; pengguna berbeda tetap paralel.
+
+Sesi (sessions.py) dikunci per pengguna dan dipakai bersama semua worker. Jika rute seorang pengguna pindah
+ke worker lain, worker lama menyimpan sesinya sebelum membalas, jadi worker baru membaca sesi terbaru.
+"""
+import sys
+import json
+import zlib
+import asyncio
+import logging
+import importlib
+import threading
+import multiprocessing
+from urllib.parse import urlsplit
+
+from aiohttp import web
+from telegram import Bot, Update
+from telegram.ext import TypeHandler
+
+from sessions import RouteStore
+from concurrency import KeyedLocks
+
+logger = logging.getLogger(__name__)
+
+ACK_TIMEOUT = 120  # detik menunggu worker menyelesaikan satu update sebelum rute dianggap tidak berubah
+
+
+def shard_for(key, workers):
+    """Nomor worker untuk `key` (tenant atau user id); stabil antar proses & restart, tidak seperti hash()."""
+    return zlib.crc32(str(key).encode('utf-8')) % workers
+
+
+def route_key(data):
+    """Id pengirim update mentah (sama dengan kunci `user_data`), atau id chat jika tidak ada pengirim."""
+    for name, value in data.items():
+        if name == 'update_id' or not isinstance(value, dict): continue
+        sender = value.get('from') or value.get('user') or value.get('chat')
+        if isinstance(sender, dict) and 'id' in sender: return sender['id']
+    return None
+
+
+# --- WORKER ---
+def _bot_module():
+    # Lewat `python main.py`, proses spawn sudah memuat main.py sebagai __mp_main__; jangan diimpor dua kali.
+    module = sys.modules.get('__mp_main__')
+    return module if hasattr(module, 'build_application') else importlib.import_module('main')
+
+
+def _run_worker(index, workers, inbox, outbox):
+    asyncio.run(_worker(index, workers, inbox, outbox))
+
+
+async def _worker(index, workers, inbox, outbox):
+    bot = _bot_module(); bot.setup_services()
+    application, tenants = bot.build_application(polling=False), {}
+
+    async def adopt_route(update, context):
+        tenant = tenants.pop(update.update_id, None)
+        if context.user_data is None: return
+        if tenant: context.user_data['username'] = tenant
+        else: context.user_data.pop('username', None)
+
+    async def handle(update_id, tenant, data):
+        update = Update.de_json(data, application.bot); tenants[update_id] = tenant
+        try: await application.update_processor.process_update(update, application.process_update(update))
+        except Exception as e: logger.error(f"Worker {index} gagal memproses update {update_id}: {e}")
+        finally:
+            user = update.effective_user; tenant_after = application.user_data.get(user.id, {}).get('username') if user else tenant
+            if user and application.persistence and shard_for(tenant_after or user.id, workers) != index:
+                try: await application.persistence.release_user_data(user.id, application.user_data[user.id])
+                except Exception as e: logger.error(f"Worker {index} gagal menyimpan sesi pengguna {user.id}: {e}")
+            outbox.put(('done', update_id, tenant_after, index))
+
+    application.add_handler(TypeHandler(Update, adopt_route), group=-1)
+    bot.start_exporters(f"{bot.METRICS_FILE}.{index}" if bot.METRICS_FILE else None, port=bot.METRICS_PORT + index if bot.METRICS_PORT else 0)
+    await application.initialize()
+    if application.post_init: await application.post_init(application)
+    await application.start(); outbox.put(('ready', index, None, index))
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            envelope = await loop.run_in_executor(None, inbox.get)
+            if envelope is None: break
+            application.create_task(handle(*envelope))
+    finally:
+        await application.stop(); await application.shutdown(); bot.close_services()
+
+
+# --- PROSES DEPAN ---
+class Dispatcher:
+    """Terima update dari Telegram, teruskan ke worker sesuai rute, dan catat perubahan rute dari balasan worker."""
+
+    def __init__(self, workers, record_file=None, sessions_path=None, target=_run_worker):
+        context = multiprocessing.get_context("spawn")
+        self.inboxes, self.outbox = [context.Queue() for _ in range(workers)], context.Queue()
+        # `target(index, workers, inbox, outbox)` menjalankan satu worker; membalas ('ready'|'done', kunci, tenant, index).
+        self.processes = [context.Process(target=target, args=(n, workers, self.inboxes[n], self.outbox), name=f"kasir-worker-{n}", daemon=True) for n in range(workers)]
+        # Rute disimpan bersama sesi, supaya setelah restart kasir yang masih login langsung ke worker tenant-nya.
+        self.route_store = RouteStore(sessions_path) if sessions_path else None
+        self.routes, self.locks, self.pending = self.route_store.load() if self.route_store else {}, KeyedLocks(), {}
+        self.received, self.done, self.per_worker, self.acked_by = 0, 0, [0] * workers, [0] * workers
+        self.record = open(record_file, 'ab') if record_file else None
+        self._ready = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop(); self._ready = {n: loop.create_future() for n in range(len(self.processes))}
+        for process in self.processes: process.start()
+        threading.Thread(target=self._read_outbox, args=(loop,), name="webhook-acks", daemon=True).start()
+        await asyncio.gather(*self._ready.values())
+        logger.info(f"{len(self.processes)} worker siap.")
+
+    def _read_outbox(self, loop):
+        while True:
+            message = self.outbox.get()
+            if message is None: return
+            loop.call_soon_threadsafe(self._resolve, *message)
+
+    def _resolve(self, kind, key, tenant, worker):
+        future = (self._ready if kind == 'ready' else self.pending).pop(key, None)
+        if kind == 'done': self.acked_by[worker] += 1
+        if future is not None and not future.done(): future.set_result(tenant)
+
+    def accept(self, raw, data):
+        if self.record is not None: self.record.write(raw.rstrip(b"\n") + b"\n"); self.record.flush()
+        self.received += 1; asyncio.get_running_loop().create_task(self.dispatch(data))
+
+    async def dispatch(self, data):
+        user = route_key(data)
+        async with self.locks(user):
+            tenant = self.routes.get(user); shard = shard_for(tenant if tenant else user, len(self.processes))
+            future = self.pending[data['update_id']] = asyncio.get_running_loop().create_future()
+            self.inboxes[shard].put((data['update_id'], tenant, data)); self.per_worker[shard] += 1
+            try: tenant_after = await asyncio.wait_for(future, ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.pending.pop(data['update_id'], None); logger.error(f"Worker {shard} tidak membalas update {data['update_id']}."); return
+            finally: self.done += 1
+            if user is None or tenant_after == tenant: return
+            if tenant_after: self.routes[user] = tenant_after
+            else: self.routes.pop(user, None)
+            if self.route_store is not None: self.route_store.set(user, tenant_after)
+
+    def status(self):
+        return {'workers': len(self.processes), 'hidup': sum(p.is_alive() for p in self.processes), 'diterima': self.received, 'selesai': self.done, 'antre': self.received - self.done, 'per_worker': list(self.per_worker), 'selesai_per_worker': list(self.acked_by), 'rute': len(self.routes)}
+
+    def stop(self):
+        for inbox in self.inboxes: inbox.put(None)
+        for process in self.processes: process.join(timeout=15)
+        self.outbox.put(None)
+        if self.record is not None: self.record.close()
+        if self.route_store is not None: self.route_store.close()
+
+
+def create_app(dispatcher, url_path="/", secret="", on_started=None):
+    """Aplikasi aiohttp proses depan: POST `url_path` menerima update, GET /status. Worker dijalankan saat app mulai."""
+
+    async def receive(request):
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret: return web.Response(status=403)
+        raw = await request.read()
+        try: data = json.loads(raw)
+        except ValueError: return web.Response(status=400)
+        if not isinstance(data, dict) or 'update_id' not in data: return web.Response(status=400)
+        dispatcher.accept(raw, data); return web.Response()
+
+    async def status(request):
+        return web.json_response(dispatcher.status())
+
+    async def on_startup(app):
+        await dispatcher.start()
+        if on_started is not None: await on_started()
+
+    async def on_cleanup(app):
+        await asyncio.get_running_loop().run_in_executor(None, dispatcher.stop)
+
+    app = web.Application(); app.router.add_post(url_path, receive); app.router.add_get("/status", status)
+    app.on_startup.append(on_startup); app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def serve(token, webhook_url, listen="0.0.0.0", port=8443, secret="", workers=1, api_url="https://api.telegram.org/bot", record_file="", sessions_path=""):
+    """Jalankan proses depan webhook sampai dihentikan (Ctrl+C / SIGTERM)."""
+    dispatcher, url_path = Dispatcher(workers, record_file or None, sessions_path or None), urlsplit(webhook_url).path or "/"
+
+    async def register_webhook():
+        async with Bot(token, base_url=api_url) as bot: await bot.set_webhook(webhook_url, secret_token=secret or None, allowed_updates=Update.ALL_TYPES)
+        logger.info(f"Webhook terdaftar: {webhook_url} (path {url_path})")
+
+    web.run_app(create_app(dispatcher, url_path, secret, register_webhook), host=listen, port=port, print=None, access_log=None)